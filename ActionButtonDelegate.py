@@ -0,0 +1,55 @@
+from PyQt6.QtCore import Qt, QEvent, pyqtSignal
+from PyQt6.QtWidgets import QStyledItemDelegate, QStyleOptionButton, QStyle, QApplication
+
+class ActionButtonDelegate(QStyledItemDelegate):
+    """
+    在表格模型的操作列（DataFrameTableModel 的 action_column）画按钮，点击时发出 clicked(行)
+    按钮只是画出来的，不是 QPushButton：不管表格有多少行，都只有这一个对象
+    其他列照常显示
+    """
+    clicked = pyqtSignal(int)
+
+    def __init__(self, text: str, parent=None):
+        super().__init__(parent)
+        self.text = text
+
+    @staticmethod
+    def is_action_column(index) -> bool:
+        model = index.model()
+        if getattr(model, 'action_column', None) is None or index.column() != model.columnCount() - 1:
+            return False
+
+        # 小计行没有按钮
+        return model.source_row(index.row()) is not None
+
+    def paint(self, painter, option, index):
+        if not self.is_action_column(index):
+            super().paint(painter, option, index)
+            return
+
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(2, 2, -2, -2)
+        button.text = self.text
+        button.state = QStyle.StateFlag.State_Enabled | QStyle.StateFlag.State_Raised
+
+        style = option.widget.style() if option.widget is not None else QApplication.style()
+        style.drawControl(QStyle.ControlElement.CE_PushButton, button, painter, option.widget)
+
+    def sizeHint(self, option, index):
+        size = super().sizeHint(option, index)
+        if self.is_action_column(index):
+            size.setWidth(option.fontMetrics.horizontalAdvance(self.text) + 24)
+
+        return size
+
+    def editorEvent(self, event, model, option, index) -> bool:
+        if not self.is_action_column(index):
+            return super().editorEvent(event, model, option, index)
+
+        # 操作列上的点击都由按钮处理，不改变选中的行
+        if event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton:
+            if option.rect.contains(event.position().toPoint()):
+                self.clicked.emit(index.row())
+            return True
+
+        return event.type() in (QEvent.Type.MouseButtonPress, QEvent.Type.MouseButtonDblClick)
@@ -0,0 +1,169 @@
+import threading
+import time
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+from PyQt6.QtWidgets import QWidget, QHBoxLayout, QLabel, QProgressBar, QPushButton
+
+from CancelToken import CancelToken
+
+from errors import OperationCancelledError
+
+class TaskSignals(QObject):
+    """
+    后台操作发给界面的信号（QRunnable 不能发信号，另外用一个 QObject）
+    在主线程创建，后台线程发出的信号会排队到主线程处理
+    """
+    progress = pyqtSignal(str, int, int) # (阶段, 已完成, 总数)
+    cells_changed = pyqtSignal(object)   # 逐行出来的结果 {列名: {行索引: 值}}
+    finished = pyqtSignal(object)        # function 的返回值
+    failed = pyqtSignal(str)             # 出错信息
+    cancelled = pyqtSignal()
+
+class BackgroundTask(QRunnable):
+    """
+    在线程池里运行的耗时操作：function(task) 在后台线程运行，只把结果通过信号交回界面
+    - function 里用 task.progress(阶段, 已完成, 总数) 报进度，用 task.check_cancelled() 在检查点响应取消
+    - 逐行出来的结果用 task.report_cells(列名, {行索引: 值}) 先发给界面显示，不用等整个操作完成
+    - function 里不要碰界面，也不要改窗口的数据，改好的数据作为返回值交给 on_finished 在主线程更新
+    """
+    # 进度信号最多每 0.05 秒发一次，逐行报进度时界面不会被信号淹没
+    PROGRESS_INTERVAL = 0.05
+    # 逐行的结果攒起来，最多每 0.2 秒发一次
+    CELLS_INTERVAL = 0.2
+
+    def __init__(self, name: str, function, on_finished=None):
+        super().__init__()
+        self.setAutoDelete(False) # 窗口持有这个对象，运行完不让 Qt 删除
+
+        self.name = name
+        self.function = function
+        self.on_finished = on_finished
+        self.signals = TaskSignals()
+        self.cancel_token = CancelToken()
+
+        self.last_progress = (None, 0.0) # (阶段, 时间)
+
+        self.lock = threading.Lock() # report_cells 可能在多个线程里调用
+        self.pending_cells = {}      # 还没发给界面的结果 {列名: {行索引: 值}}
+        self.last_cells_time = 0.0
+
+    def progress(self, stage: str, done: int, total: int):
+        now = time.perf_counter()
+        last_stage, last_time = self.last_progress
+        if stage == last_stage and 0 < done < total and now - last_time < self.PROGRESS_INTERVAL:
+            return
+
+        self.last_progress = (stage, now)
+        self.signals.progress.emit(stage, done, total)
+
+    def check_cancelled(self):
+        self.cancel_token.raise_if_cancelled()
+
+    def report_cells(self, column: str, values: dict):
+        now = time.perf_counter()
+        with self.lock:
+            self.pending_cells.setdefault(column, {}).update(values)
+            if now - self.last_cells_time < self.CELLS_INTERVAL:
+                return
+            self.last_cells_time = now
+
+        self.flush_cells()
+
+    def flush_cells(self):
+        with self.lock:
+            cells, self.pending_cells = self.pending_cells, {}
+        if cells:
+            self.signals.cells_changed.emit(cells)
+
+    def run(self):
+        try:
+            result = self.function(self)
+        except OperationCancelledError:
+            self.flush_cells()
+            self.signals.cancelled.emit()
+            return
+        except Exception as e:
+            self.flush_cells()
+            self.signals.failed.emit(str(e))
+            return
+
+        self.flush_cells()
+        self.signals.finished.emit(result)
+
+def format_seconds(seconds: float) -> str:
+    seconds = round(seconds)
+    if seconds < 60:
+        return f"{seconds} 秒"
+
+    return f"{seconds // 60} 分 {seconds % 60} 秒"
+
+class TaskProgressBar(QWidget):
+    """
+    状态栏里显示正在运行的后台操作：阶段、进度、预计剩余时间，和取消按钮
+    """
+    def __init__(self):
+        super().__init__()
+
+        self.label = QLabel()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.cancel_button = QPushButton("取消")
+        self.cancel_button.clicked.connect(self.cancel)
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.label)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.cancel_button)
+        self.setLayout(layout)
+
+        self.task = None
+        # 预计剩余时间按这一段进度（同一个总数）开始以来的速度估算
+        self.series = None # (总数, 开始时间)
+        self.last_done = 0
+        self.hide()
+
+    def start(self, task: BackgroundTask):
+        self.task = task
+        self.series = None
+        self.last_done = 0
+
+        self.label.setText(task.name)
+        self.progress_bar.setRange(0, 0) # 还没有进度时来回滚动
+        self.cancel_button.setEnabled(True)
+        self.show()
+
+    def update_progress(self, stage: str, done: int, total: int):
+        if self.task is None:
+            return
+
+        now = time.perf_counter()
+        if self.series is None or self.series[0] != total or done < self.last_done:
+            self.series = (total, now)
+        self.last_done = done
+
+        if total <= 0:
+            self.progress_bar.setRange(0, 0)
+            self.label.setText(f"{self.task.name}：{stage}")
+            return
+
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+        text = f"{self.task.name}：{stage} {done}/{total}（{done * 100 // total}%）"
+        elapsed = now - self.series[1]
+        if 0 < done < total and elapsed > 0:
+            text += f"，预计还要 {format_seconds(elapsed / done * (total - done))}"
+        self.label.setText(text)
+
+    def cancel(self):
+        if self.task is None:
+            return
+
+        self.task.cancel_token.cancel()
+        self.cancel_button.setEnabled(False)
+        self.label.setText(f"{self.task.name}：正在取消…")
+
+    def finish(self):
+        self.task = None
+        self.hide()
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+
+from constants import (
+    CPK_WATCH_POLL_INTERVAL,
+    CPK_WATCH_MAX_BACKOFF,
+    CPK_WATCH_FULL_SCAN_EVERY,
+)
+
+class CPKWatcher:
+    """
+    轮询监控各型号的 CPK 文件夹（共享盘 SMB 上没有 inotify，只能轮询）
+    先比较文件夹修改时间，有变化才重新读文件列表（文件名 + 修改时间 + 大小），
+    找出新增/修改/删除的文件后调用 on_change({型号: {文件名, ...}})
+    某个文件夹连不上时只有这个文件夹延长轮询间隔（逐次翻倍），其他文件夹照常轮询、报变化
+    """
+    def __init__(
+        self,
+        paths: dict[str, str],
+        on_change,
+        poll_interval: float = CPK_WATCH_POLL_INTERVAL,
+        max_backoff: float = CPK_WATCH_MAX_BACKOFF,
+        full_scan_every: int = CPK_WATCH_FULL_SCAN_EVERY,
+    ):
+        self.paths = paths # {型号: CPK路径}
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.full_scan_every = full_scan_every
+
+        self.dir_mtimes = {}
+        self.listings = {} # {路径: {文件名: (修改时间, 大小)}}
+        self.backoffs = {} # 连不上的文件夹 {路径: (轮询间隔, 下次轮询的时间)}
+        self.num_polls = 0
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.is_running():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="CPKWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        # 第一次轮询只建立基准，不报变化
+        self.poll_once()
+
+        while not self._stop_event.wait(self.poll_interval):
+            changes = self.poll_once()
+            if changes:
+                self.on_change(changes)
+
+    def poll_once(self) -> dict[str, set[str]]:
+        """
+        轮询一次所有 CPK 文件夹，返回有变化的文件 {型号: {文件名, ...}}
+        第一次看到的文件夹只记录基准
+        """
+        full_scan = self.num_polls % self.full_scan_every == 0
+        self.num_polls += 1
+
+        changes = {}
+        for model_code, path in self.paths.items():
+            interval, retry_at = self.backoffs.get(path, (self.poll_interval, 0))
+            if time.monotonic() < retry_at:
+                continue
+
+            try:
+                dir_mtime = os.stat(path).st_mtime
+                if not full_scan and self.dir_mtimes.get(path) == dir_mtime:
+                    self.backoffs.pop(path, None)
+                    continue
+                listing = self.list_directory(path)
+            except OSError as e:
+                # 共享盘连不上：这个文件夹保留上次的文件列表，逐次延长轮询间隔
+                interval = min(interval * 2, self.max_backoff)
+                self.backoffs[path] = (interval, time.monotonic() + interval)
+                print(f"CPK 文件夹监控出错，{interval} 秒后重试 {path}: {e}")
+                continue
+
+            self.backoffs.pop(path, None)
+            previous = self.listings.get(path)
+            self.dir_mtimes[path] = dir_mtime
+            self.listings[path] = listing
+
+            if previous is None:
+                continue
+
+            changed_files = {
+                name for name in listing.keys() | previous.keys()
+                if listing.get(name) != previous.get(name)
+            }
+            if changed_files:
+                changes[model_code] = changed_files
+
+        return changes
+
+    def list_directory(self, path: str) -> dict[str, tuple[float, int]]:
+        # scandir 在 Windows 共享盘上读列表时已经带了文件属性，不需要逐个 stat
+        listing = {}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    listing[entry.name] = (stat.st_mtime, stat.st_size)
+
+        return listing
@@ -0,0 +1,21 @@
+import threading
+
+from errors import OperationCancelledError
+
+class CancelToken:
+    """
+    取消标记：界面上点取消时 cancel()，后台运行的操作在检查点调用 raise_if_cancelled() 停下来
+    可以跨线程使用
+    """
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    def is_cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled():
+            raise OperationCancelledError()
@@ -0,0 +1,150 @@
+import hashlib
+
+import pandas as pd
+
+from errors import RuleSpecError
+
+from constants import (
+    MODEL_CODE_MAPPINGS,
+    CHEMICAL_COMPOSITION_LIMITS_PATH,
+    POINT_ALIASES_PATH,
+    SAMPLE_TYPES,
+    TestGroup,
+)
+
+class ConformanceRules:
+    """
+    判定规则：启动时读一次规则数据（成分上下限、报告点位、点位替代、成分样品类型），检查格式后编译成
+    - 成分上下限 数组，一次判断整张表
+    - 每个型号的报告点位行 [(检测项目, 项目详细, 点位, 替代点位), ...]
+    - 点位替代 查找表 {(检测项目, 点位): 替代点位}
+    version 是规则数据的哈希，规则数据有改动时会变
+    """
+    def __init__(
+        self,
+        df_composition_limits: pd.DataFrame,
+        point_requirements: dict[str, pd.DataFrame],
+        df_point_aliases: pd.DataFrame,
+        sample_types: list[str],
+        version: str = '',
+    ):
+        self.validate_composition_limits(df_composition_limits)
+        for path, df in point_requirements.items():
+            self.validate_point_requirements(df, path)
+        self.validate_point_aliases(df_point_aliases)
+
+        self.df_composition_limits = df_composition_limits
+        self.composition_elements = df_composition_limits['成分'].tolist()
+        self.composition_lower = df_composition_limits['下限'].to_numpy(dtype=float)
+        self.composition_upper = df_composition_limits['上限'].to_numpy(dtype=float)
+
+        self.sample_types = list(sample_types)
+
+        self.point_aliases = {
+            (row['检测项目'], row['点位']): row['替代点位']
+            for _, row in df_point_aliases.iterrows()
+        }
+
+        # 同一个点位文件只编译一次，多个型号共用，填报告时直接遍历
+        compiled_rows = {path: self.compile_point_rows(df) for path, df in point_requirements.items()}
+        self.model_point_rows = {
+            model_code: compiled_rows[mapping['性能']['requirements']]
+            for model_code, mapping in MODEL_CODE_MAPPINGS.items()
+        }
+
+        self.version = version
+
+    @classmethod
+    def load(cls) -> 'ConformanceRules':
+        """
+        读取 规则数据 文件
+        """
+        spec_paths = [CHEMICAL_COMPOSITION_LIMITS_PATH, POINT_ALIASES_PATH]
+
+        df_composition_limits = pd.read_csv(CHEMICAL_COMPOSITION_LIMITS_PATH)
+
+        point_requirements = {}
+        for mapping in MODEL_CODE_MAPPINGS.values():
+            path = mapping['性能']['requirements']
+            if path not in point_requirements:
+                point_requirements[path] = pd.read_csv(path)
+                spec_paths.append(path)
+
+        df_point_aliases = pd.read_csv(POINT_ALIASES_PATH)
+
+        # 规则版本：所有规则文件内容 + 成分样品类型
+        digest = hashlib.sha1()
+        for path in spec_paths:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        digest.update(','.join(SAMPLE_TYPES).encode())
+
+        return cls(df_composition_limits, point_requirements, df_point_aliases, SAMPLE_TYPES, digest.hexdigest()[:12])
+
+    def validate_composition_limits(self, df: pd.DataFrame):
+        missing = {'成分', '上限', '下限'} - set(df.columns)
+        if missing:
+            raise RuleSpecError(f"成分元素条件缺少列：{'、'.join(sorted(missing))}")
+
+        duplicated = df['成分'][df['成分'].duplicated()].tolist()
+        if duplicated:
+            raise RuleSpecError(f"成分元素条件有重复的成分：{'、'.join(duplicated)}")
+
+        try:
+            lower = df['下限'].astype(float)
+            upper = df['上限'].astype(float)
+        except ValueError as e:
+            raise RuleSpecError(f"成分元素条件的上下限不是数字：{e}")
+
+        invalid = df['成分'][lower.isna() | upper.isna() | (lower > upper)].tolist()
+        if invalid:
+            raise RuleSpecError(f"成分元素条件的上下限有误：{'、'.join(invalid)}")
+
+    def validate_point_requirements(self, df: pd.DataFrame, path: str):
+        missing = {'检测项目', '项目详细', '点位'} - set(df.columns)
+        if missing:
+            raise RuleSpecError(f"{path} 缺少列：{'、'.join(sorted(missing))}")
+
+        unknown = set(df['检测项目']) - {tg.value for tg in TestGroup}
+        if unknown:
+            raise RuleSpecError(f"{path} 有未知的检测项目：{'、'.join(sorted(unknown))}")
+
+    def validate_point_aliases(self, df: pd.DataFrame):
+        missing = {'检测项目', '点位', '替代点位'} - set(df.columns)
+        if missing:
+            raise RuleSpecError(f"点位替代缺少列：{'、'.join(sorted(missing))}")
+
+        unknown = set(df['检测项目']) - {tg.value for tg in TestGroup}
+        if unknown:
+            raise RuleSpecError(f"点位替代有未知的检测项目：{'、'.join(sorted(unknown))}")
+
+        if df.duplicated(['检测项目', '点位']).any():
+            raise RuleSpecError("点位替代有重复的 检测项目+点位")
+
+    def compile_point_rows(self, df: pd.DataFrame) -> list[tuple]:
+        point_rows = []
+        for test_group, test_detail, point in df[['检测项目', '项目详细', '点位']].itertuples(index=False):
+            point = None if pd.isna(point) else point
+            point_rows.append((test_group, test_detail, point, self.point_aliases.get((test_group, point))))
+
+        return point_rows
+
+    def get_point_rows(self, model_code: str, test_groups: list[str]) -> list[tuple]:
+        """
+        返回这些检测项目的报告行 [(检测项目, 项目详细, 点位, 替代点位), ...]，按点位文件的顺序
+        """
+        return [row for row in self.model_point_rows[model_code] if row[0] in test_groups]
+
+    def check_composition(self, df_chemical_composition: pd.DataFrame) -> pd.Series:
+        """
+        一次判断整张成分表，返回每行是否全部成分都在上下限内
+        """
+        values = df_chemical_composition.reindex(columns=self.composition_elements).to_numpy(dtype=float)
+
+        return pd.Series(
+            ((values >= self.composition_lower) & (values <= self.composition_upper)).all(axis=1),
+            index=df_chemical_composition.index,
+        )
+
+    def filter_sample_types(self, df_chemical_composition: pd.DataFrame) -> pd.DataFrame:
+        return df_chemical_composition[df_chemical_composition['类型'].isin(self.sample_types)]
@@ -1,68 +1,77 @@
 import os
 import pandas as pd
 
-from utilities import (
-    load_cpk_tolerance_map,
-    find_files_with_substrings,
-    show_info,
-    show_error,
-)
+from utilities import load_cpk_tolerance_map
 
 from constants import (
     MODEL_CODE_MAPPINGS,
+    TEST_GROUP_BATCH_KEYS,
     SampleDeliveryTestResult,
     TestGroup,
 )
 
 from ShipmentBatch import ShipmentBatch
+from ConformanceRules import ConformanceRules
+from InputFingerprints import InputFingerprints
+from CancelToken import CancelToken
 
 from errors import NonConformantError
 
 class DataChecker:
-    def __init__(self):
+    def __init__(self, on_error=None):
+        # 检查时发现的问题怎么提示：on_error(信息, 型号)，界面里记到通知栏，命令行默认打印
+        self.on_error = on_error if on_error is not None else lambda message, model_code='': print(message)
         self.cpk_tolerance_map = load_cpk_tolerance_map()
+        self.fingerprints = InputFingerprints()
 
     def check_chemical_composition_conformance(
         self,
         df_shipment_batch: pd.DataFrame,
         df_chemical_composition: pd.DataFrame,
-        df_chemical_composition_limits: pd.DataFrame
+        rules: ConformanceRules
     ) -> pd.DataFrame:
         """
         检查 化学成分
+        每个炉号按第一条成分记录判断，整张表一次判断完
         """
-        
-        for index, row in df_shipment_batch.iterrows():
-            furnace_code = row['炉号']
-
-            # check if corresponding furnace
-            df = df_chemical_composition[
-                df_chemical_composition['炉号'] == furnace_code
-            ]
-
-            if len(df)>0:
-                first_row = df.iloc[0]
-                
-                for index2, row2 in df_chemical_composition_limits.iterrows():
-                    element = row2['成分']
-                    upper_limit = row2['上限']
-                    lower_limit = row2['下限']
-
-                    value = float(first_row[element])
-                    
-                    if not (lower_limit <= value <= upper_limit):
-                        df_shipment_batch.at[index, '成分'] = "🔴 不合格"
-                        break
-                    df_shipment_batch.at[index, '成分'] = "🟢 合格"
-            else:
-                df_shipment_batch.at[index, '成分'] = "🟠 找不到炉号"
+        df_first = df_chemical_composition.drop_duplicates('炉号')
+        furnace_conformant = pd.Series(rules.check_composition(df_first).to_numpy(), index=df_first['炉号'])
+
+        conformant = df_shipment_batch['炉号'].map(furnace_conformant)
+
+        df_shipment_batch['成分'] = "🟠 找不到炉号"
+        df_shipment_batch.loc[conformant.eq(True), '成分'] = "🟢 合格"
+        df_shipment_batch.loc[conformant.eq(False), '成分'] = "🔴 不合格"
     
         return df_shipment_batch
     
-    def check_cpk_path(self, df_shipment_batch: pd.DataFrame) -> pd.DataFrame:
+    def check_cpk_path(
+        self,
+        df_shipment_batch: pd.DataFrame,
+        indexes=None,
+        progress=None,
+        cancel_token: CancelToken | None = None,
+        on_result=None
+    ) -> pd.DataFrame:
+        """
+        检查 CPK 是否存在
+        indexes: 只检查这些行（例如 CPK 文件夹有更新时受影响的行），默认检查全部
+        progress: 每检查完一行调用 progress(已检查行数, 总行数)
+        cancel_token: 取消后在下一行之前停下来（抛出 OperationCancelledError）
+        on_result: 每检查完一行调用 on_result(行索引, CPK 状态)
+        """
         error_path = []
+        # 每个路径只读一次文件列表
+        path_filenames = {}
+
+        df_rows = df_shipment_batch if indexes is None else df_shipment_batch.loc[indexes]
+
+        for i, (index, row) in enumerate(df_rows.iterrows()):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            if progress is not None:
+                progress(i, len(df_rows))
 
-        for index, row in df_shipment_batch.iterrows():
             model_code = row['型号']
             extrusion_batch = str(row['挤压批号']).strip()
             path = MODEL_CODE_MAPPINGS[model_code]['cpk']['path']
@@ -70,28 +79,40 @@ class DataChecker:
             if not path or not os.path.isdir(path):
                 df_shipment_batch.at[index, 'CPK'] = "🔴 错误"
                 if path not in error_path:
-                    show_error(f"{model_code} 型号的路径找不到：${path}")
+                    self.on_error(f"{model_code} 型号的路径找不到：${path}", str(model_code))
                     error_path.append(path)
-                return
+            else:
+                if path not in path_filenames:
+                    path_filenames[path] = os.listdir(path)
 
-            # Check if any file contains the extrusion batch string
-            matching_files = find_files_with_substrings(path, [extrusion_batch])
-            file_count = len(matching_files)
+                df_shipment_batch.at[index, 'CPK'] = self.check_cpk_status(model_code, extrusion_batch, path, path_filenames[path])
 
-            if file_count == 0:
-                df_shipment_batch.at[index, 'CPK'] = "🟠 不存在"
-            else:
-                # check CPK conformance
-                if file_count > 1:
-                    df_shipment_batch.at[index, 'CPK'] = "🟠 多数CPK存在"
-                else:
-                    # df_shipment_batch.at[index, 'CPK'] = "🟢 存在"
+            if on_result is not None:
+                on_result(index, df_shipment_batch.at[index, 'CPK'])
+
+        if progress is not None:
+            progress(len(df_rows), len(df_rows))
 
-                    file_path = os.path.join(path, matching_files[0])
-                    df_shipment_batch.at[index, 'CPK'] = self.check_cpk_conformance(file_path, self.cpk_tolerance_map[model_code])
-        
         return df_shipment_batch
 
+    def check_cpk_status(self, model_code: str, extrusion_batch: str, path: str, filenames: list[str]) -> str:
+        """
+        根据 CPK 文件夹的文件列表，判断一个挤压批号的 CPK 状态
+        """
+        # Check if any file contains the extrusion batch string
+        matching_files = [f for f in filenames if extrusion_batch in f]
+        file_count = len(matching_files)
+
+        if file_count == 0:
+            return "🟠 不存在"
+
+        # check CPK conformance
+        if file_count > 1:
+            return "🟠 多数CPK存在"
+
+        file_path = os.path.join(path, matching_files[0])
+        return self.check_cpk_conformance(file_path, self.cpk_tolerance_map[model_code])
+
 
     def check_cpk_conformance(self, cpk_path, df_cpk_tolerance) -> str:
         """
@@ -155,4 +176,125 @@ class DataChecker:
                     test_commission_form_code = df_filtered.iloc[0]['委托单号']
                     return f"🔴 {tg.value}NG {test_commission_form_code}"
         
-        return "🟢 合格"
\ No newline at end of file
+        return "🟢 合格"
+
+    def check_functional_conformance_all(self, df_shipment_batch: pd.DataFrame, df_test_commission_form: pd.DataFrame) -> pd.DataFrame:
+        """
+        检查 性能（全表一次性）
+        与 check_functional_conformance 结果一致，但按 检测项目 分组汇总委托单后，再和发货批次表做连接，不用逐行过滤
+        """
+        df_keys = pd.DataFrame({
+            '型号': df_shipment_batch['型号'].astype(str),
+            '炉号': df_shipment_batch['炉号'],
+            '时效批号': df_shipment_batch['时效批号'],
+        }, index=df_shipment_batch.index)
+
+        # 每行的状态，None 表示前面的检测项目都没问题
+        status = pd.Series(None, index=df_shipment_batch.index, dtype=object)
+
+        for tg in TestGroup:
+            # 金相按 熔铸炉号，其余按 时效批号
+            form_key, shipment_key = TEST_GROUP_BATCH_KEYS[tg]
+
+            df_tg = df_test_commission_form[df_test_commission_form['检测项目'] == tg.value]
+            df_tg = df_tg.assign(
+                型号=df_tg['型号'].astype(str),
+                合格=df_tg['检验结果'].eq(SampleDeliveryTestResult.CONFORMANT.value),
+                不合格=df_tg['检验结果'].eq(SampleDeliveryTestResult.NON_CONFORMANT.value),
+            )
+            df_summary = df_tg.groupby(['型号', form_key], sort=False)[['合格', '不合格']].any()
+            # NG 时报第一条委托单号（与逐行检查的 iloc[0] 一致）
+            df_summary['委托单号'] = df_tg.drop_duplicates(['型号', form_key]).set_index(['型号', form_key])['委托单号']
+
+            df_joined = df_keys.join(df_summary, on=['型号', shipment_key])
+
+            no_record = df_joined['合格'].isna()
+            passed = df_joined['合格'].fillna(False).astype(bool)
+            failed = df_joined['不合格'].fillna(False).astype(bool)
+
+            tg_status = pd.Series(None, index=df_shipment_batch.index, dtype=object)
+            tg_status[~passed & ~failed] = f"🟠 {tg.value} 送样结果未出"
+            tg_status[~passed & failed] = "🔴 " + tg.value + "NG " + df_joined['委托单号'].astype(str)
+            tg_status[no_record] = f"🟠 {tg.value} 无送样记录"
+
+            # 只保留第一个出问题的检测项目
+            status = status.fillna(tg_status)
+
+        df_shipment_batch['性能'] = status.fillna("🟢 合格")
+
+        return df_shipment_batch
+
+    def check_cpk_path_incremental(
+        self,
+        df_shipment_batch: pd.DataFrame,
+        rule_version: str = '',
+        progress=None,
+        cancel_token: CancelToken | None = None,
+        on_result=None,
+        input_fingerprints: InputFingerprints | None = None
+    ) -> tuple[pd.DataFrame, int]:
+        """
+        检查 CPK，只重新检查CPK文件有变化的行
+        指纹记在 input_fingerprints 上（不给时用 self.fingerprints）
+        返回 (发货批次表, 重新检查的行数)
+        """
+        input_fingerprints = input_fingerprints or self.fingerprints
+        cpk_paths = {model_code: mapping['cpk']['path'] for model_code, mapping in MODEL_CODE_MAPPINGS.items()}
+        fingerprints = input_fingerprints.cpk_fingerprints(df_shipment_batch, cpk_paths, rule_version)
+        indexes = input_fingerprints.changed_rows('CPK', fingerprints)
+
+        if len(indexes) > 0:
+            df_shipment_batch = self.check_cpk_path(df_shipment_batch, indexes, progress, cancel_token, on_result)
+        input_fingerprints.record('CPK', fingerprints, indexes)
+
+        return df_shipment_batch, len(indexes)
+
+    def check_chemical_composition_conformance_incremental(
+        self,
+        df_shipment_batch: pd.DataFrame,
+        df_chemical_composition: pd.DataFrame,
+        rules: ConformanceRules,
+        input_fingerprints: InputFingerprints | None = None
+    ) -> tuple[pd.DataFrame, int]:
+        """
+        检查 化学成分，只重新检查对应炉号成分数据有变化的行
+        返回 (发货批次表, 重新检查的行数)
+        """
+        input_fingerprints = input_fingerprints or self.fingerprints
+        fingerprints = input_fingerprints.composition_fingerprints(df_shipment_batch, df_chemical_composition, rules.version)
+        indexes = input_fingerprints.changed_rows('成分', fingerprints)
+
+        if len(indexes) > 0:
+            df_changed = self.check_chemical_composition_conformance(df_shipment_batch.loc[indexes], df_chemical_composition, rules)
+            df_shipment_batch.loc[indexes, '成分'] = df_changed['成分']
+        input_fingerprints.record('成分', fingerprints, indexes)
+
+        return df_shipment_batch, len(indexes)
+
+    def check_functional_conformance_incremental(
+        self,
+        df_shipment_batch: pd.DataFrame,
+        df_test_commission_form: pd.DataFrame,
+        df_functional_properties: pd.DataFrame | None,
+        rules: ConformanceRules,
+        input_fingerprints: InputFingerprints | None = None
+    ) -> tuple[pd.DataFrame, int]:
+        """
+        检查 性能，只重新检查对应 wtd1/wtdmx 数据有变化的行
+        返回 (发货批次表, 重新检查的行数)
+        """
+        input_fingerprints = input_fingerprints or self.fingerprints
+        fingerprints = input_fingerprints.functional_fingerprints(
+            df_shipment_batch,
+            df_test_commission_form,
+            df_functional_properties,
+            rules.version
+        )
+        indexes = input_fingerprints.changed_rows('性能', fingerprints)
+
+        if len(indexes) > 0:
+            df_changed = self.check_functional_conformance_all(df_shipment_batch.loc[indexes], df_test_commission_form)
+            df_shipment_batch.loc[indexes, '性能'] = df_changed['性能']
+        input_fingerprints.record('性能', fingerprints, indexes)
+
+        return df_shipment_batch, len(indexes)
\ No newline at end of file
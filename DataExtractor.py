@@ -3,17 +3,19 @@ import itertools
 
 import pandas as pd
 
+from ConformanceRules import ConformanceRules
+
 from constants import (
     customer_match, 
     location_match,
     CheckStatus,
     MODEL_CODE_ORDER,
-    SAMPLE_TYPES,
     OQC_RETENTION_SAMPLE_CODES,
     SCHEMA_CODE,
     CUSTOMER_PART_CODE,
     PART_NAME,
     CUSTOMER_CODE_EN,
+    REPORT_UNIT_KEYS,
 )
 
 class DataExtractor:
@@ -78,6 +80,17 @@ class DataExtractor:
 
         return df_shipment_batch
     
+    def extract_furnace_totals(self, df_shipment_batch: pd.DataFrame) -> pd.Series:
+        """
+        每份报告（地区+客户+型号+炉号）的总发货数，报告文件名、抽样数量、对数量都用这个
+        """
+        return (
+            df_shipment_batch
+            .assign(型号=df_shipment_batch['型号'].astype(str), 发货数=df_shipment_batch['发货数'].astype(int))
+            .groupby(REPORT_UNIT_KEYS, sort=False)['发货数']
+            .sum()
+        )
+
     def get_column_name_mapping(self, unflattened: list) -> dict:
         # Create a mapping dictionary
         column_mapping = {}
@@ -250,7 +263,7 @@ class DataExtractor:
 
         return df_functional_properties
     
-    def extract_chemical_composition_data(self, response_data: dict, compositions: list[str]) -> pd.DataFrame:
+    def extract_chemical_composition_data(self, response_data: dict, rules: ConformanceRules) -> pd.DataFrame:
         columns = self.get_column_name_mapping(response_data['titleList'])
         df = pd.DataFrame(response_data['list'])
         df = df.rename(columns={
@@ -261,9 +274,9 @@ class DataExtractor:
         print(f"Removing duplicated columns from chemical composition DataFrame: {df.columns[df.columns.duplicated()].tolist()}")
         df = df.loc[:, ~df.columns.duplicated()]
 
-        df_composition = df.reindex(columns=['炉号', '类型', *compositions])
+        df_composition = df.reindex(columns=['炉号', '类型', *rules.composition_elements])
         df_composition['Mn+Cr'] = 0
-        df_composition = df_composition[df_composition['类型'].isin(SAMPLE_TYPES)]
+        df_composition = rules.filter_sample_types(df_composition)
         df_composition = df_composition.replace('-', pd.NA).dropna(how='any')
 
         # df_composition.sort_values(by=['炉号', '类型'], ascending=[True, False], inplace=True)
@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt6.QtGui import QFont
+
+class DataFrameTableModel(QAbstractTableModel):
+    """
+    直接读 DataFrame 的表格模型，给 QTableView 用
+    - 每列存一个 numpy 数组，只有滚动到、显示出来的格子才转成文字，不用给每个格子建 QTableWidgetItem
+    - 换一张表用 set_dataframe（整表重置）；同一张表改了一些值用 update_dataframe，只通知变了的格子，滚动位置和选中的格子都不变
+    - action_column：在最后加一列操作列（没有数据，给按钮用）
+    - set_rows：只显示筛选出来的行，中间可以插小计行；表格上的行号用 source_row 换成 DataFrame 里的位置
+    """
+    def __init__(self):
+        super().__init__()
+        self.df = pd.DataFrame()
+        self.column_values = []
+        self.headers = []
+        self.action_column = None
+        self.rows = None     # 显示的行在 df 里的位置，小计行是 -1；None 显示全部
+        self.subtotals = {}  # {显示的行: {列: 文字}}
+
+        self.subtotal_font = QFont()
+        self.subtotal_font.setBold(True)
+
+    def set_dataframe(self, df: pd.DataFrame, action_column: str | None = None):
+        self.beginResetModel()
+        self.df = df
+        self.column_values = self.read_columns(df)
+        self.headers = self.make_headers(df, action_column)
+        self.action_column = action_column
+        self.rows = None
+        self.subtotals = {}
+        self.endResetModel()
+
+    def set_rows(self, rows: np.ndarray | None, subtotals: dict | None = None):
+        """
+        只显示 df 里这些位置的行（None 显示全部）
+        subtotals：{显示的行: {列名: 文字}}，是插在中间的小计行，rows 里对应的位置是 -1
+        """
+        self.beginResetModel()
+        self.rows = rows
+        self.subtotals = {
+            row: {self.headers.index(column): text for column, text in texts.items() if column in self.headers}
+            for row, texts in (subtotals or {}).items()
+        }
+        self.endResetModel()
+
+    def source_row(self, row: int) -> int | None:
+        """
+        表格上的第 row 行在 df 里的位置，小计行返回 None
+        """
+        if self.rows is None:
+            return row
+
+        position = int(self.rows[row])
+        return None if position < 0 else position
+
+    def source_rows(self, rows: list[int]) -> list[int]:
+        positions = (self.source_row(row) for row in rows)
+        return [position for position in positions if position is not None]
+
+    def update_dataframe(self, df: pd.DataFrame):
+        """
+        换成同一张表改过的版本（DataFrame 可以是同一个对象，原地改过）：
+        - 行和原有的列都没变时，只通知值变了的格子；新加在后面的列按插入列通知
+        - 行或者原有的列变了，整表重置
+        """
+        num_columns = len(self.column_values)
+        if not df.index.equals(self.df.index) or df.columns[:num_columns].tolist() != self.df.columns[:num_columns].tolist():
+            self.set_dataframe(df, self.action_column)
+            return
+
+        column_values = self.read_columns(df)
+        changed = [
+            (column, rows)
+            for column in range(num_columns)
+            if len(rows := self.changed_rows(self.column_values[column], column_values[column])) > 0
+        ]
+        # 没变的列沿用原来的数组，筛选的索引（按数组对象判断）就不用重建
+        changed_columns = {column for column, _ in changed}
+        for column in range(num_columns):
+            if column not in changed_columns:
+                column_values[column] = self.column_values[column]
+
+        if len(df.columns) > num_columns:
+            self.beginInsertColumns(QModelIndex(), num_columns, len(df.columns) - 1)
+            self.df = df
+            self.column_values = column_values
+            self.headers = self.make_headers(df, self.action_column)
+            self.endInsertColumns()
+        else:
+            self.df = df
+            self.column_values = column_values
+
+        # 换成表格上的行（筛选掉的行不用通知），同一列里连续的几行合成一次通知
+        for column, rows in changed:
+            rows = self.view_rows(rows)
+            if len(rows) == 0:
+                continue
+            for run in np.split(rows, np.flatnonzero(np.diff(rows) != 1) + 1):
+                self.dataChanged.emit(self.index(run[0], column), self.index(run[-1], column), [Qt.ItemDataRole.DisplayRole])
+
+    def view_rows(self, positions: np.ndarray) -> np.ndarray:
+        """
+        df 里的这些位置在表格上是第几行（没显示的去掉），从小到大
+        """
+        if self.rows is None:
+            return positions
+
+        view_row_of = np.full(len(self.df.index), -1)
+        shown = np.flatnonzero(self.rows >= 0)
+        view_row_of[self.rows[shown]] = shown
+        view_rows = view_row_of[positions]
+
+        return np.sort(view_rows[view_rows >= 0])
+
+    @staticmethod
+    def read_columns(df: pd.DataFrame) -> list[np.ndarray]:
+        # 复制一份，DataFrame 原地改过后，update_dataframe 才能比较出哪些格子变了
+        return [np.array(df.iloc[:, i].to_numpy(dtype=object), dtype=object, copy=True) for i in range(len(df.columns))]
+
+    @staticmethod
+    def make_headers(df: pd.DataFrame, action_column: str | None) -> list[str]:
+        headers = df.columns.astype(str).tolist()
+        if action_column is not None:
+            headers.append(action_column)
+
+        return headers
+
+    @classmethod
+    def changed_rows(cls, old: np.ndarray, new: np.ndarray) -> np.ndarray:
+        """
+        值变了的行（位置），两边都是空值不算变
+        """
+        try:
+            differs = np.asarray(old != new, dtype=bool)
+            if differs.shape != old.shape:
+                raise ValueError
+        except (ValueError, TypeError):
+            # 格子里是列表之类没法逐个比较的，比较显示的文字
+            differs = np.array([cls.format_value(a) != cls.format_value(b) for a, b in zip(old, new)], dtype=bool)
+
+        return np.flatnonzero(differs & ~(pd.isna(old) & pd.isna(new)))
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        if self.rows is not None:
+            return len(self.rows)
+        return len(self.df.index)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        position = self.source_row(index.row())
+        if position is None: # 小计行
+            if role == Qt.ItemDataRole.FontRole:
+                return self.subtotal_font
+            if role == Qt.ItemDataRole.DisplayRole:
+                return self.subtotals.get(index.row(), {}).get(index.column(), "")
+            return None
+
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if index.column() >= len(self.column_values): # 操作列
+            return None
+
+        return self.format_value(self.column_values[index.column()][position])
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.headers[section] if section < len(self.headers) else None
+
+        # 行号用 df 里的行号，筛选后也能看出是原表的第几行；小计行不编号
+        position = self.source_row(section) if section < self.rowCount() else None
+        return "" if position is None else str(position + 1)
+
+    @staticmethod
+    def format_value(value) -> str:
+        return str(value)
+
+    def column_texts(self, rows: np.ndarray, column: int) -> list[str]:
+        """
+        表格上这些行（从小到大）在这一列显示的文字，复制时一次读一整列，不用逐个格子调用 data
+        """
+        positions = rows if self.rows is None else self.rows[rows]
+        if column >= len(self.column_values): # 操作列
+            texts = [""] * len(rows)
+        else:
+            texts = [self.format_value(value) for value in self.column_values[column][np.maximum(positions, 0)]]
+
+        # 小计行
+        for i in np.flatnonzero(positions < 0):
+            texts[i] = self.subtotals.get(int(rows[i]), {}).get(column, "")
+
+        return texts
+
+    def sample_texts(self, column: int, sample_size: int) -> list[str]:
+        """
+        估算列宽用：表头加上均匀抽出的最多 sample_size 个格子的文字
+        """
+        texts = [self.headers[column]]
+        if column >= len(self.column_values) or len(self.df.index) == 0:
+            return texts
+
+        values = self.column_values[column]
+        rows = np.unique(np.linspace(0, len(values) - 1, num=min(sample_size, len(values)), dtype=int))
+        texts.extend(self.format_value(values[row]) for row in rows)
+
+        return texts
@@ -1,4 +1,3 @@
-import requests
 import json
 import os
 from dotenv import load_dotenv
@@ -15,6 +14,9 @@ class DataRequester:
             "Content-Type": "application/json"
         }
 
+        # requests 导入要一段时间，第一次请求时才导入
+        import requests
+
         try:
             response = requests.post(endpoint, data=json.dumps(data), headers=headers)
 
@@ -35,11 +37,11 @@ class DataRequester:
             print("Error making the request:", e)
             return []
     
-    def request_shipment_details(self) -> list:
+    def request_shipment_details(self, shipment_date_start: str = "2025-07-17") -> list:
         url = "493"
         data = {
             "project": "254",
-            "shipment_date_start": "2025-07-17",
+            "shipment_date_start": shipment_date_start,
             "model_code": "KAP-7461中板-A76-50,KAP-7457上U-A76-50,KAP-7487下U-A76-50"
         }
 
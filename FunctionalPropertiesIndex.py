@@ -0,0 +1,37 @@
+import pandas as pd
+
+from constants import TEST_GROUP_BATCH_KEYS
+
+class FunctionalPropertiesIndex:
+    """
+    wtdmx 性能数据的索引：(型号, 批号, 检测项目, oqc样号, 点位) -> 第一条数据
+    批号 按检测项目决定：金相用 铝棒炉号，其余用 时效炉号
+    读取性能数据后建一次，每份报告填性能时直接查，不用再过滤整张表
+    """
+    def __init__(self, df_functional_properties: pd.DataFrame):
+        df = df_functional_properties
+
+        batch_codes = df['时效炉号'].to_numpy(dtype=object).copy()
+        for tg, (data_key, _) in TEST_GROUP_BATCH_KEYS.items():
+            is_tg = (df['检测项目'] == tg.value).to_numpy()
+            batch_codes[is_tg] = df[data_key].to_numpy(dtype=object)[is_tg]
+
+        # 拉伸没有点位，统一用 None
+        points = df['点位'].astype(object).where(df['点位'].notna(), None)
+
+        self.positions = {}
+        keys = zip(df['型号'].astype(str), batch_codes, df['检测项目'], df['oqc样号'], points)
+        for position, key in enumerate(keys):
+            self.positions.setdefault(key, position)
+
+        self.columns = {column: df[column].to_numpy(dtype=object) for column in df.columns}
+
+    def lookup(self, model_code: str, batch_code: str, test_group: str, sample_code: str, point) -> int | None:
+        """
+        返回第一条数据的位置，找不到返回 None
+        """
+        return self.positions.get((model_code, batch_code, test_group, sample_code, point))
+
+    def value(self, position: int, test_detail: str):
+        column = self.columns.get(test_detail)
+        return None if column is None else column[position]
@@ -0,0 +1,147 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+class InputFingerprints:
+    """
+    记录发货批次表每行 CPK、性能、成分 状态是用什么输入算出来的（输入指纹）
+    再次检查时只重新计算输入有变化的行
+    - CPK：匹配到的CPK文件名 + 修改时间
+    - 性能：对应的 wtd1 委托单、wtdmx 性能数据
+    - 成分：对应炉号的 043 成分数据
+    指纹里也包含行本身的批号和规则版本，发货批次表重新读取或规则改动后都会重新计算
+    """
+    ROW_KEY_COLUMNS = ['型号', '挤压批号', '炉号', '时效批号']
+
+    def __init__(self):
+        self.fingerprints = {} # {状态列: pd.Series(指纹, index=发货批次表index)}
+
+    def reset(self):
+        self.fingerprints = {}
+
+    def copy(self) -> 'InputFingerprints':
+        """
+        后台检查用副本，完成后再换回去；record 每次都换成新的 Series，不会改到原来的
+        """
+        fingerprints = InputFingerprints()
+        fingerprints.fingerprints = dict(self.fingerprints)
+        return fingerprints
+
+    def changed_rows(self, column: str, fingerprints: pd.Series) -> pd.Index:
+        """
+        返回指纹和上次检查时不一样的行
+        """
+        previous = self.fingerprints.get(column)
+        if previous is None:
+            return fingerprints.index
+
+        previous = previous.reindex(fingerprints.index)
+        return fingerprints.index[previous.isna() | (previous != fingerprints)]
+
+    def record(self, column: str, fingerprints: pd.Series, indexes: pd.Index):
+        """
+        记录这些行检查后的指纹；fingerprints 只有部分行时（只检查一份报告的行），其他行的指纹不变
+        """
+        previous = self.fingerprints.get(column)
+        if previous is None:
+            previous = pd.Series(np.nan, index=fingerprints.index, dtype=object)
+        else:
+            previous = previous.reindex(previous.index.union(fingerprints.index, sort=False)).astype(object)
+
+        previous.loc[indexes] = fingerprints.loc[indexes]
+        self.fingerprints[column] = previous
+
+    def row_fingerprint(self, index) -> str:
+        """
+        这一行所有已检查状态的指纹，记在报告清单里，之后可以看出报告的输入有没有变
+        """
+        return '|'.join(
+            f"{column}:{fingerprints.get(index, '')}"
+            for column, fingerprints in sorted(self.fingerprints.items())
+        )
+
+    def cpk_fingerprints(self, df_shipment_batch: pd.DataFrame, cpk_paths: dict[str, str], rule_version: str = '') -> pd.Series:
+        """
+        CPK 指纹：匹配到的CPK文件名和修改时间
+        """
+        listings = {}
+        for path in set(cpk_paths.values()):
+            listings[path] = self.list_file_mtimes(path)
+
+        file_signatures = []
+        for model_code, extrusion_batch in zip(df_shipment_batch['型号'].astype(str), df_shipment_batch['挤压批号'].astype(str).str.strip()):
+            listing = listings.get(cpk_paths.get(model_code))
+            if listing is None:
+                file_signatures.append('路径不存在')
+                continue
+
+            file_signatures.append(';'.join(
+                f"{name}:{mtime}" for name, mtime in listing if extrusion_batch in name
+            ))
+
+        return self.combine(df_shipment_batch, rule_version, [pd.Series(file_signatures, index=df_shipment_batch.index)])
+
+    def functional_fingerprints(
+        self,
+        df_shipment_batch: pd.DataFrame,
+        df_test_commission_form: pd.DataFrame,
+        df_functional_properties: pd.DataFrame | None,
+        rule_version: str = '',
+    ) -> pd.Series:
+        """
+        性能 指纹：按 时效批号 和 熔铸炉号 对应的 wtd1、wtdmx 数据
+        """
+        parts = [
+            self.lookup_group_hashes(df_shipment_batch, df_test_commission_form, '时效炉号', '时效批号'),
+            self.lookup_group_hashes(df_shipment_batch, df_test_commission_form, '铝棒炉号', '炉号'),
+        ]
+        if df_functional_properties is not None:
+            parts += [
+                self.lookup_group_hashes(df_shipment_batch, df_functional_properties, '时效炉号', '时效批号'),
+                self.lookup_group_hashes(df_shipment_batch, df_functional_properties, '铝棒炉号', '炉号'),
+            ]
+
+        return self.combine(df_shipment_batch, rule_version, parts)
+
+    def composition_fingerprints(self, df_shipment_batch: pd.DataFrame, df_chemical_composition: pd.DataFrame, rule_version: str = '') -> pd.Series:
+        """
+        成分 指纹：对应炉号的 043 成分数据
+        """
+        hashes = self.group_hashes(df_chemical_composition, ['炉号'])
+        part = df_shipment_batch['炉号'].map(hashes).fillna(0).astype(np.uint64)
+
+        return self.combine(df_shipment_batch, rule_version, [part])
+
+    def lookup_group_hashes(self, df_shipment_batch: pd.DataFrame, df_data: pd.DataFrame, data_key: str, shipment_key: str) -> pd.Series:
+        # 按 (型号, 批号) 汇总数据的哈希，再对到发货批次表每行
+        hashes = self.group_hashes(df_data.assign(型号=df_data['型号'].astype(str)), ['型号', data_key])
+        hashes.index.names = ['型号', shipment_key]
+
+        df_keys = pd.DataFrame({
+            '型号': df_shipment_batch['型号'].astype(str),
+            shipment_key: df_shipment_batch[shipment_key],
+        }, index=df_shipment_batch.index)
+
+        return df_keys.join(hashes.rename('hash'), on=['型号', shipment_key])['hash'].fillna(0).astype(np.uint64)
+
+    def group_hashes(self, df_data: pd.DataFrame, keys: list[str]) -> pd.Series:
+        # 每行数据的哈希按 keys 相加，跟行的顺序无关
+        row_hashes = pd.util.hash_pandas_object(df_data.astype(str), index=False)
+
+        return row_hashes.groupby([df_data[k] for k in keys]).sum()
+
+    def combine(self, df_shipment_batch: pd.DataFrame, rule_version: str, parts: list[pd.Series]) -> pd.Series:
+        df = df_shipment_batch.reindex(columns=self.ROW_KEY_COLUMNS).astype(str)
+        for i, part in enumerate(parts):
+            df[f'part{i}'] = part.astype(str)
+        df['rule_version'] = rule_version
+
+        return pd.util.hash_pandas_object(df, index=False).astype(str)
+
+    def list_file_mtimes(self, path: str) -> list[tuple[str, float]] | None:
+        if not path or not os.path.isdir(path):
+            return None
+
+        with os.scandir(path) as entries:
+            return [(entry.name, entry.stat().st_mtime) for entry in entries if entry.is_file()]
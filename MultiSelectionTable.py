@@ -1,20 +1,112 @@
-from PyQt6.QtCore import Qt
-from PyQt6.QtWidgets import QTableWidget, QApplication
+import html
+
+import numpy as np
+from PyQt6.QtCore import QMimeData
+from PyQt6.QtGui import QKeySequence
+from PyQt6.QtWidgets import QTableView, QAbstractItemView, QApplication
+
+class MultiSelectionTable(QTableView):
+    """QTableView subclass that supports multi-cell Ctrl+C copying like Excel."""
+    # 估算列宽时每列最多看多少个格子，不用把所有行都量一遍
+    COLUMN_WIDTH_SAMPLE_SIZE = 200
+    MAX_COLUMN_WIDTH = 400
+
+    def __init__(self):
+        super().__init__()
+        self.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+
+    def selected_rows(self) -> list[int]:
+        """
+        选中的格子所在的行（按选区计算，不用逐个格子看），从小到大
+        """
+        rows = set()
+        for selection_range in self.selectionModel().selection():
+            rows.update(range(selection_range.top(), selection_range.bottom() + 1))
+
+        return sorted(rows)
+
+    def resize_columns_to_samples(self):
+        """
+        按抽样的格子估算列宽（代替 resizeColumnsToContents，那个要量每一行）
+        """
+        model = self.model()
+        if model is None:
+            return
+
+        font_metrics = self.fontMetrics()
+        padding = 2 * self.style().pixelMetric(self.style().PixelMetric.PM_HeaderMargin) + 8
+        for column in range(model.columnCount()):
+            texts = model.sample_texts(column, self.COLUMN_WIDTH_SAMPLE_SIZE)
+            width = max(font_metrics.horizontalAdvance(text) for text in texts) + padding
+            self.setColumnWidth(column, min(width, self.MAX_COLUMN_WIDTH))
 
-class MultiSelectionTable(QTableWidget):
-    """QTableWidget subclass that supports multi-cell Ctrl+C copying like Excel."""
     def keyPressEvent(self, event):
+        if event.matches(QKeySequence.StandardKey.Copy):
+            self.copy_selection()
+            return
+
         super().keyPressEvent(event)
-        if event.key() == Qt.Key.Key_C and (event.modifiers() & Qt.KeyboardModifier.ControlModifier):
-            copied_cells = sorted(self.selectedIndexes())
-            if not copied_cells:
-                return
-
-            max_col = copied_cells[-1].column()
-            copy_text = ""
-            for idx in copied_cells:
-                item = self.item(idx.row(), idx.column())
-                copy_text += item.text() if item else ""
-                copy_text += "\n" if idx.column() == max_col else "\t"
-
-            QApplication.clipboard().setText(copy_text)
+
+    def copy_selection(self):
+        """
+        复制选中的格子，同时放 TSV 文字和 HTML 表格（贴到 Excel、WPS、邮件里都能分好格子）
+        - 按选区计算，每一列的文字一次从模型读出来，不用把每个格子排序、逐个拼接
+        - 选区不是一整块长方形时（按住 Ctrl 多选），按选中的行和列排成表格，中间没选中的格子留空
+        """
+        model = self.model()
+        selection = self.selectionModel().selection()
+        if model is None or selection.isEmpty():
+            return
+
+        rows = np.array(sorted({row for r in selection for row in range(r.top(), r.bottom() + 1)}), dtype=int)
+        columns = np.array(sorted({column for r in selection for column in range(r.left(), r.right() + 1)}), dtype=int)
+
+        # 每个格子有没有被选中；一个选区在排好的行、列里是连续的一段
+        selected = np.zeros((len(rows), len(columns)), dtype=bool)
+        for r in selection:
+            selected[
+                np.searchsorted(rows, r.top()):np.searchsorted(rows, r.bottom(), side='right'),
+                np.searchsorted(columns, r.left()):np.searchsorted(columns, r.right(), side='right')
+            ] = True
+
+        # 转义按整列做：一列拼成一个字符串转义一次，再拆开
+        tsv_columns = []
+        html_columns = []
+        for j, column in enumerate(columns):
+            texts = self.column_texts(model, rows, int(column))
+            for i in np.flatnonzero(~selected[:, j]):
+                texts[i] = ""
+
+            joined = "\0".join(texts)
+            if any(c in joined for c in '\t\n"'):
+                tsv_columns.append([self.escape_tsv(text) for text in texts])
+            else:
+                tsv_columns.append(texts)
+            html_columns.append(html.escape(joined, quote=False).split("\0"))
+
+        # 一次遍历同时拼好 TSV 和 HTML
+        tsv_lines = []
+        html_rows = []
+        for tsv_cells, html_cells in zip(zip(*tsv_columns), zip(*html_columns)):
+            tsv_lines.append("\t".join(tsv_cells))
+            html_rows.append("<tr><td>" + "</td><td>".join(html_cells) + "</td></tr>")
+
+        mime_data = QMimeData()
+        mime_data.setText("\n".join(tsv_lines) + "\n")
+        mime_data.setHtml("<table>" + "".join(html_rows) + "</table>")
+        QApplication.clipboard().setMimeData(mime_data)
+
+    @staticmethod
+    def column_texts(model, rows: np.ndarray, column: int) -> list[str]:
+        if hasattr(model, 'column_texts'):
+            return model.column_texts(rows, column)
+
+        texts = (model.index(int(row), column).data() for row in rows)
+        return [str(text) if text is not None else "" for text in texts]
+
+    @staticmethod
+    def escape_tsv(text: str) -> str:
+        # 格子里有 Tab、换行或引号时，按 Excel 的规则加引号，不然会被拆成几个格子
+        if '\t' in text or '\n' in text or '"' in text:
+            return '"' + text.replace('"', '""') + '"'
+        return text
@@ -0,0 +1,119 @@
+from datetime import datetime
+
+from PyQt6.QtCore import pyqtSignal
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTreeWidget, QTreeWidgetItem
+
+from constants import NotificationLevel
+
+class NotificationPanel(QWidget):
+    """
+    通知栏：后台操作过程中的警告、错误先记下来，不弹窗，操作不用停下来等人点 确定
+    - 每次操作一组（begin 到 finish），组里按 (级别, 类型, 型号) 再分组，显示条数，展开看每一条
+    - 操作完成时在这一组上写一行小结
+    - 不在操作中的通知（比如自动检查CPK）单独成一组
+    """
+    # 有警告、错误的操作完成时发出，窗口把通知栏显示出来
+    attention_needed = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.summary_label = QLabel()
+        self.clear_button = QPushButton("清空")
+        self.clear_button.clicked.connect(self.clear)
+
+        header_layout = QHBoxLayout()
+        header_layout.setContentsMargins(0, 0, 0, 0)
+        header_layout.addWidget(self.summary_label)
+        header_layout.addStretch()
+        header_layout.addWidget(self.clear_button)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(header_layout)
+        layout.addWidget(self.tree)
+        self.setLayout(layout)
+
+        self.operation = None # (操作名, 开始时间, 条目)
+        self.groups = {}      # 当前这一组 {(级别, 类型, 型号): (条目, 条数)}
+        self.counts = {}      # 当前这一组 {级别: 条数}
+
+    def begin(self, operation: str):
+        if self.operation is not None:
+            self.finish()
+
+        item = QTreeWidgetItem([f"{operation}（{datetime.now():%H:%M:%S}）：进行中"])
+        self.tree.insertTopLevelItem(0, item) # 新的在上面
+        item.setExpanded(True)
+        self.operation = (operation, datetime.now(), item)
+        self.groups = {}
+        self.counts = {}
+
+    def add(self, level: NotificationLevel, category: str, message: str, model_code: str = ''):
+        """
+        记一条通知；不在操作中时单独成一组，马上小结
+        """
+        standalone = self.operation is None
+        if standalone:
+            self.begin(category)
+
+        key = (level, category, model_code)
+        group, count = self.groups.get(key, (None, 0))
+        if group is None:
+            group = QTreeWidgetItem()
+            self.operation[2].addChild(group)
+        group.addChild(QTreeWidgetItem([message]))
+        self.groups[key] = (group, count + 1)
+        group.setText(0, " · ".join(text for text in (level.value, category, model_code) if text) + f"（{count + 1} 条）")
+
+        self.counts[level] = self.counts.get(level, 0) + 1
+        self.update_summary_label()
+
+        if standalone:
+            self.finish()
+
+    def finish(self, result: str = "完成"):
+        """
+        操作结束：在这一组上写小结（结果 + 各级别条数），有警告、错误时发出 attention_needed
+        """
+        if self.operation is None:
+            return
+
+        operation, started, item = self.operation
+        item.setText(0, f"{operation}（{started:%H:%M:%S}）：{result}，{self.summarize()}")
+        self.summary_label.setText(item.text(0))
+        needs_attention = any(level != NotificationLevel.INFO for level in self.counts)
+
+        self.operation = None
+        self.groups = {}
+        self.counts = {}
+
+        if needs_attention:
+            self.attention_needed.emit()
+
+    def summarize(self) -> str:
+        if not self.counts:
+            return "没有问题"
+
+        return "，".join(
+            f"{level.value} {self.counts[level]} 条"
+            for level in NotificationLevel if level in self.counts
+        )
+
+    def update_summary_label(self):
+        if self.operation is not None:
+            self.summary_label.setText(f"{self.operation[0]}：{self.summarize()}")
+
+    def clear(self):
+        """
+        清空已经结束的操作的通知（正在进行的操作留着）
+        """
+        current = self.tree.indexOfTopLevelItem(self.operation[2]) if self.operation is not None else -1
+        for i in reversed(range(self.tree.topLevelItemCount())):
+            if i != current:
+                self.tree.takeTopLevelItem(i)
+
+        if self.operation is None:
+            self.summary_label.clear()
@@ -0,0 +1,362 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import io
+import json
+import os
+import socket
+
+import numpy as np
+import pandas as pd
+
+from ShipmentBatch import ShipmentBatch
+from ConformanceRules import ConformanceRules
+from FunctionalPropertiesIndex import FunctionalPropertiesIndex
+from ReportManifest import ReportManifest
+from ReportPipeline import ReportPipeline
+from ReportPublisher import ReportPublisher
+from CancelToken import CancelToken
+
+from errors import (
+    ReportExistsError,
+    ReportLockedError,
+    CPKNotFoundError,
+    CompositionNotFoundError,
+    NonConformantError,
+    OperationCancelledError,
+)
+
+from constants import (
+    REPORT_OUTPUT_PATH,
+    REPORT_MAX_WORKERS,
+    REPORT_IO_WORKERS,
+    REPORT_PIPELINE_QUEUE_SIZE,
+    REPORT_LOCK_TIMEOUT,
+    ReportOutcome,
+)
+
+# 子进程里共用的数据，每个进程启动时收到一次，不用每份报告都传一遍
+_worker_context = {}
+
+def init_worker(
+    furnace_totals: pd.Series,
+    df_chemical_composition: pd.DataFrame,
+    functional_index: FunctionalPropertiesIndex,
+    rules: ConformanceRules,
+):
+    _worker_context.update(
+        furnace_totals=furnace_totals,
+        df_chemical_composition=df_chemical_composition,
+        functional_index=functional_index,
+        rules=rules,
+    )
+
+def render_unit_report(row: pd.Series, cpk_values: np.ndarray) -> bytes:
+    """
+    子进程里渲染一份报告，返回 xlsx 文件内容（保存由主进程的保存阶段负责）
+    """
+    wb = ShipmentBatch(row).render_report(
+        _worker_context['furnace_totals'],
+        _worker_context['df_chemical_composition'],
+        _worker_context['functional_index'],
+        _worker_context['rules'],
+        cpk_values,
+    )
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+def outcome_of(exception: Exception) -> tuple[ReportOutcome, str]:
+    if isinstance(exception, ReportExistsError):
+        return ReportOutcome.EXISTS, str(exception)
+    if isinstance(exception, ReportLockedError):
+        return ReportOutcome.BUSY, str(exception)
+    if isinstance(exception, CPKNotFoundError):
+        return ReportOutcome.NO_CPK, str(exception)
+    if isinstance(exception, CompositionNotFoundError):
+        return ReportOutcome.NO_COMPOSITION, str(exception)
+    if isinstance(exception, NonConformantError):
+        return ReportOutcome.NG, exception.message
+    if isinstance(exception, OperationCancelledError):
+        return ReportOutcome.CANCELLED, str(exception)
+
+    return ReportOutcome.ERROR, str(exception)
+
+class ReportLock:
+    """
+    报告文件锁：在报告输出文件夹建一个 .lock 文件（已存在就建不了），同一份报告同时只有一个进程在写
+    - 锁文件里记着 电脑名、进程号、加锁时间
+    - 程序崩了留下的锁：同一台电脑上进程已经不在了，或者超过 REPORT_LOCK_TIMEOUT 秒，就接管过来
+    """
+    def __init__(self, report_key: str, report_output_path: str = REPORT_OUTPUT_PATH, timeout: float = REPORT_LOCK_TIMEOUT):
+        os.makedirs(report_output_path, exist_ok=True)
+        self.lock_path = os.path.join(report_output_path, f".{report_key.replace('|', '_')}.lock")
+        self.timeout = timeout
+        self.fd = None
+
+    def acquire(self):
+        try:
+            self.create()
+        except FileExistsError:
+            owner = self.read_owner()
+            if not self.is_stale(owner):
+                raise ReportLockedError(f"报告正在由其他进程生成（{owner.get('host', '')} 进程 {owner.get('pid', '')}）{self.lock_path}")
+
+            print(f"接管过期的报告文件锁 {self.lock_path}: {owner}")
+            # 删之前再看一眼，别删了别人刚接管的锁
+            if self.read_owner() == owner:
+                try:
+                    os.remove(self.lock_path)
+                except FileNotFoundError:
+                    pass
+            try:
+                self.create()
+            except FileExistsError:
+                raise ReportLockedError(f"报告正在由其他进程生成 {self.lock_path}")
+
+    def create(self):
+        self.fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        owner = {'host': socket.gethostname(), 'pid': os.getpid(), 'time': datetime.now().timestamp()}
+        os.write(self.fd, json.dumps(owner).encode('utf-8'))
+
+    def read_owner(self) -> dict:
+        """
+        锁文件里记的 电脑名、进程号、加锁时间；读不出来（刚建还没写、旧版本的空锁）时用文件的修改时间
+        """
+        try:
+            with open(self.lock_path, 'rb') as f:
+                owner = json.loads(f.read().decode('utf-8'))
+            if isinstance(owner, dict) and 'time' in owner:
+                return owner
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            pass
+
+        try:
+            return {'time': os.path.getmtime(self.lock_path)}
+        except OSError:
+            return {}
+
+    def is_stale(self, owner: dict) -> bool:
+        if not owner:
+            return True # 已经被释放了
+        if datetime.now().timestamp() - owner['time'] > self.timeout:
+            return True
+        if owner.get('host') == socket.gethostname() and 'pid' in owner:
+            return not process_exists(owner['pid'])
+
+        return False
+
+    def release(self):
+        if self.fd is None:
+            return
+
+        os.close(self.fd)
+        os.remove(self.lock_path)
+        self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def process_exists(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+
+    if os.name == 'nt':
+        # Windows 上 os.kill 会结束进程，只能用 OpenProcess 问
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        handle = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # 进程在，只是不是我们的
+
+    return True
+
+class ReportJob:
+    """
+    流水线里的一份报告
+    """
+    def __init__(self, plan_index, row_index, row: pd.Series, fingerprint: str = ''):
+        self.plan_index = plan_index
+        self.row_index = row_index
+        self.row = row
+        self.fingerprint = fingerprint
+        self.sb = ShipmentBatch(row)
+
+        self.lock = None
+        self.output_file = None
+        self.cpk_values = None
+        self.content = None
+
+class ReportGenerator:
+    """
+    按预检结果生成就绪的报告，每份报告依次经过流水线的各个阶段，各阶段同时运行：
+    - 检查：报告清单、报告文件是否已存在，加文件锁（线程）
+    - 读取CPK：从共享盘读 CPK 数据（线程，等网络时不占 CPU）
+    - 渲染：填模板（多个进程，CPU 密集）
+    - 保存：存到本地暂存文件夹，由 ReportPublisher 在后台发布到报告输出文件夹、更新报告清单（线程）
+    阶段之间的队列有上限，保存慢时前面的阶段会等，内存不会随报告数量增长
+    每份报告的结果（已生成、已存在、CPK不存在、缺成分数据、不合格…）都记下来，一份出错不影响其他
+    """
+    def __init__(
+        self,
+        report_manifest: ReportManifest,
+        report_publisher: ReportPublisher,
+        max_workers: int | None = REPORT_MAX_WORKERS,
+        io_workers: int = REPORT_IO_WORKERS,
+        queue_size: int = REPORT_PIPELINE_QUEUE_SIZE,
+    ):
+        self.report_manifest = report_manifest
+        self.report_publisher = report_publisher
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.io_workers = io_workers
+        self.queue_size = queue_size
+        self.pipeline = None # 最近一次运行的流水线，可以看各阶段的统计
+
+    def generate(
+        self,
+        df_shipment_batch: pd.DataFrame,
+        df_plan: pd.DataFrame,
+        furnace_totals: pd.Series,
+        df_chemical_composition: pd.DataFrame,
+        functional_index: FunctionalPropertiesIndex,
+        rules: ConformanceRules,
+        row_fingerprints: dict | None = None,
+        progress=None,
+        cancel_token: CancelToken | None = None,
+        on_result=None,
+    ) -> pd.DataFrame:
+        """
+        返回 df_plan 加上 '报告'（ReportOutcome 的值）和 '说明'（报告路径或原因）两列
+        row_fingerprints：{代表行: 输入指纹}，记进报告清单
+        progress：每完成一份报告调用 progress(已完成份数, 总份数)（在流水线的线程里调用）
+        cancel_token：取消后不再开始新的报告，已经在渲染的做完；其余的结果为 已取消
+        on_result：每完成一份报告调用 on_result(df_plan 的索引, ReportOutcome, 说明)，界面可以马上显示这份报告的结果
+        """
+        df_result = df_plan.copy()
+        df_result['报告'] = [self.plan_outcome(row).value for _, row in df_plan.iterrows()]
+        df_result['说明'] = df_plan['原因']
+
+        df_ready = df_plan[df_plan['就绪']]
+        if df_ready.empty:
+            return df_result
+
+        def make_jobs():
+            for plan_index, row_index in df_ready['代表行'].items():
+                if cancel_token is not None and cancel_token.is_cancelled():
+                    return
+                yield ReportJob(plan_index, row_index, df_shipment_batch.loc[row_index], (row_fingerprints or {}).get(row_index, ''))
+
+        outcomes = {} # {plan_index: (结果, 说明)}
+
+        def on_done(job: ReportJob, exception: Exception | None):
+            # 各阶段线程里调用，结果先记下来，全部完成后再写进表
+            if job.lock is not None:
+                job.lock.release()
+
+            if exception is None:
+                outcome, detail = ReportOutcome.GENERATED, job.output_file
+            else:
+                outcome, detail = outcome_of(exception)
+
+            outcomes[job.plan_index] = (outcome, detail)
+            if on_result is not None:
+                on_result(job.plan_index, outcome, detail)
+            if progress is not None:
+                progress(len(outcomes), len(df_ready))
+
+        num_render_workers = min(self.max_workers, len(df_ready))
+        with ProcessPoolExecutor(
+            max_workers=num_render_workers,
+            initializer=init_worker,
+            initargs=(furnace_totals, df_chemical_composition, functional_index, rules),
+        ) as executor:
+            def check_cancelled():
+                # 已经在队列里的报告，取消后也不再往下做
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+
+            def check(job: ReportJob) -> ReportJob:
+                check_cancelled()
+                # 先加锁再查报告是否已存在：别的进程查完、发布完之前，这里拿不到锁
+                lock = ReportLock(job.sb.get_report_manifest_key())
+                lock.acquire()
+                job.lock = lock
+                job.output_file = job.sb.get_output_file(furnace_totals, self.report_manifest, self.report_publisher)
+                return job
+
+            def read_cpk(job: ReportJob) -> ReportJob:
+                check_cancelled()
+                job.cpk_values = job.sb.read_cpk_datasheet()
+                return job
+
+            def render(job: ReportJob) -> ReportJob:
+                check_cancelled()
+                job.content = executor.submit(render_unit_report, job.row, job.cpk_values).result()
+                job.cpk_values = None
+                return job
+
+            def save(job: ReportJob) -> ReportJob:
+                # 锁交给发布器，报告发布到输出文件夹后才释放
+                self.report_publisher.publish(job.output_file, job.content, job.fingerprint, job.lock)
+                job.lock = None
+                job.content = None
+                return job
+
+            self.pipeline = ReportPipeline(
+                [
+                    ('检查', check, 1),
+                    ('读取CPK', read_cpk, self.io_workers),
+                    ('渲染', render, num_render_workers),
+                    ('保存', save, self.io_workers),
+                ],
+                self.queue_size,
+            )
+            self.pipeline.run(make_jobs(), on_done)
+
+        for plan_index, (outcome, detail) in outcomes.items():
+            df_result.at[plan_index, '报告'] = outcome.value
+            df_result.at[plan_index, '说明'] = detail
+
+        not_started = df_ready.index.difference(list(outcomes))
+        df_result.loc[not_started, '报告'] = ReportOutcome.CANCELLED.value
+        df_result.loc[not_started, '说明'] = str(OperationCancelledError())
+
+        return df_result
+
+    def plan_outcome(self, plan_row: pd.Series) -> ReportOutcome:
+        # 预检没通过的报告不用生成，按原因归类
+        if plan_row['报告已存在']:
+            return ReportOutcome.EXISTS
+        if not (plan_row['性能合格'] and plan_row['成分合格']):
+            return ReportOutcome.NG
+        if not plan_row['CPK']:
+            return ReportOutcome.NO_CPK
+        if not plan_row['成分数据']:
+            return ReportOutcome.NO_COMPOSITION
+        if not plan_row['就绪']:
+            return ReportOutcome.NOT_READY
+
+        return ReportOutcome.GENERATED
+
+    def summarize(self, df_result: pd.DataFrame) -> str:
+        counts = df_result['报告'].value_counts()
+
+        return '，'.join(
+            f"{outcome.value} {counts[outcome.value]} 份"
+            for outcome in ReportOutcome if outcome.value in counts
+        )
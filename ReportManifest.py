@@ -0,0 +1,99 @@
+from datetime import datetime
+import json
+import os
+import threading
+
+from utilities import parse_report_filename
+
+from constants import (
+    REPORT_OUTPUT_PATH,
+    REPORT_MANIFEST_FILENAME,
+)
+
+class ReportManifest:
+    """
+    报告清单：(型号, 炉号, 地区, 客户) -> 报告文件路径、输入指纹、生成时间
+    判断报告是否已存在时直接查清单，不用每次扫描整个报告输出文件夹
+    每次保存报告后更新（先写临时文件再替换，不会留下写了一半的清单）
+    清单不存在时，或者手动要求时，才从文件夹重建
+    load=False 时先不读，清单是空的（读取出错时用）
+    """
+    def __init__(self, report_output_path: str = REPORT_OUTPUT_PATH, load: bool = True):
+        self.report_output_path = report_output_path
+        self.manifest_path = os.path.join(report_output_path, REPORT_MANIFEST_FILENAME)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        if load:
+            self.load()
+
+    @staticmethod
+    def make_key(model_code: str, casting_furnace_code: str, location: str, customer: str) -> str:
+        return f"{model_code}|{casting_furnace_code}|{location}|{customer}"
+
+    def load(self):
+        if not os.path.isfile(self.manifest_path):
+            self.rebuild()
+            return
+
+        with open(self.manifest_path, encoding='utf-8') as f:
+            self.entries = json.load(f)
+
+    def rebuild(self) -> int:
+        """
+        按报告文件名重建清单，返回找到的报告数量
+        """
+        if not os.path.isdir(self.report_output_path):
+            self.entries = {}
+            return 0
+
+        entries = {}
+        with os.scandir(self.report_output_path) as files:
+            for entry in files:
+                fields = parse_report_filename(entry.name)
+                if fields is None or not entry.is_file():
+                    continue
+
+                key = self.make_key(fields['model_code'], fields['casting_furnace_code'], fields['location'], fields['customer'])
+                entries[key] = {
+                    'path': entry.path,
+                    'fingerprint': '',
+                    'timestamp': datetime.fromtimestamp(entry.stat().st_mtime).isoformat(timespec='seconds'),
+                }
+
+        with self.lock:
+            self.entries = entries
+            self.save()
+
+        return len(entries)
+
+    def get(self, key: str) -> dict | None:
+        """
+        清单里的报告，文件已被删除的当作不存在
+        """
+        entry = self.entries.get(key)
+        if entry is None or not os.path.isfile(entry['path']):
+            return None
+
+        return entry
+
+    def contains(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def record(self, key: str, path: str, fingerprint: str = ''):
+        with self.lock:
+            self.entries[key] = {
+                'path': path,
+                'fingerprint': fingerprint,
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+            }
+            self.save()
+
+    def save(self):
+        # 调用前需要拿着 self.lock
+        os.makedirs(self.report_output_path, exist_ok=True)
+
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.manifest_path)
@@ -0,0 +1,111 @@
+import queue
+import threading
+import time
+
+class PipelineStage:
+    """
+    流水线的一个阶段：几个线程从输入队列取任务处理，交给下一个阶段
+    输入队列有上限，下一个阶段处理不过来时，这个阶段会停下来等（背压），内存不会无限增长
+    """
+    def __init__(self, name: str, function, num_workers: int, queue_size: int):
+        self.name = name
+        self.function = function
+        self.num_workers = num_workers
+        self.input = queue.Queue(maxsize=queue_size)
+
+        self.lock = threading.Lock()
+        self.num_processed = 0
+        self.num_failed = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+
+    def record(self, seconds: float, failed: bool):
+        with self.lock:
+            self.num_processed += 1
+            self.num_failed += failed
+            self.busy_seconds += seconds
+            self.max_queue_depth = max(self.max_queue_depth, self.input.qsize())
+
+    def stats(self, elapsed_seconds: float) -> dict:
+        with self.lock:
+            return {
+                '阶段': self.name,
+                '线程': self.num_workers,
+                '完成': self.num_processed,
+                '出错': self.num_failed,
+                '每秒': round(self.num_processed / elapsed_seconds, 2) if elapsed_seconds > 0 else 0.0,
+                '平均秒': round(self.busy_seconds / self.num_processed, 3) if self.num_processed else 0.0,
+                '队列': self.input.qsize(),
+                '最大队列': self.max_queue_depth,
+            }
+
+class ReportPipeline:
+    """
+    分阶段的流水线：任务依次经过每个阶段，阶段之间用有上限的队列连接，各阶段同时运行
+    - stages: [(名称, 函数, 线程数)]，函数收到任务、返回交给下一阶段的任务
+    - 任务在某个阶段抛出异常就不再往下走，连同异常交给 on_done；走完全部阶段的 on_done(任务, None)
+    - on_done 在各阶段的线程里调用
+    """
+    _DONE = object() # 队列结束标记
+
+    def __init__(self, stages: list[tuple], queue_size: int):
+        self.stages = [PipelineStage(name, function, num_workers, queue_size) for name, function, num_workers in stages]
+        self.started_at = None
+
+    def run(self, jobs, on_done):
+        self.started_at = time.perf_counter()
+
+        threads = []
+        for i, stage in enumerate(self.stages):
+            next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            remaining = [stage.num_workers] # 这个阶段还没结束的线程数，最后一个结束时通知下一个阶段
+            for _ in range(stage.num_workers):
+                thread = threading.Thread(target=self.work, args=(stage, next_stage, remaining, on_done), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        # 第一个阶段的队列满了会在这里等
+        for job in jobs:
+            self.stages[0].input.put(job)
+        for _ in range(self.stages[0].num_workers):
+            self.stages[0].input.put(self._DONE)
+
+        for thread in threads:
+            thread.join()
+
+    def work(self, stage: PipelineStage, next_stage: PipelineStage | None, remaining: list[int], on_done):
+        while True:
+            job = stage.input.get()
+            if job is self._DONE:
+                break
+
+            started = time.perf_counter()
+            try:
+                result = stage.function(job)
+            except Exception as e:
+                stage.record(time.perf_counter() - started, True)
+                on_done(job, e)
+                continue
+            stage.record(time.perf_counter() - started, False)
+
+            if next_stage is None:
+                on_done(result, None)
+            else:
+                next_stage.input.put(result)
+
+        with stage.lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and next_stage is not None:
+            for _ in range(next_stage.num_workers):
+                next_stage.input.put(self._DONE)
+
+    def stats(self) -> list[dict]:
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        return [stage.stats(elapsed) for stage in self.stages]
+
+    def summarize_stats(self) -> str:
+        return '；'.join(
+            f"{s['阶段']} {s['完成']} 份 {s['每秒']}/秒 最大队列 {s['最大队列']}"
+            for s in self.stats()
+        )
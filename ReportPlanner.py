@@ -0,0 +1,134 @@
+import os
+
+import pandas as pd
+
+from ReportManifest import ReportManifest
+
+from constants import (
+    REPORT_TEMPLATE_PATH,
+    REPORT_UNIT_KEYS,
+    TEST_GROUP_BATCH_KEYS,
+)
+
+class ReportPlanner:
+    """
+    生成报告前的预检：不打开任何 Excel，只用内存里的数据，算出每份报告（地区+客户+型号+炉号）缺什么
+    - CPK：发货批次表的 CPK 状态，取第一个 CPK 存在的挤压批号来出报告
+    - 性能：wtdmx 性能数据里每个检测项目都有数据，且 性能 状态不是不合格
+    - 成分：043 成分数据里有这个炉号，且 成分 状态不是不合格
+    - 报告模板 存在
+    - 报告 还没生成过（查报告清单）
+    """
+    def __init__(self, report_manifest: ReportManifest, report_template_path: str = REPORT_TEMPLATE_PATH):
+        self.report_manifest = report_manifest
+        self.report_template_path = report_template_path
+
+    def plan(
+        self,
+        df_shipment_batch: pd.DataFrame,
+        df_functional_properties: pd.DataFrame | None,
+        df_chemical_composition: pd.DataFrame | None,
+        furnace_totals: pd.Series | None = None,
+    ) -> pd.DataFrame:
+        """
+        返回每份报告一行的就绪表，'代表行' 是用来出报告的发货批次行 index，'发货行' 是这份报告的全部发货批次行 index
+        """
+        df = df_shipment_batch.assign(型号=df_shipment_batch['型号'].astype(str))
+        cpk_ok = df['CPK'].astype(str).str.startswith('🟢')
+
+        # 每份报告的代表行：第一个 CPK 存在的行，都没有就用第一行
+        df_first = df.drop_duplicates(REPORT_UNIT_KEYS)
+        unit_index = pd.MultiIndex.from_frame(df_first[REPORT_UNIT_KEYS])
+        df_cpk_ok = df[cpk_ok].drop_duplicates(REPORT_UNIT_KEYS)
+        cpk_ok_rows = pd.Series(df_cpk_ok.index, index=pd.MultiIndex.from_frame(df_cpk_ok[REPORT_UNIT_KEYS]))
+        representative_rows = cpk_ok_rows.reindex(unit_index)
+
+        df_plan = df_first[REPORT_UNIT_KEYS].reset_index(drop=True)
+        df_plan['代表行'] = representative_rows.fillna(pd.Series(df_first.index, index=unit_index)).astype(int).to_numpy()
+        df_plan['挤压批号'] = df.loc[df_plan['代表行'], '挤压批号'].to_numpy()
+        df_plan['时效批号'] = df.loc[df_plan['代表行'], '时效批号'].to_numpy()
+        # 每份报告的全部发货批次行，报告只按份生成一次，结果再写回这些行
+        unit_rows = df.groupby(REPORT_UNIT_KEYS, sort=False).indices
+        df_plan['发货行'] = [df.index[unit_rows[key]].tolist() for key in unit_index]
+        df_plan['行数'] = df_plan['发货行'].map(len)
+        if furnace_totals is not None:
+            df_plan['总发货数'] = furnace_totals.reindex(unit_index).to_numpy()
+
+        df_plan['CPK'] = representative_rows.notna().to_numpy()
+
+        df_plan['性能数据'] = self.has_functional_data(df.loc[df_plan['代表行']], df_functional_properties).to_numpy()
+        df_plan['性能合格'] = ~unit_index.isin(self.ng_unit_keys(df, '性能'))
+
+        if df_chemical_composition is None:
+            df_plan['成分数据'] = False
+        else:
+            df_plan['成分数据'] = df_plan['炉号'].isin(set(df_chemical_composition['炉号']))
+        df_plan['成分合格'] = ~unit_index.isin(self.ng_unit_keys(df, '成分'))
+
+        templates = {
+            model_code: os.path.isfile(os.path.join(self.report_template_path, f"{model_code}.xlsx"))
+            for model_code in df_plan['型号'].unique()
+        }
+        df_plan['报告模板'] = df_plan['型号'].map(templates).astype(bool)
+
+        df_plan['报告已存在'] = [
+            self.report_manifest.contains(ReportManifest.make_key(model_code, casting_furnace_code, location, customer))
+            for location, customer, model_code, casting_furnace_code in df_plan[REPORT_UNIT_KEYS].itertuples(index=False)
+        ]
+
+        checks = {
+            'CPK': 'CPK不存在',
+            '性能数据': '缺性能数据',
+            '性能合格': '性能不合格',
+            '成分数据': '缺成分数据',
+            '成分合格': '成分不合格',
+            '报告模板': '缺报告模板',
+        }
+        df_plan['就绪'] = df_plan[list(checks)].all(axis=1) & ~df_plan['报告已存在']
+        df_plan['原因'] = [
+            '、'.join(
+                [reason for column, reason in checks.items() if not row[column]] +
+                (['报告已存在'] if row['报告已存在'] else [])
+            )
+            for _, row in df_plan.iterrows()
+        ]
+
+        return df_plan
+
+    def find_unit(self, df_plan: pd.DataFrame, row_index) -> pd.Series:
+        """
+        发货批次行所在的那份报告
+        """
+        unit_of_row = df_plan['发货行'].explode()
+        return df_plan.loc[unit_of_row.index[unit_of_row == row_index][0]]
+
+    def unit_rows(self, df_shipment_batch: pd.DataFrame, row_index) -> pd.DataFrame:
+        """
+        和这一行同一份报告（REPORT_UNIT_KEYS 相同）的发货批次行，只生成一份报告时只预检这些行
+        """
+        df_keys = df_shipment_batch[REPORT_UNIT_KEYS]
+        return df_shipment_batch[df_keys.eq(df_keys.loc[row_index]).all(axis=1)]
+
+    def has_functional_data(self, df_rows: pd.DataFrame, df_functional_properties: pd.DataFrame | None) -> pd.Series:
+        """
+        每个检测项目（金相按熔铸炉号，其余按时效批号）在 wtdmx 里都至少有一条数据
+        """
+        if df_functional_properties is None:
+            return pd.Series(False, index=df_rows.index)
+
+        model_codes = df_functional_properties['型号'].astype(str)
+        present = pd.Series(True, index=df_rows.index)
+
+        for tg, (data_key, shipment_key) in TEST_GROUP_BATCH_KEYS.items():
+            is_tg = df_functional_properties['检测项目'] == tg.value
+            available = pd.MultiIndex.from_arrays([model_codes[is_tg], df_functional_properties.loc[is_tg, data_key]])
+            wanted = pd.MultiIndex.from_arrays([df_rows['型号'], df_rows[shipment_key]])
+            present &= wanted.isin(available)
+
+        return present
+
+    def ng_unit_keys(self, df: pd.DataFrame, column: str) -> list[tuple]:
+        # 同一份报告里任意一行不合格，整份报告都不合格
+        is_ng = df[column].astype(str).str.startswith('🔴')
+
+        return list(df.loc[is_ng, REPORT_UNIT_KEYS].drop_duplicates().itertuples(index=False, name=None))
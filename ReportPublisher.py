@@ -0,0 +1,176 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from ReportManifest import ReportManifest
+from utilities import parse_report_filename
+
+from constants import (
+    REPORT_OUTPUT_PATH,
+    REPORT_STAGING_PATH,
+    REPORT_PUBLISH_WORKERS,
+    REPORT_PUBLISH_RETRIES,
+    REPORT_PUBLISH_LOG_FILENAME,
+)
+
+class ReportPublisher:
+    """
+    报告先存到本地暂存文件夹，再由后台线程发布到报告输出文件夹（通常是共享盘），生成报告不用等网络
+    - 发布：先复制成输出文件夹里的临时文件，再改名成报告文件名（改名是原子的，不会出现写了一半的报告）
+    - 失败会重试几次，每次间隔翻倍；发布成功才记进报告清单，并写一行发布记录
+    - 程序中途退出时暂存文件夹里剩下的报告，下次启动时 recover() 重新发布
+    """
+    # 暂存文件先用这个后缀的临时名字写，写完再改名成报告文件名
+    STAGING_SUFFIX = '.staging'
+
+    def __init__(
+        self,
+        report_manifest: ReportManifest,
+        report_output_path: str = REPORT_OUTPUT_PATH,
+        staging_path: str = REPORT_STAGING_PATH,
+        max_workers: int = REPORT_PUBLISH_WORKERS,
+        retries: int = REPORT_PUBLISH_RETRIES,
+    ):
+        self.report_manifest = report_manifest
+        self.report_output_path = report_output_path
+        self.staging_path = staging_path
+        self.retries = retries
+        self.log_path = os.path.join(staging_path, REPORT_PUBLISH_LOG_FILENAME)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ReportPublisher')
+        self.lock = threading.Lock()
+        self.pending = {} # {报告路径: Future}
+        self.failed = {}  # {报告路径: 出错信息}
+
+    def publish(self, output_file: str, content: bytes, fingerprint: str = '', lock=None) -> str:
+        """
+        把报告内容写进暂存文件夹，排队发布到 output_file，返回暂存文件路径
+        lock：这份报告的 ReportLock，发布完（成功或失败）后释放；排队前出错时还是调用方的
+        """
+        os.makedirs(self.staging_path, exist_ok=True)
+        staged_file = os.path.join(self.staging_path, os.path.basename(output_file))
+        # 先写临时文件再改名：写到一半程序崩了，recover() 也只会看到完整的报告
+        temp_file = os.path.join(self.staging_path, f".{uuid.uuid4().hex}{self.STAGING_SUFFIX}")
+        try:
+            with open(temp_file, 'wb') as f:
+                f.write(content)
+            os.replace(temp_file, staged_file)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+        self.submit(staged_file, output_file, fingerprint, lock)
+        return staged_file
+
+    def submit(self, staged_file: str, output_file: str, fingerprint: str = '', lock=None):
+        with self.lock:
+            self.failed.pop(output_file, None)
+            self.pending[output_file] = self.executor.submit(self.publish_staged, staged_file, output_file, fingerprint, lock)
+
+    def publish_staged(self, staged_file: str, output_file: str, fingerprint: str, lock=None):
+        # 不管怎么结束（包括意外的错误），都不再算正在发布，不然 is_pending 会一直挡着这份报告
+        try:
+            self.copy_to_output(staged_file, output_file, fingerprint)
+        except Exception as e:
+            with self.lock:
+                self.failed[output_file] = str(e)
+            print(f"发布报告失败 {output_file}: {e}")
+        finally:
+            with self.lock:
+                self.pending.pop(output_file, None)
+            if lock is not None:
+                lock.release()
+
+    def copy_to_output(self, staged_file: str, output_file: str, fingerprint: str):
+        error = None
+        for attempt in range(1, self.retries + 1):
+            try:
+                os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+                # 临时文件名不符合报告文件名格式，重建报告清单时不会当成报告
+                temp_file = os.path.join(os.path.dirname(output_file), f".{uuid.uuid4().hex}.publishing")
+                try:
+                    shutil.copyfile(staged_file, temp_file)
+                    os.replace(temp_file, output_file)
+                finally:
+                    if os.path.exists(temp_file):
+                        os.remove(temp_file)
+                break
+            except OSError as e:
+                error = e
+                if attempt < self.retries:
+                    time.sleep(2 ** (attempt - 1))
+        else:
+            with self.lock:
+                self.failed[output_file] = str(error)
+            self.write_log(output_file, attempt, str(error))
+            print(f"发布报告失败 {output_file}: {error}")
+            return
+
+        os.remove(staged_file)
+        self.record(output_file, fingerprint)
+        self.write_log(output_file, attempt, None)
+
+    def record(self, output_file: str, fingerprint: str):
+        fields = parse_report_filename(os.path.basename(output_file))
+        if fields is None:
+            return
+
+        key = ReportManifest.make_key(fields['model_code'], fields['casting_furnace_code'], fields['location'], fields['customer'])
+        self.report_manifest.record(key, output_file, fingerprint)
+
+    def write_log(self, output_file: str, attempts: int, error: str | None):
+        entry = {
+            'path': output_file,
+            'attempts': attempts,
+            'error': error,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        }
+        with self.lock:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def recover(self) -> int:
+        """
+        重新发布暂存文件夹里上次没发布完的报告，返回数量
+        """
+        if not os.path.isdir(self.staging_path):
+            return 0
+
+        num_recovered = 0
+        with os.scandir(self.staging_path) as entries:
+            for entry in entries:
+                # 上次写到一半的临时文件
+                if entry.is_file() and entry.name.endswith(self.STAGING_SUFFIX):
+                    os.remove(entry.path)
+                    continue
+                if entry.is_file() and parse_report_filename(entry.name) is not None:
+                    self.submit(entry.path, os.path.join(self.report_output_path, entry.name))
+                    num_recovered += 1
+
+        return num_recovered
+
+    def is_pending(self, output_file: str) -> bool:
+        with self.lock:
+            return output_file in self.pending
+
+    def num_pending(self) -> int:
+        with self.lock:
+            return len(self.pending)
+
+    def wait(self):
+        """
+        等现在排队的报告都发布完
+        """
+        with self.lock:
+            futures = list(self.pending.values())
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        # 没开始发布的留在暂存文件夹，下次启动再发布
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+import pandas as pd
+
+from utilities import parse_report_filename
+
+from constants import (
+    REPORT_UNIT_KEYS,
+    REPORT_RECONCILE_WORKERS,
+    ReconcileStatus,
+)
+
+class ReportReconciler:
+    """
+    对数量：扫描报告文件夹，按文件名认出每份报告（地区+客户+型号+炉号）和上面的数量，和发货批次表的总发货数逐份比对
+    - 用 os.scandir 扫描，可以包括子文件夹；子文件夹多时每一层用几个线程同时扫描（共享盘上主要是等网络）
+    - 每个文件夹的扫描结果按文件夹的修改时间缓存：文件夹里加、删、改名报告才会变，没变就不再扫描
+    - 文件名按 REPORT_FILENAME_TOLERANT_PATTERNS 的各个版本认（手动改过、复制出来的也算），带 MANCHESTER 但认不出的文件单独列出来，不会中断
+    """
+    REPORT_MARKER = 'MANCHESTER'
+
+    def __init__(self, max_workers: int = REPORT_RECONCILE_WORKERS):
+        self.max_workers = max_workers
+        self.cache = {} # {文件夹: (修改时间, 报告, 认不出的文件, 子文件夹)}
+        self.lock = threading.Lock()
+
+    def scan(self, folder: str, recursive: bool = False) -> tuple[pd.DataFrame, list[str]]:
+        """
+        返回 (报告表，每份报告一行：地区、客户、型号、炉号、报告数量、文件, 认不出的文件)
+        """
+        reports, unparsed = [], []
+        directories = [folder]
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ReportReconciler') as executor:
+            while directories:
+                subdirectories = []
+                for directory_reports, directory_unparsed, directory_subdirectories in executor.map(self.scan_directory, directories):
+                    reports.extend(directory_reports)
+                    unparsed.extend(directory_unparsed)
+                    subdirectories.extend(directory_subdirectories)
+                directories = subdirectories if recursive else []
+
+        df_reports = pd.DataFrame(reports, columns=[*REPORT_UNIT_KEYS, '报告数量', '文件'])
+        return df_reports, unparsed
+
+    def scan_directory(self, directory: str) -> tuple[list, list, list]:
+        mtime = os.stat(directory).st_mtime_ns
+        with self.lock:
+            cached = self.cache.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return cached[1:]
+
+        reports, unparsed, subdirectories = [], [], []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirectories.append(entry.path)
+                    continue
+                if self.REPORT_MARKER not in entry.name.upper() or not entry.is_file():
+                    continue
+
+                fields = parse_report_filename(entry.name, tolerant=True)
+                if fields is None:
+                    unparsed.append(entry.path)
+                    continue
+
+                reports.append((
+                    fields['location'],
+                    fields['customer'],
+                    fields['model_code'],
+                    fields['casting_furnace_code'],
+                    fields['quantity'],
+                    entry.path,
+                ))
+
+        with self.lock:
+            self.cache[directory] = (mtime, reports, unparsed, subdirectories)
+
+        return reports, unparsed, subdirectories
+
+    def reconcile(self, df_reports: pd.DataFrame, unparsed: list[str], furnace_totals: pd.Series | None) -> pd.DataFrame:
+        """
+        逐份比对：报告数量和总发货数（furnace_totals，按 REPORT_UNIT_KEYS）；还没读取发货批次表时只列出报告，查重复的
+        返回每份报告一行：地区、客户、型号、炉号、发货数、报告数量、报告数、状态、文件，有问题的排在前面
+        """
+        report_groups = df_reports.groupby(REPORT_UNIT_KEYS, sort=False)
+        df_found = pd.DataFrame({
+            '报告数量': report_groups['报告数量'].first(),
+            '报告数': report_groups.size(),
+            '文件': report_groups['文件'].agg(lambda files: '\n'.join(sorted(files))),
+        })
+        if furnace_totals is None:
+            df = df_found.assign(发货数=None).reset_index()
+            df['状态'] = ''
+            df.loc[df['报告数'] > 1, '状态'] = ReconcileStatus.DUPLICATE.value
+        else:
+            df = df_found.join(furnace_totals.rename('发货数'), how='outer').reset_index()
+            df['报告数'] = df['报告数'].fillna(0).astype(int)
+
+            has_report = df['报告数'] > 0
+            has_shipment = df['发货数'].notna()
+            df['状态'] = ReconcileStatus.MATCHED.value
+            df.loc[has_report & has_shipment & (df['报告数量'] != df['发货数']), '状态'] = ReconcileStatus.MISMATCHED.value
+            df.loc[df['报告数'] > 1, '状态'] = ReconcileStatus.DUPLICATE.value
+            df.loc[~has_report, '状态'] = ReconcileStatus.MISSING.value
+            df.loc[~has_shipment, '状态'] = ReconcileStatus.EXTRA.value
+
+        df_unparsed = pd.DataFrame({**dict.fromkeys(REPORT_UNIT_KEYS, ''), '状态': ReconcileStatus.UNPARSED.value, '文件': unparsed})
+        df = pd.concat([df, df_unparsed], ignore_index=True)
+        df['文件'] = df['文件'].fillna('') # 缺报告的行没有文件
+
+        # 有问题的排在前面，同一种问题保持原来的顺序
+        order = {status.value: i for i, status in enumerate(ReconcileStatus)}
+        order[ReconcileStatus.MATCHED.value] = order[''] = len(order)
+        df = df.sort_values('状态', key=lambda statuses: statuses.map(order), kind='stable').reset_index(drop=True)
+
+        # 数量显示成整数，没有的留空
+        for column in ['发货数', '报告数量', '报告数']:
+            df[column] = df[column].astype('Int64').astype(object).where(df[column].notna(), '')
+
+        return df[[*REPORT_UNIT_KEYS, '发货数', '报告数量', '报告数', '状态', '文件']]
+
+    @staticmethod
+    def summarize(df_result: pd.DataFrame) -> str:
+        counts = df_result['状态'].value_counts()
+        return "，".join(
+            f"{status.value} {counts[status.value]} 份"
+            for status in ReconcileStatus if status.value in counts
+        )
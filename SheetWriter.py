@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+class SheetWriter:
+    """
+    报告工作表的写入接口，每种写入方式（openpyxl、XML）都实现 write_block
+    - 一次写一整块二维数据，左上角是 anchor (行, 列)
+    - 空值（None、NaN、pd.NA）统一清空格子，numpy 数值转成 Python 数值，digits 统一保留小数位
+    """
+    def write_block(self, anchor: tuple[int, int], values, digits: int | None = None):
+        raise NotImplementedError
+
+    def write_cell(self, anchor: tuple[int, int], value, digits: int | None = None):
+        self.write_block(anchor, [[value]], digits)
+
+    @staticmethod
+    def normalize_block(values, digits: int | None = None) -> list[list]:
+        """
+        返回二维列表，空值为 None
+        """
+        block = np.empty((0, 0), dtype=object) if len(values) == 0 else np.asarray(values, dtype=object)
+        if block.ndim != 2:
+            raise ValueError(f"写入报告的数据需要是二维的，现在是 {block.ndim} 维")
+
+        missing = pd.isna(block)
+        rows = []
+        for row_values, row_missing in zip(block.tolist(), missing):
+            row = []
+            for value, is_missing in zip(row_values, row_missing):
+                if is_missing:
+                    value = None
+                elif isinstance(value, np.generic):
+                    value = value.item()
+
+                if digits is not None and isinstance(value, float):
+                    value = round(value, digits)
+                row.append(value)
+            rows.append(row)
+
+        return rows
+
+class OpenpyxlSheetWriter(SheetWriter):
+    """
+    openpyxl 的 Worksheet 按块写入
+    """
+    def __init__(self, ws):
+        self.ws = ws
+
+    def write_block(self, anchor: tuple[int, int], values, digits: int | None = None):
+        start_row, start_column = anchor
+        for r_idx, row in enumerate(self.normalize_block(values, digits), start=start_row):
+            for c_idx, value in enumerate(row, start=start_column):
+                self.ws.cell(row=r_idx, column=c_idx).value = value
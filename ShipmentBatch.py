@@ -1,25 +1,38 @@
 from datetime import datetime
+import io
 import os
 import random
 import sys
+import numpy as np
 import pandas as pd
-from openpyxl import load_workbook
 
 from errors import (
     ReportExistsError,
     CPKNotFoundError,
+    CompositionNotFoundError,
 )
 
 from utilities import (
     find_files_with_substrings,
-    condense_row,
-    get_mechanical_electrical_df_mask,
-    get_metallographic_df_mask,
+    condense_rows,
+    get_mechanical_electrical_mask,
+    get_metallographic_mask,
 )
 
+from ConformanceRules import ConformanceRules
+from FunctionalPropertiesIndex import FunctionalPropertiesIndex
+from TemplateCache import template_cache
+from ReportManifest import ReportManifest
+from ReportPublisher import ReportPublisher
+from XmlReportWriter import XmlPatchWorkbook
+from SheetWriter import SheetWriter, OpenpyxlSheetWriter
+
 from constants import (
     MODEL_CODE_MAPPINGS,
     REPORT_OUTPUT_PATH,
+    REPORT_TEMPLATE_PATH,
+    REPORT_WRITER_ENGINE,
+    REPORT_ANCHORS,
     OQC_RETENTION_SAMPLE_CODES,
     PART_NAME,
     SCHEMA_CODE,
@@ -57,90 +70,156 @@ class ShipmentBatch:
     def get_report_filename(self, total_batch_quantity: int) -> str:
         return f"{self.customer}MANCHESTER {self.model_code} {self.customer_part_code} {total_batch_quantity} ({self.location}) {self.casting_furnace_code} {self.extrusion_batch_code}"
 
-    def calculate_batch_quantity_by_furnace_code(self, df_shipment_batch: pd.DataFrame) -> int:
-        df_filtered = df_shipment_batch[
-            (df_shipment_batch['地区'] == self.location) &
-            (df_shipment_batch['客户'] == self.customer) &
-            (df_shipment_batch['型号'] == self.model_code) &
-            (df_shipment_batch['炉号'] == self.casting_furnace_code)
-        ]
+    def get_report_manifest_key(self) -> str:
+        return ReportManifest.make_key(str(self.model_code), self.casting_furnace_code, self.location, self.customer)
 
-        return df_filtered['发货数'].astype(int).sum()
+    def get_report_unit_key(self) -> tuple:
+        # (地区, 客户, 型号, 炉号)，同 REPORT_UNIT_KEYS
+        return (self.location, self.customer, str(self.model_code), self.casting_furnace_code)
+
+    def get_total_batch_quantity(self, furnace_totals: pd.Series) -> int:
+        """
+        Total shipped quantity of this batch's furnace, looked up from the precomputed furnace totals
+        """
+        return int(furnace_totals.loc[self.get_report_unit_key()])
 
     def generate_report(
         self, 
-        df_shipment_batch: pd.DataFrame,
+        furnace_totals: pd.Series,
         df_chemical_composition: pd.DataFrame,
-        df_chemical_composition_limits: pd.DataFrame,
-        df_functional_properties: pd.DataFrame,
-        mid_plate_report_functional_requirements: pd.DataFrame,
-        u_part_report_functional_requirements: pd.DataFrame,
+        functional_index: FunctionalPropertiesIndex,
+        rules: ConformanceRules,
+        report_manifest: ReportManifest | None,
+        input_fingerprint: str = '',
+        report_publisher: ReportPublisher | None = None,
     ) -> str:
         """
         报告模板生成函数
         填：型号、出货日期、图号、炉号、批量（出货数）、客户料号
         - CPK：查看对应的型号的CPK路径，再找对应挤压批号的CPK，复制数据过去模板
+        report_manifest 为 None 时不查、不更新报告清单
+        有 report_publisher 时先存到本地暂存文件夹，由它在后台发布到输出文件夹、更新报告清单
         """
         # print(f'{self.model_code} {self.casting_furnace_code} {self.ageing_batch_code}')
 
-        total_batch_quantity = self.calculate_batch_quantity_by_furnace_code(df_shipment_batch)
-
-        existing_report_files = find_files_with_substrings(REPORT_OUTPUT_PATH, [self.model_code, self.casting_furnace_code, self.location, self.customer])
-        if existing_report_files:
-            raise FileExistsError(f"报告已存在 {self.model_code} {self.casting_furnace_code}")
+        output_file = self.get_output_file(furnace_totals, report_manifest, report_publisher)
 
-        if df_functional_properties is None:
-            raise ValueError("未上传经过孤独 时效批号 和 熔铸炉号 搜索的性能数据")
+        cpk_values = self.read_cpk_datasheet()
+        wb = self.render_report(furnace_totals, df_chemical_composition, functional_index, rules, cpk_values)
 
-        # Define template and output paths
-        template_file = f"./报告模板/{self.model_code}.xlsx"  # Original template
-        
-        # Load the template workbook
-        wb = load_workbook(template_file)
-        ws = wb.active
-        
-        ws = self.report_basic_information(ws, total_batch_quantity)
-        ws = self.report_cpk(ws)
-        ws = self.report_functional_properties(
-            ws, 
-            df_functional_properties,
-            mid_plate_report_functional_requirements, 
-            u_part_report_functional_requirements
-        )
-        ws = self.report_chemical_composition(ws, df_chemical_composition, df_chemical_composition_limits)
-        ws = self.report_weight(ws)
+        if report_publisher is not None:
+            buffer = io.BytesIO()
+            wb.save(buffer)
+            report_publisher.publish(output_file, buffer.getvalue(), input_fingerprint)
+            return output_file
 
-        output_name = self.get_report_filename(total_batch_quantity)
-        output_file = os.path.join(REPORT_OUTPUT_PATH, f"{output_name}.xlsx")
-        
         # Check if output directory exists, create if not
         os.makedirs(REPORT_OUTPUT_PATH, exist_ok=True)
 
         wb.save(output_file) # Save as new file
+        if report_manifest is not None:
+            report_manifest.record(self.get_report_manifest_key(), output_file, input_fingerprint)
     
         return output_file
+
+    def get_output_file(
+        self,
+        furnace_totals: pd.Series,
+        report_manifest: ReportManifest | None,
+        report_publisher: ReportPublisher | None = None,
+    ) -> str:
+        """
+        Output path of this report, raises ReportExistsError if it was already generated or is still being published
+        """
+        if report_manifest is not None and report_manifest.contains(self.get_report_manifest_key()):
+            raise ReportExistsError(f"报告已存在 {self.model_code} {self.casting_furnace_code}")
+
+        output_name = self.get_report_filename(self.get_total_batch_quantity(furnace_totals))
+        output_file = os.path.join(REPORT_OUTPUT_PATH, f"{output_name}.xlsx")
+        if os.path.exists(output_file):
+            raise ReportExistsError(f"报告已存在 {output_file}")
+        if report_publisher is not None and report_publisher.is_pending(output_file):
+            raise ReportExistsError(f"报告正在发布 {output_file}")
+
+        return output_file
+
+    def render_report(
+        self,
+        furnace_totals: pd.Series,
+        df_chemical_composition: pd.DataFrame,
+        functional_index: FunctionalPropertiesIndex,
+        rules: ConformanceRules,
+        cpk_values: np.ndarray,
+    ):
+        """
+        Fill a copy of the template in memory and return the workbook (anything with .save(file)), nothing is read from or written to disk except the template
+        """
+        if functional_index is None:
+            raise ValueError("未上传经过孤独 时效批号 和 熔铸炉号 搜索的性能数据")
+
+        total_batch_quantity = self.get_total_batch_quantity(furnace_totals)
+
+        # Define template and output paths
+        template_file = os.path.join(REPORT_TEMPLATE_PATH, f"{self.model_code}.xlsx")  # Original template
+        
+        # Get a private copy of the template workbook (parsed once per session)
+        if REPORT_WRITER_ENGINE == 'xml':
+            wb = XmlPatchWorkbook(template_file)
+            sheet = wb.active
+        else:
+            wb = template_cache.load(template_file)
+            sheet = OpenpyxlSheetWriter(wb.active)
+        
+        sheet = self.report_basic_information(sheet, total_batch_quantity)
+        sheet = self.report_cpk(sheet, cpk_values)
+        sheet = self.report_functional_properties(sheet, functional_index, rules)
+        sheet = self.report_chemical_composition(sheet, df_chemical_composition, rules)
+        sheet = self.report_weight(sheet)
+
+        return wb
     
-    def report_basic_information(self, ws, total_batch_quantity: int):
+    def get_anchor(self, name: str) -> tuple[int, int]:
+        """
+        (row, column) of a named report section, fixed ones from REPORT_ANCHORS, per-model ones from MODEL_CODE_MAPPINGS
+        """
+        if name in REPORT_ANCHORS:
+            return REPORT_ANCHORS[name]
+
+        mapping = MODEL_CODE_MAPPINGS[self.model_code]
+        if name == '性能':
+            return (mapping['性能']['start_row'], mapping['性能']['start_column'])
+        if name == '成分':
+            return (mapping['composition']['start_row'], mapping['composition']['start_column'])
+        if name == '重量':
+            return (mapping['重量']['starting_row'], mapping['重量']['starting_column'])
+
+        raise KeyError(f"未知的报告位置 {name}")
+
+    def report_basic_information(self, sheet: SheetWriter, total_batch_quantity: int):
         # Fill in basic report information
-        ws.cell(row=3, column=14, value=self.model_code) # 型号
-        ws.cell(row=4, column=3, value=self.format_date(self.shipment_date)) # 发货日期
-        ws.cell(row=4, column=7, value=SCHEMA_CODE[self.model_code]) # 图号
-        ws.cell(row=4, column=11, value=self.casting_furnace_code) # 炉号
-        ws.cell(row=4, column=14, value=total_batch_quantity) # 发货数
-        ws.cell(row=4, column=19, value=CUSTOMER_PART_CODE[self.model_code]) # 客户料号
-        ws.cell(row=5, column=3, value=PART_NAME[self.model_code]) # 品名
-        ws.cell(row=8, column=1, value=self.calculate_sample_size(total_batch_quantity)) # 抽样数量
+        basic_information = {
+            '型号': self.model_code,
+            '发货日期': self.format_date(self.shipment_date),
+            '图号': SCHEMA_CODE[self.model_code],
+            '炉号': self.casting_furnace_code,
+            '发货数': total_batch_quantity,
+            '客户料号': CUSTOMER_PART_CODE[self.model_code],
+            '品名': PART_NAME[self.model_code],
+            '抽样数量': self.calculate_sample_size(total_batch_quantity),
+        }
+        for name, value in basic_information.items():
+            sheet.write_cell(self.get_anchor(name), value)
         
-        return ws
+        return sheet
     
-    def report_cpk(self, ws):
+    def read_cpk_datasheet(self) -> np.ndarray:
         # Check if CPK file corresponding to model code exists
         cpk_path_str = MODEL_CODE_MAPPINGS[self.model_code]['cpk']['path']
         cpk_file_matches = find_files_with_substrings(cpk_path_str, [self.extrusion_batch_code])
         if not cpk_file_matches:
-            raise FileNotFoundError(f"CPK不存在 {self.model_code} {self.casting_furnace_code}")
+            raise CPKNotFoundError(f"CPK不存在 {self.model_code} {self.casting_furnace_code}")
         
-        cpk_path = os.path.join(cpk_path_str, cpk_file_matches[0])
+        cpk_path = cpk_file_matches[0] # already joined with the CPK directory
 
         num_rows_to_extract = MODEL_CODE_MAPPINGS[self.model_code]['cpk']['num_rows']
 
@@ -158,166 +237,94 @@ class ShipmentBatch:
         # if df.shape[0] > 64 or df.shape[1] > 11:
         #     show_error("Extracted data is too large for the target range")
         #     return
+
+        return df_cpk_datasheet.values
+
+    def report_cpk(self, sheet: SheetWriter, cpk_values: np.ndarray):
+        # Write CPK data (read by read_cpk_datasheet) to report template
+        sheet.write_block(self.get_anchor('CPK'), cpk_values)
         
-        # Write CPK data to report template
-        for r_idx, row_data in enumerate(df_cpk_datasheet.values, start=12):  # Start at row 12
-            for c_idx, value in enumerate(row_data, start=9):  # Start at column I (9)
-                ws.cell(row=r_idx, column=c_idx, value=value)
-        
-        return ws
+        return sheet
     
     def report_functional_properties(
         self,
-        ws,
-        df_functional_properties: pd.DataFrame,
-        mid_plate_report_functional_requirements: pd.DataFrame,
-        u_part_report_functional_requirements: pd.DataFrame
+        sheet: SheetWriter,
+        functional_index: FunctionalPropertiesIndex,
+        rules: ConformanceRules
     ):
-        # Read functional requirements for both mid plate and u part parts, containing test type and test points
-        if self.model_code == 'KAP-7461中板-A76-50':
-            row_headings_dataframe = mid_plate_report_functional_requirements
-        else:
-            row_headings_dataframe = u_part_report_functional_requirements
-
-        # Step 2: Create a row key
-        row_headings_dataframe['row_key'] = row_headings_dataframe.apply(
-            lambda row2: f"{row2['检测项目']}|{row2['项目详细']}|{row2['点位']}" if pd.notna(row2['点位'])
-                        else f"{row2['检测项目']}|{row2['项目详细']}",
-            axis=1
-        )
-
-        # Create separate parts each using different filter conditions
-        df_row_headings_splitted = [
+        # Separate parts of the functional block, each looked up by a different batch code and masked differently
+        sections = [
             {
-                'df_row_heading': row_headings_dataframe[row_headings_dataframe['检测项目'].isin(['维氏硬度', '电导率', '室温拉伸'])],
-                'additional_filter': (df_functional_properties['时效炉号'] == self.ageing_batch_code),
-                'df_mask_function': get_mechanical_electrical_df_mask,
+                'test_groups': [TestGroup.VICKERS_HARDNESS.value, TestGroup.ELECTRICAL_CONDUCTIVITY.value, TestGroup.ROOM_TEMPERATURE_TENSILE_TEST.value],
+                'batch_code': self.ageing_batch_code,
+                'mask_function': get_mechanical_electrical_mask,
             },
             {
-                'df_row_heading': row_headings_dataframe[row_headings_dataframe['检测项目'] == '铝合金金相显微组织'],
-                'additional_filter': (df_functional_properties['铝棒炉号'] == self.casting_furnace_code),
-                'df_mask_function': get_metallographic_df_mask,
+                'test_groups': [TestGroup.METALLOGRAPHIC_STRUCTURE.value],
+                'batch_code': self.casting_furnace_code,
+                'mask_function': get_metallographic_mask,
             }
         ]
 
-        # Step 3: Set up result DataFrame with full set of all sample codes from all groups
-        all_columns = [code for group in OQC_RETENTION_SAMPLE_CODES for code in group]
+        # Full set of all sample codes from all groups, in report column order
+        all_sample_codes = [code for group in OQC_RETENTION_SAMPLE_CODES for code in group]
         all_results = []
 
-        for i in range(len(df_row_headings_splitted)):
-            df_result = pd.DataFrame(index=df_row_headings_splitted[i]['df_row_heading']['row_key'], columns=all_columns)
-
-            # Step 4: Fill in values incrementally, without overwriting existing ones
-            for sample_code_group in OQC_RETENTION_SAMPLE_CODES:
-                for _, row2 in df_row_headings_splitted[i]['df_row_heading'].iterrows():
-                    test_group = row2['检测项目']
-                    test_detail = row2['项目详细']
-                    point = row2['点位']
-                    row_key = row2['row_key']
-
-                    for sample_code in sample_code_group:
-                        # Skip if value already filled
-                        if pd.notna(df_result.at[row_key, sample_code]):
-                            continue
-
-                        # Apply filter
-                        condition = (
-                            (df_functional_properties['检测项目'] == test_group) &
-                            (df_functional_properties['oqc样号'] == sample_code) &
-                            (df_functional_properties['型号'] == self.model_code) &
-                            df_row_headings_splitted[i]['additional_filter']
-                        )
-
-                        alternative_condition = condition.copy()
-
-                        if pd.notna(point):
-                            condition &= (df_functional_properties['点位'] == point)
-                        else:
-                            # Stretch tests don't have test points
-                            condition &= (df_functional_properties['点位'].isna())
-
-                        matched = df_functional_properties[condition]
-
-                        if not matched.empty:
-                            value = matched.iloc[0].get(test_detail)
-                            df_result.at[row_key, sample_code] = value
-                        else:
-                            # BRUTE FORCE APPROACH: Manually add alternative points
-                            if test_group==TestGroup.VICKERS_HARDNESS.value and point=='C2':
-                                alternative_condition &= (df_functional_properties['点位'] == 'S1')
-                                matched = df_functional_properties[alternative_condition]
-                                if not matched.empty:
-                                    value = matched.iloc[0].get(test_detail)
-                                    df_result.at[row_key, sample_code] = value
-                            
-                            if test_group==TestGroup.METALLOGRAPHIC_STRUCTURE.value and point=='S7':
-                                alternative_condition &= (df_functional_properties['点位'] == 'S10')
-                                matched = df_functional_properties[alternative_condition]
-                                if not matched.empty:
-                                    value = matched.iloc[0].get(test_detail)
-                                    df_result.at[row_key, sample_code] = value
-                            
-                            if test_group==TestGroup.METALLOGRAPHIC_STRUCTURE.value and point=='S8':
-                                alternative_condition &= (df_functional_properties['点位'] == 'S13')
-                                matched = df_functional_properties[alternative_condition]
-                                if not matched.empty:
-                                    value = matched.iloc[0].get(test_detail)
-                                    df_result.at[row_key, sample_code] = value
-                            
-                            if test_group==TestGroup.METALLOGRAPHIC_STRUCTURE.value and point=='S9':
-                                alternative_condition &= (df_functional_properties['点位'] == 'S16')
-                                matched = df_functional_properties[alternative_condition]
-                                if not matched.empty:
-                                    value = matched.iloc[0].get(test_detail)
-                                    df_result.at[row_key, sample_code] = value
-
-
-            df_result = df_result.apply(condense_row, axis=1, result_type='expand')
-            df_result = df_result.head(len(df_row_headings_splitted[i]['df_row_heading'])).iloc[:, :4]
-            df_result = df_result.where(df_row_headings_splitted[i]['df_mask_function'](df_result), pd.NA)
-
-            all_results.append(df_result)
+        for section in sections:
+            # (test group, test detail, point, alias point) rows of this model's template, compiled once by the rules
+            point_rows = rules.get_point_rows(self.model_code, section['test_groups'])
+            values = np.full((len(point_rows), len(all_sample_codes)), np.nan, dtype=object)
+
+            for r_idx, (test_group, test_detail, point, alias_point) in enumerate(point_rows):
+                for c_idx, sample_code in enumerate(all_sample_codes):
+                    position = functional_index.lookup(self.model_code, section['batch_code'], test_group, sample_code, point)
+
+                    # Fall back to the alternative point from the point alias table (e.g. C2 -> S1)
+                    if position is None and alias_point is not None:
+                        position = functional_index.lookup(self.model_code, section['batch_code'], test_group, sample_code, alias_point)
+
+                    if position is not None:
+                        values[r_idx, c_idx] = functional_index.value(position, test_detail)
+
+            # Move filled values to the left, keep the first 4 and blank out cells the template doesn't use
+            values = condense_rows(values)[:, :4]
+            values = np.where(section['mask_function'](values), values, np.nan)
+
+            all_results.append(values)
 
         # Concatenate vertically (stack rows)
-        df_extracted_functional_properties = pd.concat(all_results, axis=0)
+        extracted_functional_properties = np.vstack(all_results)
         
         # Write functional properties to report template
-        start_row = MODEL_CODE_MAPPINGS[self.model_code]['性能']['start_row']
-        start_column = MODEL_CODE_MAPPINGS[self.model_code]['性能']['start_column']
-        for r_idx, row_data in enumerate(df_extracted_functional_properties.values, start=start_row):
-            for c_idx, value in enumerate(row_data, start=start_column):
-                ws.cell(row=r_idx, column=c_idx, value=value)
+        sheet.write_block(self.get_anchor('性能'), extracted_functional_properties)
         
-        return ws
+        return sheet
     
     def report_chemical_composition(
         self,
-        ws,
+        sheet: SheetWriter,
         df_chemical_composition: pd.DataFrame,
-        df_chemical_composition_limits: pd.DataFrame
+        rules: ConformanceRules
     ):
         # Write chemical composition data to report template
-        compositions = df_chemical_composition_limits['成分'].tolist()
+        compositions = rules.composition_elements
         df_chemical_composition_filtered = df_chemical_composition[df_chemical_composition['炉号'] == self.casting_furnace_code]
 
         if df_chemical_composition_filtered.empty:
-            raise ValueError(f"找不到对应炉号 {self.casting_furnace_code} 的化学成分数据")
+            raise CompositionNotFoundError(f"找不到对应炉号 {self.casting_furnace_code} 的化学成分数据")
         else:
-            composition_data = df_chemical_composition_filtered.iloc[0].reindex(compositions)
-            for r_idx, value in enumerate(composition_data, start=MODEL_CODE_MAPPINGS[self.model_code]['composition']['start_row']):
-                ws.cell(row=r_idx, column=MODEL_CODE_MAPPINGS[self.model_code]['composition']['start_column'], value=round(float(value), 4))
+            composition_data = df_chemical_composition_filtered.iloc[0].reindex(compositions).astype(float)
+            # One column, one element per row
+            sheet.write_block(self.get_anchor('成分'), composition_data.to_numpy().reshape(-1, 1), digits=4)
         
-        return ws
+        return sheet
     
-    def report_weight(self, ws):
+    def report_weight(self, sheet: SheetWriter):
         weights = self.generate_random_weights(self.model_code)
-        # Weight cell starting values / coordinates
-        weight_starting_row = MODEL_CODE_MAPPINGS[self.model_code]['重量']['starting_row']
-        weight_starting_column = MODEL_CODE_MAPPINGS[self.model_code]['重量']['starting_column']
-        for c_index, weight_val in enumerate(weights, start=weight_starting_column):
-            ws.cell(row=weight_starting_row, column=c_index, value=weight_val)
+        # One row of weights
+        sheet.write_block(self.get_anchor('重量'), [weights])
         
-        return ws
+        return sheet
     
     def generate_random_weights(self, model_code: str) -> list[str]:
         lower_limit = MODEL_CODE_MAPPINGS[model_code]['重量']['lower_limit']
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+class ColumnIndex:
+    """
+    一列的索引：每行的编码（pd.factorize）和不重复的值
+    筛选和搜索只在不重复的值上比较一次，再用编码查表得到每一行的结果
+    """
+    def __init__(self, values: np.ndarray):
+        self.values = values
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        self.codes = codes
+        self.uniques = np.asarray(uniques, dtype=object)
+        # 搜索用：不重复的值的小写文字
+        self.texts = pd.Series([str(value).lower() for value in self.uniques], dtype=object)
+
+    def rows_where(self, hits: np.ndarray) -> np.ndarray:
+        """
+        hits：每个不重复的值是否符合；返回每一行是否符合（空值的编码是 -1，查到最后补的 False）
+        """
+        return np.append(hits, False)[self.codes]
+
+class TableFilter:
+    """
+    发货批次表的筛选、搜索和分组，每列预先建好索引，按键时不用逐行比较
+    - 列的值：{列名: 值}，几列同时筛选时都要符合
+    - 状态：只看 CPK、成分、性能、报告 任意一列是这些颜色的行
+    - 搜索：空格分开的每个词都要在 型号、炉号、挤压批号、时效批号、客户料号 其中一列里出现（不分大小写）
+    - 分组：按 炉号/型号 排在一起，每组后面加一行 发货数 小计
+    列的值没变时索引不重建（按数组对象判断），逐个格子更新状态时只重建变了的列
+    """
+    STATUS_COLUMNS = ['CPK', '成分', '性能', '报告']
+    STATUS_MARKERS = ['🔴', '🟠', '🟢', '⚪️']
+    SEARCH_COLUMNS = ['型号', '炉号', '挤压批号', '时效批号', '客户料号']
+    GROUP_COLUMNS = ['炉号', '型号']
+    SUM_COLUMN = '发货数'
+
+    def __init__(self):
+        self.columns = []
+        self.column_values = {}
+        self.indexes = {} # {列名: ColumnIndex}
+        self.num_rows = 0
+
+    def set_columns(self, columns: list[str], column_values: list[np.ndarray]):
+        """
+        换成这些列（DataFrameTableModel.column_values），数组没换的列沿用原来的索引
+        """
+        self.columns = list(columns)
+        self.num_rows = len(column_values[0]) if column_values else 0
+        self.indexes = {
+            column: index
+            for column, values in zip(self.columns, column_values)
+            if (index := self.indexes.get(column)) is not None and index.values is values
+        }
+        self.column_values = dict(zip(self.columns, column_values))
+
+    def index(self, column: str) -> ColumnIndex | None:
+        if column not in self.column_values:
+            return None
+        if column not in self.indexes:
+            self.indexes[column] = ColumnIndex(self.column_values[column])
+
+        return self.indexes[column]
+
+    def values(self, column: str) -> list[str]:
+        """
+        这一列不重复的值（按出现的顺序），给下拉框用
+        """
+        index = self.index(column)
+        return [] if index is None else [str(value) for value in index.uniques]
+
+    def filter_rows(self, value_filters: dict | None = None, status_markers=(), search: str = '') -> np.ndarray:
+        """
+        返回符合条件的行（位置，从小到大）
+        """
+        mask = np.ones(self.num_rows, dtype=bool)
+
+        for column, value in (value_filters or {}).items():
+            index = self.index(column)
+            if index is not None:
+                mask &= index.rows_where(np.array([str(unique) == value for unique in index.uniques], dtype=bool))
+
+        if status_markers:
+            markers = tuple(status_markers)
+            has_status = np.zeros(self.num_rows, dtype=bool)
+            for column in self.STATUS_COLUMNS:
+                index = self.index(column)
+                if index is not None:
+                    has_status |= index.rows_where(index.texts.str.startswith(markers).to_numpy(dtype=bool))
+            mask &= has_status
+
+        for term in search.lower().split():
+            found = np.zeros(self.num_rows, dtype=bool)
+            for column in self.SEARCH_COLUMNS:
+                index = self.index(column)
+                if index is not None:
+                    found |= index.rows_where(index.texts.str.contains(term, regex=False).to_numpy(dtype=bool))
+            mask &= found
+
+        return np.flatnonzero(mask)
+
+    def group_rows(self, rows: np.ndarray, group_column: str) -> tuple[np.ndarray, dict]:
+        """
+        按 group_column 把 rows 排在一起（组的顺序按第一次出现），每组后面插一行小计
+        返回 (显示的行，小计行是 -1, {小计行的位置: {列名: 文字}})
+        """
+        index = self.index(group_column)
+        if index is None:
+            return rows, {}
+
+        group_codes = index.codes[rows]
+        order = np.argsort(group_codes, kind='stable')
+        rows, group_codes = rows[order], group_codes[order]
+        starts = np.flatnonzero(np.diff(group_codes, prepend=-2))
+        ends = np.append(starts[1:], len(rows))
+
+        amounts = None
+        if self.SUM_COLUMN in self.column_values:
+            amounts = pd.to_numeric(pd.Series(self.column_values[self.SUM_COLUMN][rows]), errors='coerce').fillna(0).to_numpy()
+
+        view_rows = []
+        subtotals = {}
+        for start, end in zip(starts, ends):
+            view_rows.extend(rows[start:end])
+            code = group_codes[start]
+            key = index.uniques[code] if code >= 0 else "（空）"
+            subtotal = {group_column: f"{key} 小计（{end - start} 行）"}
+            if amounts is not None:
+                total = amounts[start:end].sum()
+                subtotal[self.SUM_COLUMN] = str(int(total)) if float(total).is_integer() else str(total)
+            subtotals[len(view_rows)] = subtotal
+            view_rows.append(-1)
+
+        return np.array(view_rows, dtype=int), subtotals
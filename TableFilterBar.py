@@ -0,0 +1,125 @@
+import numpy as np
+from PyQt6.QtWidgets import QWidget, QHBoxLayout, QLabel, QLineEdit, QComboBox, QCheckBox
+
+from DataFrameTableModel import DataFrameTableModel
+from TableFilter import TableFilter
+
+class TableFilterBar(QWidget):
+    """
+    发货批次表上面的筛选栏：按列的值筛选、只看某些状态、搜索编号、按 炉号/型号 分组小计 发货数
+    每次改动（包括搜索框每按一个键）都马上筛选；筛选用 TableFilter 的索引，不逐行比较
+    """
+    ALL = "全部"
+    NO_GROUP = "不分组"
+    VALUE_FILTER_COLUMNS = ['地区', '客户', '型号', '炉号']
+
+    def __init__(self, model: DataFrameTableModel):
+        super().__init__()
+        self.model = model
+        self.table_filter = TableFilter()
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("搜索 " + "/".join(TableFilter.SEARCH_COLUMNS))
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(self.apply)
+        layout.addWidget(self.search_edit)
+
+        self.value_combos = {}
+        for column in self.VALUE_FILTER_COLUMNS:
+            layout.addWidget(QLabel(f"{column}："))
+            combo = QComboBox()
+            combo.addItem(self.ALL)
+            combo.currentIndexChanged.connect(self.apply)
+            layout.addWidget(combo)
+            self.value_combos[column] = combo
+
+        layout.addWidget(QLabel("只看："))
+        self.status_checkboxes = {}
+        for marker in TableFilter.STATUS_MARKERS:
+            checkbox = QCheckBox(marker)
+            checkbox.toggled.connect(self.apply)
+            layout.addWidget(checkbox)
+            self.status_checkboxes[marker] = checkbox
+
+        self.group_combo = QComboBox()
+        self.group_combo.addItems([self.NO_GROUP, *TableFilter.GROUP_COLUMNS])
+        self.group_combo.currentIndexChanged.connect(self.apply)
+        layout.addWidget(self.group_combo)
+
+        self.count_label = QLabel()
+        layout.addWidget(self.count_label)
+        layout.addStretch()
+        self.setLayout(layout)
+
+        self.updating = False # 更新下拉框时不筛选
+        self.hide()
+
+    def set_dataframe_shown(self, shown: bool):
+        """
+        表格换成了发货批次表（shown=True）：重建下拉框的选项，保留原来选的条件，再筛选一次
+        换成别的表：隐藏筛选栏
+        """
+        self.setVisible(shown)
+        if not shown:
+            return
+
+        self.table_filter.set_columns(self.model.df.columns, self.model.column_values)
+        self.updating = True
+        for column, combo in self.value_combos.items():
+            current = combo.currentText()
+            combo.clear()
+            combo.addItem(self.ALL)
+            combo.addItems(self.table_filter.values(column))
+            combo.setCurrentIndex(max(combo.findText(current), 0))
+        self.updating = False
+
+        self.apply()
+
+    def is_active(self) -> bool:
+        return (
+            bool(self.search_edit.text().strip())
+            or any(combo.currentText() != self.ALL for combo in self.value_combos.values())
+            or any(checkbox.isChecked() for checkbox in self.status_checkboxes.values())
+            or self.group_combo.currentText() != self.NO_GROUP
+        )
+
+    def apply(self, *_):
+        """
+        按现在的条件筛选；结果和表格正在显示的一样时不重置表格（滚动位置和选中的格子不变）
+        """
+        if self.updating or self.isHidden():
+            return
+
+        num_rows = len(self.model.df.index)
+        if not self.is_active():
+            rows, subtotals = None, {}
+            self.count_label.setText(f"共 {num_rows} 行")
+        else:
+            self.table_filter.set_columns(self.model.df.columns, self.model.column_values)
+            rows = self.table_filter.filter_rows(
+                {column: combo.currentText() for column, combo in self.value_combos.items() if combo.currentText() != self.ALL},
+                [marker for marker, checkbox in self.status_checkboxes.items() if checkbox.isChecked()],
+                self.search_edit.text()
+            )
+            self.count_label.setText(f"显示 {len(rows)} / {num_rows} 行")
+
+            subtotals = {}
+            if self.group_combo.currentText() != self.NO_GROUP:
+                rows, subtotals = self.table_filter.group_rows(rows, self.group_combo.currentText())
+
+        if self.same_rows(rows, subtotals):
+            return
+        self.model.set_rows(rows, subtotals)
+
+    def same_rows(self, rows: np.ndarray | None, subtotals: dict) -> bool:
+        if rows is None or self.model.rows is None:
+            return rows is None and self.model.rows is None
+
+        current_subtotals = {
+            row: {self.model.headers[column]: text for column, text in texts.items()}
+            for row, texts in self.model.subtotals.items()
+        }
+        return np.array_equal(rows, self.model.rows) and subtotals == current_subtotals
@@ -0,0 +1,38 @@
+import os
+import pickle
+import threading
+
+class TemplateCache:
+    """
+    报告模板缓存：每个模板只解析一次（模板文件修改时间变了才重新解析）
+    解析后的 Workbook 存成 pickle，每份报告 pickle.loads 拿一份独立的副本，比重新 load_workbook 快很多
+    （openpyxl 的 Workbook 用 copy.deepcopy 复制后样式会错乱，保存时报错）
+    """
+    def __init__(self):
+        self.templates = {} # {模板路径: (修改时间, pickle)}
+        self.lock = threading.Lock()
+
+    def load(self, template_file: str):
+        """
+        返回模板的一份独立副本，可以随便改
+        """
+        mtime = os.path.getmtime(template_file)
+
+        with self.lock:
+            cached = self.templates.get(template_file)
+            if cached is None or cached[0] != mtime:
+                # openpyxl 导入要一段时间，第一次解析模板时才导入
+                from openpyxl import load_workbook
+
+                wb = load_workbook(template_file)
+                cached = (mtime, pickle.dumps(wb, protocol=pickle.HIGHEST_PROTOCOL))
+                self.templates[template_file] = cached
+
+        return pickle.loads(cached[1])
+
+    def clear(self):
+        with self.lock:
+            self.templates = {}
+
+# 整个程序共用一个缓存
+template_cache = TemplateCache()
@@ -0,0 +1,285 @@
+import math
+import numbers
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+from xml.sax.saxutils import escape, unescape
+
+from SheetWriter import SheetWriter
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+ROW_PATTERN = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.DOTALL)
+CELL_PATTERN = re.compile(r'<c\b[^>]*?(?:/>|>.*?</c>)', re.DOTALL)
+ROW_NUMBER_PATTERN = re.compile(r'<row\b[^>]*?\br="(\d+)"')
+CELL_REF_PATTERN = re.compile(r'<c\b[^>]*?\br="([A-Z]+)(\d+)"')
+STYLE_PATTERN = re.compile(r'<c\b[^>]*?\bs="(\d+)"')
+SPANS_PATTERN = re.compile(r'\bspans="(\d+):(\d+)"')
+SHARED_MASTER_PATTERN = re.compile(r'<f(?P<ca> ca="1")?[^>]*?\bt="shared"[^>]*?\bref="[^"]*"[^>]*?\bsi="(?P<si>\d+)"[^>]*>(?P<formula>[^<]*)</f>')
+SHARED_DEPENDENT_PATTERN = re.compile(r'<f\b[^>]*?\bt="shared"[^>]*?\bsi="(?P<si>\d+)"[^>]*?(?:/>|></f>)')
+
+class XmlTemplate:
+    """
+    解析过的报告模板（xlsx 就是 zip）：各部分的原始内容、当前工作表的路径、共享字符串
+    只读，多份报告共用；模板文件修改时间变了才重新解析
+    """
+    _cache = {} # {模板路径: (修改时间, XmlTemplate)}
+    _lock = threading.Lock()
+
+    def __init__(self, template_file: str):
+        with zipfile.ZipFile(template_file) as z:
+            self.infos = z.infolist()
+            self.parts = {info.filename: z.read(info.filename) for info in self.infos}
+
+        self.sheet_path = self.find_active_sheet_path()
+        self.sheet_xml = self.parts[self.sheet_path].decode('utf-8')
+
+        self.shared_strings_path = 'xl/sharedStrings.xml'
+        self.shared_strings_xml = self.parts.get(self.shared_strings_path, b'').decode('utf-8')
+        self.shared_string_indexes = self.parse_shared_strings(self.shared_strings_xml)
+        self.num_shared_strings = self.shared_strings_xml.count('<si>') + self.shared_strings_xml.count('<si ')
+
+    @classmethod
+    def load(cls, template_file: str) -> 'XmlTemplate':
+        mtime = os.path.getmtime(template_file)
+
+        with cls._lock:
+            cached = cls._cache.get(template_file)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, cls(template_file))
+                cls._cache[template_file] = cached
+
+        return cached[1]
+
+    def find_active_sheet_path(self) -> str:
+        # workbook.xml 里 activeTab 指向的工作表（同 openpyxl 的 wb.active），再按关系文件找到 sheetN.xml
+        workbook = ET.fromstring(self.parts['xl/workbook.xml'])
+        view = workbook.find(f'{{{MAIN_NS}}}bookViews/{{{MAIN_NS}}}workbookView')
+        active_tab = int(view.get('activeTab', 0)) if view is not None else 0
+        sheet = workbook.findall(f'{{{MAIN_NS}}}sheets/{{{MAIN_NS}}}sheet')[active_tab]
+        rel_id = sheet.get(f'{{{REL_NS}}}id')
+
+        rels = ET.fromstring(self.parts['xl/_rels/workbook.xml.rels'])
+        for rel in rels.iter(f'{{{PACKAGE_REL_NS}}}Relationship'):
+            if rel.get('Id') == rel_id:
+                target = rel.get('Target')
+                return target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+
+        raise ValueError(f"模板里找不到当前工作表 {rel_id}")
+
+    def parse_shared_strings(self, xml: str) -> dict[str, int]:
+        # 只记纯文本的共享字符串，新写入的相同文字直接引用
+        if not xml:
+            return {}
+
+        indexes = {}
+        for i, si in enumerate(ET.fromstring(xml).iter(f'{{{MAIN_NS}}}si')):
+            t = si.find(f'{{{MAIN_NS}}}t')
+            if t is not None and len(si) == 1:
+                indexes.setdefault(t.text or '', i)
+
+        return indexes
+
+class XmlCell:
+    def __init__(self, row: int, column: int, value=None):
+        self.row = row
+        self.column = column
+        self.value = value
+
+class XmlPatchSheet(SheetWriter):
+    """
+    跟 openpyxl 的 Worksheet 一样用 ws.cell(row=, column=, value=) 写值，或者用 write_block 整块写，先记下来，保存时一次改进工作表 XML
+    ws.cell 的 value 为 None 时不改原来的值（同 openpyxl）；write_block 里的空值会清空格子
+    """
+    def __init__(self):
+        self.cells = {} # {(row, column): value}，None 为清空
+
+    def write_block(self, anchor: tuple[int, int], values, digits: int | None = None):
+        start_row, start_column = anchor
+        for r_idx, row in enumerate(self.normalize_block(values, digits), start=start_row):
+            self.cells.update(((r_idx, c_idx), value) for c_idx, value in enumerate(row, start=start_column))
+
+    def cell(self, row: int, column: int, value=None) -> XmlCell:
+        if value is not None:
+            self.cells[(row, column)] = value
+
+        return XmlCell(row, column, self.cells.get((row, column)))
+
+class XmlPatchWorkbook:
+    """
+    直接改 XML 的报告写入方式：把模板当 zip，只改当前工作表和共享字符串里要填的格子，其他部分原样复制
+    比 openpyxl 读整个模板、再整个写出去快很多，也省内存
+    - 数值写 <v>，文字写进共享字符串，'=' 开头的当公式
+    - 保存时设置 fullCalcOnLoad，Excel/WPS 打开时重算公式（文件里公式的缓存值不会更新）
+    - 要改的格子是共享公式的主格时，同组其他格子改成各自的普通公式
+    """
+    def __init__(self, template_file: str):
+        self.template = XmlTemplate.load(template_file)
+        self.active = XmlPatchSheet()
+
+    def save(self, output_file: str):
+        new_strings = []
+        sheet_xml = self.patch_sheet(self.template.sheet_xml, new_strings)
+
+        patched = {self.template.sheet_path: sheet_xml.encode('utf-8')}
+        patched['xl/workbook.xml'] = self.set_full_calc_on_load(self.template.parts['xl/workbook.xml'].decode('utf-8')).encode('utf-8')
+        if new_strings:
+            patched[self.template.shared_strings_path] = self.patch_shared_strings(new_strings).encode('utf-8')
+
+        with zipfile.ZipFile(output_file, 'w') as z:
+            for info in self.template.infos:
+                z.writestr(info, patched.get(info.filename, self.template.parts[info.filename]))
+
+    def patch_sheet(self, sheet_xml: str, new_strings: list[str]) -> str:
+        # openpyxl 导入要一段时间，用到时才导入
+        from openpyxl.formula.translate import Translator
+        from openpyxl.utils import column_index_from_string, get_column_letter
+
+        # 按行分组，只重写涉及到的行
+        cells_by_row = {}
+        for (row, column), value in self.active.cells.items():
+            cells_by_row.setdefault(row, {})[column] = value
+
+        string_indexes = {}
+        def cell_xml(ref: str, style: str | None, value) -> str:
+            style_attr = f' s="{style}"' if style is not None else ''
+
+            if value is None:
+                return f'<c r="{ref}"{style_attr}/>'
+            if isinstance(value, bool):
+                return f'<c r="{ref}"{style_attr} t="b"><v>{int(value)}</v></c>'
+            if isinstance(value, numbers.Number):
+                if math.isnan(value):
+                    return f'<c r="{ref}"{style_attr}/>'
+                number = int(value) if isinstance(value, numbers.Integral) else float(value)
+                return f'<c r="{ref}"{style_attr}><v>{number!r}</v></c>'
+            if isinstance(value, str):
+                if value.startswith('=') and len(value) > 1:
+                    return f'<c r="{ref}"{style_attr}><f>{escape(value[1:])}</f></c>'
+
+                index = self.template.shared_string_indexes.get(value, string_indexes.get(value))
+                if index is None:
+                    index = self.template.num_shared_strings + len(new_strings)
+                    string_indexes[value] = index
+                    new_strings.append(value)
+                return f'<c r="{ref}"{style_attr} t="s"><v>{index}</v></c>'
+
+            raise TypeError(f"不支持写入的类型 {type(value).__name__}: {value}")
+
+        def patch_row(row_xml: str, row: int, values: dict) -> str:
+            cells = {}
+            if not row_xml.endswith('/>'):
+                body = row_xml[row_xml.index('>') + 1:-len('</row>')]
+                for cell in CELL_PATTERN.findall(body):
+                    match = CELL_REF_PATTERN.match(cell)
+                    if match is None:
+                        raise ValueError(f"工作表第 {row} 行有没标位置的格子，请用 openpyxl 生成")
+                    cells[column_index_from_string(match.group(1))] = cell
+
+            for column, value in values.items():
+                old = cells.get(column)
+                shared = SHARED_MASTER_PATTERN.search(old) if old is not None else None
+                if shared:
+                    broken_shared[shared.group('si')] = (f"{get_column_letter(column)}{row}", unescape(shared.group('formula'), {'&quot;': '"', '&apos;': "'"}), shared.group('ca') or '')
+
+                style = None
+                if old is not None:
+                    style_match = STYLE_PATTERN.match(old)
+                    style = style_match.group(1) if style_match else None
+                cells[column] = cell_xml(f"{get_column_letter(column)}{row}", style, value)
+
+            start_tag = row_xml[:-2] + '>' if row_xml.endswith('/>') else row_xml[:row_xml.index('>') + 1]
+            spans = SPANS_PATTERN.search(start_tag)
+            if spans:
+                start_tag = SPANS_PATTERN.sub(f'spans="{min(int(spans.group(1)), min(cells))}:{max(int(spans.group(2)), max(cells))}"', start_tag)
+
+            return start_tag + ''.join(cells[column] for column in sorted(cells)) + '</row>'
+
+        sheet_data_start = sheet_xml.index('<sheetData')
+        sheet_data_end = sheet_xml.find('</sheetData>')
+        head = sheet_xml[:sheet_data_start]
+        if sheet_data_end == -1: # 空表 <sheetData/>
+            rows_xml = ''
+            tail = sheet_xml[sheet_xml.index('>', sheet_data_start) + 1:]
+        else:
+            rows_xml = sheet_xml[sheet_xml.index('>', sheet_data_start) + 1:sheet_data_end]
+            tail = sheet_xml[sheet_data_end + len('</sheetData>'):]
+
+        rows = {}
+        for row_xml in ROW_PATTERN.findall(rows_xml):
+            rows[int(ROW_NUMBER_PATTERN.match(row_xml).group(1))] = row_xml
+        if len(rows) != rows_xml.count('<row'):
+            raise ValueError("工作表有没标行号的行，请用 openpyxl 生成")
+
+        broken_shared = {} # {si: (主格, 公式, ca)}，主格被覆盖的共享公式
+        for row, values in cells_by_row.items():
+            rows[row] = patch_row(rows.get(row, f'<row r="{row}"/>'), row, values)
+
+        # 主格被覆盖后，同组其他格子的共享公式改成各自的普通公式（同 openpyxl 读取时的处理）
+        if broken_shared:
+            def expand_shared(match: re.Match) -> str:
+                cell = match.group(0)
+                dependent = SHARED_DEPENDENT_PATTERN.search(cell)
+                if dependent is None or dependent.group('si') not in broken_shared:
+                    return cell
+
+                origin, formula, ca = broken_shared[dependent.group('si')]
+                ref = CELL_REF_PATTERN.match(cell)
+                translated = Translator(f"={formula}", origin=origin).translate_formula(f"{ref.group(1)}{ref.group(2)}")
+                return cell.replace(dependent.group(0), f'<f{ca}>{escape(translated[1:])}</f>')
+
+            for row, row_xml in rows.items():
+                if 't="shared"' in row_xml:
+                    rows[row] = CELL_PATTERN.sub(expand_shared, row_xml)
+
+        return head + '<sheetData>' + ''.join(rows[row] for row in sorted(rows)) + '</sheetData>' + tail
+
+    def patch_shared_strings(self, new_strings: list[str]) -> str:
+        xml = self.template.shared_strings_xml
+        additions = ''.join(f'<si><t xml:space="preserve">{escape(s)}</t></si>' for s in new_strings)
+        if not xml:
+            raise ValueError("模板没有共享字符串，请用 openpyxl 生成")
+
+        unique_count = self.template.num_shared_strings + len(new_strings)
+        xml = re.sub(r'\buniqueCount="\d+"', f'uniqueCount="{unique_count}"', xml, count=1)
+        xml = re.sub(r'(<sst\b[^>]*?)\bcount="(\d+)"', lambda m: f'{m.group(1)}count="{int(m.group(2)) + len(new_strings)}"', xml, count=1)
+
+        return xml.replace('</sst>', additions + '</sst>')
+
+    def set_full_calc_on_load(self, workbook_xml: str) -> str:
+        calc_pr = re.search(r'<calcPr\b[^>]*?/?>', workbook_xml)
+        if calc_pr is None:
+            return workbook_xml.replace('</workbook>', '<calcPr fullCalcOnLoad="1"/></workbook>')
+        if 'fullCalcOnLoad=' in calc_pr.group(0):
+            return workbook_xml
+
+        tag = calc_pr.group(0)
+        new_tag = tag.replace('<calcPr', '<calcPr fullCalcOnLoad="1"', 1)
+        return workbook_xml.replace(tag, new_tag, 1)
+
+def compare_workbooks(xml_file: str, openpyxl_file: str) -> list[str]:
+    """
+    对比两种方式生成的报告，当前工作表每个格子的值（公式比较公式本身）都要一样
+    返回不一样的格子，空列表表示一致
+    """
+    from openpyxl import load_workbook
+    from openpyxl.utils import get_column_letter
+
+    ws_a = load_workbook(xml_file).active
+    ws_b = load_workbook(openpyxl_file).active
+
+    differences = []
+    max_row = max(ws_a.max_row, ws_b.max_row)
+    max_column = max(ws_a.max_column, ws_b.max_column)
+    for row in range(1, max_row + 1):
+        for column in range(1, max_column + 1):
+            a = ws_a.cell(row=row, column=column).value
+            b = ws_b.cell(row=row, column=column).value
+            if a != b and not (isinstance(a, float) and isinstance(b, float) and math.isclose(a, b)):
+                differences.append(f"{get_column_letter(column)}{row}: {a!r} != {b!r}")
+
+    return differences
@@ -0,0 +1,296 @@
+"""
+命令行运行（不用界面，不导入 Qt），可以定时在晚上跑，也方便重复测速：
+    python cli.py --start 2025-07-17 --end 2025-07-31 --format json --output 状态.json --details 客户出货明细.xlsx
+
+流程同界面：读取发货批次表 → 补充二维码数据 → 读取成分、检测委托单、性能数据 → 检查 CPK、成分、性能 → 生成报告 → 导出客户出货明细
+结果每份报告一行（预检 + 生成结果），JSON 里另外有各步骤用时
+
+退出码：
+    0  全部完成，没有出错的报告
+    1  完成了，但有报告生成或发布出错
+    2  参数错误
+    3  读取数据或规则出错，没有生成报告
+    4  生成报告中途出错（流水线、暂存文件夹等），结果不完整
+    5  报告生成完了，但导出客户出货明细出错
+报告清单读不出来时按报告文件夹重建（同界面），记在结果的 errors 里，不算出错
+"""
+import argparse
+from datetime import date
+import json
+import multiprocessing
+import sys
+import time
+
+import pandas as pd
+
+from DataRequester import DataRequester
+from DataExtractor import DataExtractor
+from DataChecker import DataChecker
+from ConformanceRules import ConformanceRules
+from FunctionalPropertiesIndex import FunctionalPropertiesIndex
+from ReportPlanner import ReportPlanner
+from ReportManifest import ReportManifest
+from ReportGenerator import ReportGenerator
+from ReportPublisher import ReportPublisher
+
+from constants import ReportOutcome
+
+# 同 main.py
+pd.options.mode.copy_on_write = True
+
+EXIT_OK = 0
+EXIT_REPORT_ERRORS = 1
+EXIT_USAGE = 2
+EXIT_DATA_ERROR = 3
+EXIT_GENERATE_ERROR = 4
+EXIT_EXPORT_ERROR = 5
+
+class HeadlessRun:
+    """
+    不用界面跑一次完整流程，每一步记下用时
+    """
+    def __init__(self, shipment_date_start: str, shipment_date_end: str | None = None):
+        self.shipment_date_start = shipment_date_start
+        self.shipment_date_end = shipment_date_end
+
+        self.data_requester = DataRequester()
+        self.data_extractor = DataExtractor()
+        self.errors = []
+        self.data_checker = DataChecker(on_error=lambda message, model_code='': self.errors.append(message))
+
+        self.timings = {} # {步骤: 秒}
+
+    def step(self, name: str, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        self.timings[name] = round(time.perf_counter() - started, 3)
+        print(f"{name}：{self.timings[name]} 秒", file=sys.stderr)
+
+        return result
+
+    def load_data(self):
+        self.rules = self.step('读取判定规则', ConformanceRules.load)
+        self.df_shipment_batch = self.step('读取发货批次表', self.request_shipment_batch_data)
+        if self.df_shipment_batch.empty:
+            raise ValueError(f"{self.shipment_date_start} ~ {self.shipment_date_end or ''} 没有发货批次")
+
+        self.step('补充二维码数据', self.fill_qrcode_data)
+        self.furnace_totals = self.data_extractor.extract_furnace_totals(self.df_shipment_batch)
+
+        self.df_chemical_composition = self.step('读取化学成分', self.request_chemical_composition_data)
+        self.df_test_commission_form = self.step('读取检测委托单', self.request_test_commission_form_data)
+        self.df_mechanical_properties = self.step('读取性能数据', self.request_mechanical_properties_data)
+        self.functional_index = FunctionalPropertiesIndex(self.df_mechanical_properties)
+
+    def request_shipment_batch_data(self) -> pd.DataFrame:
+        response_data = self.data_requester.request_shipment_details(self.shipment_date_start)
+        df = self.data_extractor.extract_shipment_batch_data(response_data)
+
+        if self.shipment_date_end is not None:
+            shipment_dates = pd.to_datetime(df['发货日期'].astype(str).str.replace('/', '-'), errors='coerce')
+            # 日期读不出来的行保留
+            df = df[shipment_dates.isna() | (shipment_dates <= pd.Timestamp(self.shipment_date_end))].reset_index(drop=True)
+
+        return df
+
+    def fill_qrcode_data(self):
+        model_code_list = self.df_shipment_batch['型号'].tolist()
+        extrusion_batch_code_list = self.df_shipment_batch['挤压批号'].tolist()
+
+        response_data = self.data_requester.request_ageing_qrcode(model_code_list, extrusion_batch_code_list)
+        df_ageing_qrcode = self.data_extractor.extract_ageing_qrcode_data(response_data)
+        self.df_shipment_batch = self.data_extractor.fill_data_from_ageing_qrcode(self.df_shipment_batch, df_ageing_qrcode)
+
+        response_data = self.data_requester.request_process_card_qrcode(model_code_list, extrusion_batch_code_list)
+        df_process_card_qrcode = self.data_extractor.extract_process_card_qrcode_data(response_data)
+        self.df_shipment_batch = self.data_extractor.fill_data_from_process_card_qrcode(self.df_shipment_batch, df_process_card_qrcode)
+
+    def request_chemical_composition_data(self) -> pd.DataFrame:
+        response_data = self.data_requester.request_chemical_composition(self.df_shipment_batch['炉号'].tolist())
+        return self.data_extractor.extract_chemical_composition_data(response_data, self.rules)
+
+    def request_test_commission_form_data(self) -> pd.DataFrame:
+        model_code_list = self.df_shipment_batch['型号'].tolist()
+
+        response_data = self.data_requester.request_test_commission_form(
+            model_code_list=model_code_list,
+            ageing_furnace_code_list=self.df_shipment_batch['时效批号'].tolist()
+        )
+        df_ageing = self.data_extractor.extract_test_commission_form_data(response_data)
+
+        response_data = self.data_requester.request_test_commission_form(
+            model_code_list=model_code_list,
+            billet_furnace_code_list=self.df_shipment_batch['炉号'].tolist()
+        )
+        df_smelting = self.data_extractor.extract_test_commission_form_data(response_data)
+
+        return pd.concat([df_ageing, df_smelting])
+
+    def request_mechanical_properties_data(self) -> pd.DataFrame:
+        model_code_list = self.df_shipment_batch['型号'].tolist()
+
+        response_data = self.data_requester.request_mechanical_properties(
+            model_code_list=model_code_list,
+            ageing_furnace_code_list=self.df_shipment_batch['时效批号'].tolist()
+        )
+        df_ageing = self.data_extractor.extract_mechanical_properties_data(response_data)
+
+        response_data = self.data_requester.request_mechanical_properties(
+            model_code_list=model_code_list,
+            smelting_furnace_code_list=self.df_shipment_batch['炉号'].tolist()
+        )
+        df_smelting = self.data_extractor.extract_mechanical_properties_data(response_data)
+
+        return pd.concat([df_ageing, df_smelting])
+
+    def check(self):
+        self.df_shipment_batch, _ = self.step(
+            '检查CPK', self.data_checker.check_cpk_path_incremental,
+            self.df_shipment_batch, self.rules.version
+        )
+        self.df_shipment_batch, _ = self.step(
+            '检查化学成分', self.data_checker.check_chemical_composition_conformance_incremental,
+            self.df_shipment_batch, self.df_chemical_composition, self.rules
+        )
+        self.df_shipment_batch, _ = self.step(
+            '检查性能', self.data_checker.check_functional_conformance_incremental,
+            self.df_shipment_batch, self.df_test_commission_form, self.df_mechanical_properties, self.rules
+        )
+
+    def load_report_manifest(self) -> ReportManifest:
+        """
+        读取 报告清单；清单坏了就按报告文件夹重建，重建不了先用空清单（同界面的 load_report_manifest）
+        """
+        try:
+            return ReportManifest()
+        except Exception as e:
+            report_manifest = ReportManifest(load=False)
+            msg = f"读取报告清单出错，已按报告文件夹重建: {str(e)}"
+            try:
+                report_manifest.rebuild()
+            except Exception as rebuild_error:
+                msg = f"读取报告清单出错: {str(e)}，重建也失败了，当作没有已生成的报告: {str(rebuild_error)}"
+            print(msg, file=sys.stderr)
+            self.errors.append(msg)
+            return report_manifest
+
+    def generate_reports(self, plan_only: bool = False) -> pd.DataFrame:
+        report_manifest = self.load_report_manifest()
+        report_planner = ReportPlanner(report_manifest)
+
+        df_plan = self.step(
+            '预检报告', report_planner.plan,
+            self.df_shipment_batch, self.df_mechanical_properties, self.df_chemical_composition, self.furnace_totals
+        )
+        if plan_only:
+            return df_plan
+
+        report_publisher = ReportPublisher(report_manifest)
+        report_publisher.recover()
+        report_generator = ReportGenerator(report_manifest, report_publisher)
+
+        row_fingerprints = {
+            index: self.data_checker.fingerprints.row_fingerprint(index)
+            for index in df_plan.loc[df_plan['就绪'], '代表行']
+        }
+        df_result = self.step(
+            '生成报告', report_generator.generate,
+            self.df_shipment_batch, df_plan, self.furnace_totals,
+            self.df_chemical_composition, self.functional_index, self.rules, row_fingerprints
+        )
+        if report_generator.pipeline is not None:
+            self.timings['流水线'] = report_generator.pipeline.stats()
+
+        # 命令行要等报告都发布完才退出
+        self.step('发布报告', report_publisher.wait)
+        report_publisher.shutdown()
+        for output_file, error in report_publisher.failed.items():
+            self.errors.append(f"发布报告失败 {output_file}: {error}")
+            df_result.loc[df_result['说明'] == output_file, '报告'] = ReportOutcome.ERROR.value
+
+        return df_result
+
+    def export_customer_shipment_details(self, path: str):
+        df = self.data_extractor.extract_customer_shipment_details(self.df_shipment_batch)
+        if path.endswith('.csv'):
+            df.to_csv(path, index=False, encoding='utf-8-sig')
+        else:
+            df.to_excel(path, index=False)
+
+def write_status(df_result: pd.DataFrame, run: HeadlessRun, output_format: str, output_path: str | None):
+    df_status = df_result.drop(columns=['发货行'], errors='ignore')
+
+    if output_format == 'csv':
+        text = df_status.to_csv(index=False)
+    else:
+        text = json.dumps({
+            'shipment_date_start': run.shipment_date_start,
+            'shipment_date_end': run.shipment_date_end,
+            'timings': run.timings,
+            'errors': run.errors,
+            'reports': json.loads(df_status.to_json(orient='records', force_ascii=False)),
+        }, ensure_ascii=False, indent=2)
+
+    if output_path is None:
+        sys.stdout.write(text + '\n')
+    else:
+        with open(output_path, 'w', encoding='utf-8-sig' if output_format == 'csv' else 'utf-8') as f:
+            f.write(text)
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="254 发货报告 命令行生成（不用界面）")
+    parser.add_argument('--start', default=date.today().replace(day=1).isoformat(), help="发货日期 起（YYYY-MM-DD），默认本月1号")
+    parser.add_argument('--end', default=None, help="发货日期 止（YYYY-MM-DD，包含），默认不限")
+    parser.add_argument('--plan-only', action='store_true', help="只预检，不生成报告")
+    parser.add_argument('--details', default=None, help="客户出货明细导出路径（.xlsx 或 .csv）")
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help="结果格式")
+    parser.add_argument('--output', default=None, help="结果写到这个文件，默认打印")
+
+    args = parser.parse_args(argv)
+    for value in (args.start, args.end):
+        if value is not None:
+            try:
+                date.fromisoformat(value)
+            except ValueError:
+                parser.error(f"日期格式不对：{value}") # 退出码 2
+
+    return args
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+
+    run = HeadlessRun(args.start, args.end)
+    try:
+        run.load_data()
+        run.check()
+    except Exception as e:
+        print(f"读取数据出错: {e}", file=sys.stderr)
+        return EXIT_DATA_ERROR
+
+    try:
+        df_result = run.generate_reports(plan_only=args.plan_only)
+    except Exception as e:
+        print(f"生成报告出错: {e}", file=sys.stderr)
+        return EXIT_GENERATE_ERROR
+
+    export_failed = False
+    if args.details:
+        try:
+            run.step('导出客户出货明细', run.export_customer_shipment_details, args.details)
+        except Exception as e:
+            msg = f"导出客户出货明细出错: {e}"
+            print(msg, file=sys.stderr)
+            run.errors.append(msg)
+            export_failed = True
+
+    write_status(df_result, run, args.format, args.output)
+
+    if '报告' in df_result and (df_result['报告'] == ReportOutcome.ERROR.value).any():
+        return EXIT_REPORT_ERRORS
+    if export_failed:
+        return EXIT_EXPORT_ERROR
+    return EXIT_OK
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
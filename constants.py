@@ -6,12 +6,45 @@ class CheckStatus(Enum):
     NG = '🔴 NG'
     NO_DATA = '🟠 找不到数据'
 
+class ReportOutcome(Enum):
+    GENERATED = '🟢 已生成'
+    EXISTS = '⚪️ 已存在'
+    NO_CPK = '🟠 CPK不存在'
+    NO_COMPOSITION = '🟠 缺成分数据'
+    NOT_READY = '🟠 未就绪'
+    NG = '🔴 不合格'
+    ERROR = '🔴 出错'
+    CANCELLED = '⚪️ 已取消'
+    BUSY = '🟠 正在生成'
+
+class ReconcileStatus(Enum):
+    MATCHED = '🟢 一致'
+    MISMATCHED = '🔴 数量不符'
+    DUPLICATE = '🔴 重复的报告'
+    MISSING = '🟠 缺报告'
+    EXTRA = '🟠 多出的报告'
+    UNPARSED = '⚪️ 文件名认不出'
+
+class NotificationLevel(Enum):
+    ERROR = '🔴 错误'
+    WARNING = '🟠 警告'
+    INFO = '🟢 信息'
+
 class TestGroup(Enum):
     VICKERS_HARDNESS = '维氏硬度'
     ELECTRICAL_CONDUCTIVITY = '电导率'
     ROOM_TEMPERATURE_TENSILE_TEST = '室温拉伸'
     METALLOGRAPHIC_STRUCTURE = '铝合金金相显微组织'
 
+# 各检测项目的送样记录按哪个批次找：(委托单/性能数据的列, 发货批次表的列)
+# 金相按 熔铸炉号，其余按 时效批号
+TEST_GROUP_BATCH_KEYS = {
+    TestGroup.VICKERS_HARDNESS: ('时效炉号', '时效批号'),
+    TestGroup.ELECTRICAL_CONDUCTIVITY: ('时效炉号', '时效批号'),
+    TestGroup.ROOM_TEMPERATURE_TENSILE_TEST: ('时效炉号', '时效批号'),
+    TestGroup.METALLOGRAPHIC_STRUCTURE: ('铝棒炉号', '炉号'),
+}
+
 class SampleDeliveryTestResult(Enum):
     CONFORMANT = 'Y-合格'
     NON_CONFORMANT = 'N-不合格'
@@ -45,6 +78,71 @@ OQC_RETENTION_SAMPLE_CODES = [
 ]
 
 REPORT_OUTPUT_PATH = './报告输出'
+REPORT_TEMPLATE_PATH = './报告模板'
+REPORT_MANIFEST_FILENAME = '报告清单.json'    # 放在报告输出文件夹里，记录已生成的报告
+
+# 报告文件名（ShipmentBatch.get_report_filename）：{客户}MANCHESTER {型号} {客户料号} {发货数} ({地区}) {炉号} {挤压批号}.xlsx
+REPORT_FILENAME_PATTERN = (
+    r"^(?P<customer>.*?)MANCHESTER (?P<model_code>\S+) (?P<customer_part_code>\S+) (?P<quantity>\d+) "
+    r"\((?P<location>[^)]*)\) (?P<casting_furnace_code>\S+) (?P<extrusion_batch_code>\S+?)(?:\.xlsx)?$"
+)
+# 报告文件名的各个版本，从新到旧；改了 get_report_filename 时在前面加一个新版本，旧的报告还能认出来
+REPORT_FILENAME_PATTERNS = {
+    1: REPORT_FILENAME_PATTERN,
+}
+# 对数量（ReportReconciler）时也认手动改过的文件名：多打的空格、大小写、Windows 复制出来的 " (1)"、" - 副本"
+# 报告清单、发布 还是只认程序生成的文件名
+REPORT_FILENAME_TOLERANT_PATTERNS = {
+    1: (
+        r"^(?P<customer>.*?)MANCHESTER\s+(?P<model_code>\S+)\s+(?P<customer_part_code>\S+)\s+(?P<quantity>\d+)\s+"
+        r"\((?P<location>[^)]*)\)\s+(?P<casting_furnace_code>\S+)\s+(?P<extrusion_batch_code>\S+?)"
+        r"(?:\s*\(\d+\)|\s*- 副本)?(?:\.xlsx)?\s*$"
+    ),
+}
+
+# 一份报告对应的发货批次（每车 地区+客户 的 型号+炉号 出一份报告）
+REPORT_UNIT_KEYS = ['地区', '客户', '型号', '炉号']
+
+# 对数量：扫描报告文件夹（含子文件夹时）用几个线程
+REPORT_RECONCILE_WORKERS = 8
+
+# 生成报告的流水线
+REPORT_MAX_WORKERS = None           # 渲染报告的进程数，None 为 CPU 核数
+REPORT_IO_WORKERS = 4               # 读 CPK、保存报告 各用几个线程（共享盘慢时多开几个）
+REPORT_PIPELINE_QUEUE_SIZE = 8      # 阶段之间最多排队几份报告，保存慢时前面的阶段会等
+REPORT_LOCK_TIMEOUT = 30 * 60       # 报告文件锁超过这么多秒还在，当作进程已经死了，接管过来
+
+# 报告先存到本地，再在后台发布到 REPORT_OUTPUT_PATH
+REPORT_STAGING_PATH = './报告暂存'
+REPORT_PUBLISH_WORKERS = 2          # 同时发布几份
+REPORT_PUBLISH_RETRIES = 3          # 共享盘写失败时最多试几次
+REPORT_PUBLISH_LOG_FILENAME = '发布记录.jsonl'  # 放在暂存文件夹里，每发布（或失败）一份记一行
+
+# 报告里固定位置的格子 (行, 列)；性能、成分、重量 每个型号位置不同，在 MODEL_CODE_MAPPINGS 里
+REPORT_ANCHORS = {
+    '型号': (3, 14),
+    '发货日期': (4, 3),
+    '图号': (4, 7),
+    '炉号': (4, 11),
+    '发货数': (4, 14),
+    '客户料号': (4, 19),
+    '品名': (5, 3),
+    '抽样数量': (8, 1),
+    'CPK': (12, 9), # I12
+}
+
+# 报告写入方式：'openpyxl' 读写整个模板；'xml' 只改模板 XML 里要填的格子（XmlReportWriter），快很多
+# 换成 'xml' 前可以用 XmlReportWriter.compare_workbooks 对比两种方式生成的报告
+REPORT_WRITER_ENGINE = 'openpyxl'
+
+# 判定规则数据
+CHEMICAL_COMPOSITION_LIMITS_PATH = './data/成分_元素条件.csv'    # 成分 上下限
+POINT_ALIASES_PATH = './data/点位/点位替代.csv'                   # 点位没数据时，用哪个点位的数据代替
+
+# CPK 文件夹监控（秒）
+CPK_WATCH_POLL_INTERVAL = 30        # 轮询间隔
+CPK_WATCH_MAX_BACKOFF = 300         # 共享盘连不上时，轮询间隔逐次翻倍，最多到这个值
+CPK_WATCH_FULL_SCAN_EVERY = 10      # 文件夹修改时间没变时，每隔几次轮询也重新读一次文件列表（覆盖原地修改的文件）
 
 MODEL_CODE_MAPPINGS = {
     'KAP-7457上U-A76-50': {
@@ -55,6 +153,7 @@ MODEL_CODE_MAPPINGS = {
             'num_rows': 51,                                                             # 从CPK数据表复制多少行数据
         },
         '性能': {
+            'requirements': './data/点位/202507_U件.csv',                            # 报告要填的 检测项目 和 点位
             'start_row': 65,
             'start_column': 9, # I
         },
@@ -79,6 +178,7 @@ MODEL_CODE_MAPPINGS = {
             'num_rows': 56,
         },
         '性能': {
+            'requirements': './data/点位/202507_中板.csv',
             'start_row': 70,
             'start_column': 9,
         },
@@ -101,6 +201,7 @@ MODEL_CODE_MAPPINGS = {
             'num_rows': 64,
         },
         '性能': {
+            'requirements': './data/点位/202507_U件.csv',
             'start_row': 78,
             'start_column': 9,
         },
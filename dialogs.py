@@ -0,0 +1,19 @@
+from PyQt6.QtWidgets import QMessageBox
+
+def show_error(msg: str):
+    # Create and show a warning message box
+    msg_box = QMessageBox()
+    msg_box.setIcon(QMessageBox.Icon.Warning)
+    msg_box.setText(msg)
+    msg_box.setWindowTitle("注意")
+    msg_box.setStandardButtons(QMessageBox.StandardButton.Ok)
+    msg_box.exec()
+
+def show_info(msg: str):
+    # Create and show a informative message box
+    msg_box = QMessageBox()
+    msg_box.setIcon(QMessageBox.Icon.Information)
+    msg_box.setText(msg)
+    msg_box.setWindowTitle("信息")
+    msg_box.setStandardButtons(QMessageBox.StandardButton.Ok)
+    msg_box.exec()
@@ -12,8 +12,28 @@ class ReportExistsError(FileExistsError):
     def __init__(self, message):
         super().__init__(message)
 
+class ReportLockedError(Exception):
+    """Raised if another live process holds the lock of a report that is being generated"""
+    def __init__(self, message):
+        super().__init__(message)
+
 class NonConformantError(Exception):
     """Raised when functional performance does not meet required standards."""
     def __init__(self, message="Non-conformant to required specifications"):
         self.message = message
-        super().__init__(self.message)
\ No newline at end of file
+        super().__init__(self.message)
+
+class RuleSpecError(ValueError):
+    """Raised when a conformance spec file (limits, points, aliases) is missing columns or has invalid values."""
+    def __init__(self, message):
+        super().__init__(message)
+
+class CompositionNotFoundError(ValueError):
+    """Raised if no chemical composition data exists for a casting furnace code"""
+    def __init__(self, message):
+        super().__init__(message)
+
+class OperationCancelledError(Exception):
+    """Raised inside a background operation after the user cancelled it"""
+    def __init__(self, message="操作已取消"):
+        super().__init__(message)
\ No newline at end of file
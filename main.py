@@ -1,26 +1,40 @@
+import multiprocessing
 import os
 import sys
 import pandas as pd
+from PyQt6.QtCore import Qt, pyqtSignal, QThreadPool
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QPushButton, QHBoxLayout, QVBoxLayout,
-    QFileDialog, QTableWidgetItem, QLabel, QMessageBox
+    QFileDialog, QLabel, QMessageBox, QMenu, QCheckBox, QDockWidget
 )
 
 from MultiSelectionTable import MultiSelectionTable
+from DataFrameTableModel import DataFrameTableModel
+from ActionButtonDelegate import ActionButtonDelegate
+from TableFilterBar import TableFilterBar
+from BackgroundTask import BackgroundTask, TaskProgressBar
+from NotificationPanel import NotificationPanel
 
 from ShipmentBatch import ShipmentBatch
 from DataRequester import DataRequester
 from DataExtractor import DataExtractor
 from DataChecker import DataChecker
-
-from utilities import (
+from InputFingerprints import InputFingerprints
+from CPKWatcher import CPKWatcher
+from ConformanceRules import ConformanceRules
+from ReportPlanner import ReportPlanner
+from ReportManifest import ReportManifest
+from ReportGenerator import ReportGenerator
+from ReportPublisher import ReportPublisher
+from ReportReconciler import ReportReconciler
+from FunctionalPropertiesIndex import FunctionalPropertiesIndex
+
+from dialogs import (
     show_info,
     show_error,
 )
 
-from errors import (
-    NonConformantError,
-)
+from constants import MODEL_CODE_MAPPINGS, ReportOutcome, NotificationLevel
 
 # https://pandas.pydata.org/pandas-docs/stable/user_guide/indexing.html#returning-a-view-versus-a-copy
 pd.options.mode.copy_on_write = True
@@ -28,27 +42,50 @@ pd.options.mode.copy_on_write = True
 class KamKiu254(QMainWindow):
     DOCUMENT_NOT_UPLOADED = ""
 
+    # CPK 文件夹监控线程发现有变化时，转回主线程处理
+    cpk_files_changed = pyqtSignal(dict)
+    # 检查时发现的问题 (信息, 型号)，后台线程里发现的也转回主线程记到通知栏
+    checker_error = pyqtSignal(str, str)
+
     def __init__(self):
         super().__init__()
 
         self.data_requester = DataRequester()
         self.data_extractor = DataExtractor()
-        self.data_checker = DataChecker()
+        self.data_checker = DataChecker(on_error=self.checker_error.emit)
+        self.checker_error.connect(
+            lambda message, model_code: self.notification_panel.add(NotificationLevel.ERROR, "检查CPK", message, model_code)
+        )
+        self.report_manifest = self.load_report_manifest()
+        self.report_planner = ReportPlanner(self.report_manifest)
+        self.report_publisher = ReportPublisher(self.report_manifest)
+        self.report_generator = ReportGenerator(self.report_manifest, self.report_publisher)
+        self.report_reconciler = ReportReconciler()
 
         self.df_shipment_batch = None
+        self.furnace_totals = None
         self.df_chemical_composition = None
         self.df_mechanical_properties = None
+        self.functional_index = None
 
-        self.setDesiredElements()
-
-        self.mid_plate_report_functional_requirements = None
-        self.u_part_report_functional_requirements = None
-        self.load_report_functional_requirements()
+        self.rules = None
+        self.load_conformance_rules()
 
         self.df_customer_shipment_details = None
         self.df_test_commission_form = None
 
+        self.cpk_watcher = None
+        self.cpk_files_changed.connect(self.update_changed_cpk_status)
+        self.pending_cpk_changes = {} # 后台操作运行期间 CPK 文件夹的变化 {型号: {文件名, ...}}
+
+        self.current_task = None # 正在运行的后台操作
+
         self.init_ui()
+
+        # 上次没发布完的报告
+        num_recovered = self.report_publisher.recover()
+        if num_recovered:
+            self.statusBar().showMessage(f"重新发布上次没发布完的报告：{num_recovered} 份")
         
 
     def init_ui(self):
@@ -98,25 +135,82 @@ class KamKiu254(QMainWindow):
         self.check_cpk_button = QPushButton("检查CPK")
         self.check_cpk_button.clicked.connect(self.check_cpk_path)
         self.other_functionalities_layout.addWidget(self.check_cpk_button)
+        # 自动监控CPK文件夹
+        self.watch_cpk_button = QPushButton("自动检查CPK")
+        self.watch_cpk_button.setCheckable(True)
+        self.watch_cpk_button.toggled.connect(self.toggle_cpk_watcher)
+        self.other_functionalities_layout.addWidget(self.watch_cpk_button)
         # 检查化学成分
         self.check_chemical_compositions_button = QPushButton("检查化学成分")
         self.check_chemical_compositions_button.clicked.connect(self.check_chemical_composition_conformance)
         self.other_functionalities_layout.addWidget(self.check_chemical_compositions_button)
+        # 检查性能
+        self.check_functional_conformance_button = QPushButton("检查性能")
+        self.check_functional_conformance_button.clicked.connect(self.check_functional_conformance)
+        self.other_functionalities_layout.addWidget(self.check_functional_conformance_button)
 
         # 对下报告数量
         self.check_batch_quantity_button = QPushButton("对数量")
         self.check_batch_quantity_button.clicked.connect(self.check_batch_quantity)
         self.other_functionalities_layout.addWidget(self.check_batch_quantity_button)
+        self.check_batch_quantity_recursive_checkbox = QCheckBox("含子文件夹")
+        self.other_functionalities_layout.addWidget(self.check_batch_quantity_recursive_checkbox)
+
+        self.plan_reports_button = QPushButton("预检报告")
+        self.plan_reports_button.clicked.connect(self.plan_reports)
+        self.other_functionalities_layout.addWidget(self.plan_reports_button)
 
         self.generate_all_reports_button = QPushButton("生成全部报告")
         self.generate_all_reports_button.clicked.connect(self.generate_all_reports)
         self.other_functionalities_layout.addWidget(self.generate_all_reports_button)
 
+        # 报告文件夹被手动改动过时，按文件名重建报告清单
+        self.rebuild_report_manifest_button = QPushButton("重建报告清单")
+        self.rebuild_report_manifest_button.clicked.connect(self.rebuild_report_manifest)
+        self.other_functionalities_layout.addWidget(self.rebuild_report_manifest_button)
+
         self.generate_customer_shipment_details_button = QPushButton("生成客户出货明细")
         self.generate_customer_shipment_details_button.clicked.connect(self.generate_customer_shipment_details)
         self.other_functionalities_layout.addWidget(self.generate_customer_shipment_details_button)
 
+        # 后台操作运行时不能开始别的操作
+        self.operation_buttons = [
+            self.shipment_upload_button,
+            self.mechanical_properties_upload_button,
+            self.composition_upload_button,
+            self.test_commission_form_upload_button,
+            self.check_cpk_button,
+            self.check_chemical_compositions_button,
+            self.check_functional_conformance_button,
+            self.check_batch_quantity_button,
+            self.plan_reports_button,
+            self.generate_all_reports_button,
+            self.rebuild_report_manifest_button,
+            self.generate_customer_shipment_details_button,
+        ]
+        # 状态栏右边显示后台操作的进度，可以取消
+        self.task_progress = TaskProgressBar()
+        self.statusBar().addPermanentWidget(self.task_progress)
+
+        # 通知栏：操作中的警告、错误不弹窗，记在这里，操作完成后有问题才显示出来
+        self.notification_panel = NotificationPanel()
+        self.notification_dock = QDockWidget("通知", self)
+        self.notification_dock.setWidget(self.notification_panel)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.notification_dock)
+        self.notification_dock.hide()
+        self.notification_panel.attention_needed.connect(self.show_notifications)
+
+        self.table_model = DataFrameTableModel()
         self.main_table = MultiSelectionTable()
+        self.main_table.setModel(self.table_model)
+        # 发货批次表最后一列画 生成报告 按钮；选中多行后右键可以一次生成这些行的报告
+        self.report_button_delegate = ActionButtonDelegate("生成报告", self.main_table)
+        self.report_button_delegate.clicked.connect(self.generate_report_at_row)
+        self.main_table.setItemDelegate(self.report_button_delegate)
+        self.main_table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.main_table.customContextMenuRequested.connect(self.show_table_context_menu)
+        # 发货批次表的筛选、搜索和分组
+        self.table_filter_bar = TableFilterBar(self.table_model)
 
         layout = QVBoxLayout()
         layout.addLayout(self.shipment_batch_layout)
@@ -124,6 +218,7 @@ class KamKiu254(QMainWindow):
         layout.addLayout(self.composition_layout)
         layout.addLayout(self.test_commission_form_layout)
         layout.addLayout(self.other_functionalities_layout)
+        layout.addWidget(self.table_filter_bar)
         layout.addWidget(self.main_table)
 
         # Main widget and layout
@@ -131,248 +226,718 @@ class KamKiu254(QMainWindow):
         main_widget.setLayout(layout)
         self.setCentralWidget(main_widget)
 
+    def run_in_background(self, name: str, function, on_finished=None):
+        """
+        在后台线程运行耗时的操作（读数据、检查、生成报告），界面不会卡住，可以随时取消
+        function(task) 在后台线程运行，返回值交给 on_finished 在主线程处理；同时只运行一个操作
+        """
+        if self.current_task is not None:
+            show_info(f"{self.current_task.name} 正在运行，请等它完成或者取消")
+            return
+
+        task = BackgroundTask(name, function, on_finished)
+        task.signals.progress.connect(self.task_progress.update_progress)
+        task.signals.cells_changed.connect(self.update_shipment_cells)
+        task.signals.finished.connect(self.task_finished)
+        task.signals.failed.connect(self.task_failed)
+        task.signals.cancelled.connect(self.task_cancelled)
+
+        self.current_task = task
+        self.set_operation_buttons_enabled(False)
+        self.task_progress.start(task)
+        self.notification_panel.begin(name)
+        QThreadPool.globalInstance().start(task)
+
+    def task_finished(self, result):
+        task = self.current_task
+        try:
+            if task.on_finished is not None:
+                task.on_finished(result)
+        except Exception as e:
+            msg = f"{task.name}出错: {str(e)}"
+            print(msg)
+            self.notification_panel.add(NotificationLevel.ERROR, task.name, msg)
+            self.end_task("出错")
+        else:
+            self.end_task()
+
+    def task_failed(self, error: str):
+        msg = f"{self.current_task.name}出错: {error}"
+        print(msg)
+        self.notification_panel.add(NotificationLevel.ERROR, self.current_task.name, msg)
+        self.end_task("出错")
+
+    def task_cancelled(self):
+        self.statusBar().showMessage(f"{self.current_task.name}：已取消")
+        self.end_task("已取消")
+
+    def end_task(self, result: str = "完成"):
+        self.current_task = None
+        self.task_progress.finish()
+        self.set_operation_buttons_enabled(True)
+        self.notification_panel.finish(result)
+
+        # 后台操作运行期间 CPK 文件夹的变化，现在再检查
+        if self.pending_cpk_changes:
+            changes, self.pending_cpk_changes = self.pending_cpk_changes, {}
+            self.update_changed_cpk_status(changes)
+
+    def show_notifications(self):
+        self.notification_dock.show()
+        self.notification_dock.raise_()
+
+    def set_operation_buttons_enabled(self, enabled: bool):
+        for button in self.operation_buttons:
+            button.setEnabled(enabled)
+
+    def update_data(self, data: dict):
+        """
+        后台操作读到、改好的数据 {属性名: 新值}，在主线程更新到窗口上
+        检查用的输入指纹（'input_fingerprints'）换到 data_checker 上
+        """
+        for name, value in data.items():
+            if name == 'input_fingerprints':
+                self.data_checker.fingerprints = value
+            else:
+                setattr(self, name, value)
+
+    def working_fingerprints(self, data: dict) -> InputFingerprints:
+        """
+        后台检查用的输入指纹副本，记在 data 里，完成后 update_data 再换上；取消或出错时原来的不变
+        """
+        if 'input_fingerprints' not in data:
+            data['input_fingerprints'] = self.data_checker.fingerprints.copy()
+        return data['input_fingerprints']
+
     def display_shipment_batch_data_full(self):
-        self.request_shipment_batch_data()
+        def on_finished(data: dict):
+            self.update_data(data)
+            self.display_shipment_batch()
+
+        self.run_in_background("读取发货批次表", self.fetch_shipment_batch_data, on_finished)
+
+    def fetch_shipment_batch_data(self, task: BackgroundTask) -> dict:
+        """
+        读取 发货批次表 数据，补上时效、流程卡二维码的数据（后台线程）
+        """
+        task.progress("读取发货批次表", 0, 3)
+        response_data = self.data_requester.request_shipment_details()
+        df_shipment_batch = self.data_extractor.extract_shipment_batch_data(response_data)
 
-        model_code_list = self.df_shipment_batch['型号'].tolist()
-        extrusion_batch_code_list = self.df_shipment_batch['挤压批号'].tolist()
+        model_code_list = df_shipment_batch['型号'].tolist()
+        extrusion_batch_code_list = df_shipment_batch['挤压批号'].tolist()
 
+        task.check_cancelled()
+        task.progress("读取时效二维码", 1, 3)
         response_data = self.data_requester.request_ageing_qrcode(model_code_list, extrusion_batch_code_list)
         df_ageing_qrcode = self.data_extractor.extract_ageing_qrcode_data(response_data)
-        self.df_shipment_batch = self.data_extractor.fill_data_from_ageing_qrcode(self.df_shipment_batch, df_ageing_qrcode)
+        df_shipment_batch = self.data_extractor.fill_data_from_ageing_qrcode(df_shipment_batch, df_ageing_qrcode)
 
+        task.check_cancelled()
+        task.progress("读取流程卡二维码", 2, 3)
         response_data = self.data_requester.request_process_card_qrcode(model_code_list, extrusion_batch_code_list)
         df_process_card_qrcode = self.data_extractor.extract_process_card_qrcode_data(response_data)
-        self.df_shipment_batch = self.data_extractor.fill_data_from_process_card_qrcode(self.df_shipment_batch, df_process_card_qrcode)
-
-        self.display_dataframe(self.df_shipment_batch)
-        self.display_report_generation_buttons()
-
-    def request_shipment_batch_data(self):
+        df_shipment_batch = self.data_extractor.fill_data_from_process_card_qrcode(df_shipment_batch, df_process_card_qrcode)
+        task.progress("读取流程卡二维码", 3, 3)
+
+        return {
+            'df_shipment_batch': df_shipment_batch,
+            # 发货批次表换了，之前记录的输入指纹作废
+            'input_fingerprints': InputFingerprints(),
+            # 每份报告的总发货数只算一次
+            'furnace_totals': self.data_extractor.extract_furnace_totals(df_shipment_batch),
+        }
+
+    def display_dataframe(self, df: pd.DataFrame, action_column: str | None = None):
         """
-        读取 发货批次表 数据
+        显示 数据框架（表格直接读 DataFrame，只画看得到的格子）
         """
-        try:
-            response_data = self.data_requester.request_shipment_details()
-            self.df_shipment_batch = self.data_extractor.extract_shipment_batch_data(response_data)
+        self.table_model.set_dataframe(df, action_column)
+        self.main_table.resize_columns_to_samples()
+        # 筛选栏只用在发货批次表上
+        self.table_filter_bar.set_dataframe_shown(df is self.df_shipment_batch)
 
-            # self.display_dataframe(self.df_shipment_batch)
-        except Exception as e:
-            msg = f"读取发货批次表数据出错: {str(e)}"
-            print(msg)
-            show_error(msg)
+    def display_shipment_batch(self):
+        self.display_dataframe(self.df_shipment_batch, "操作")
+        self.main_table.resizeColumnToContents(self.table_model.columnCount() - 1)
 
-    def display_dataframe(self, df: pd.DataFrame):
+    def refresh_shipment_batch(self):
+        """
+        发货批次表改了一些状态：表格正在显示发货批次表时只更新变了的格子，滚动位置和选中的格子不变；否则切换显示发货批次表
         """
-        显示 数据框架
+        if self.table_model.action_column is not None and self.table_model.df.index.equals(self.df_shipment_batch.index):
+            self.table_model.update_dataframe(self.df_shipment_batch)
+            # 状态变了，按筛选条件重新筛选（结果没变时表格不动）
+            self.table_filter_bar.apply()
+        else:
+            self.display_shipment_batch()
+
+    def update_shipment_cells(self, cells: dict):
         """
-        self.main_table.setRowCount(len(df.index))
-        self.main_table.setColumnCount(len(df.columns))
-        self.main_table.setHorizontalHeaderLabels(df.columns.astype(str).tolist())
+        后台操作逐行出来的结果 {列名: {行索引: 值}}，马上显示在表上，不用等操作完成
+        操作完成后 on_finished 还会用完整的结果更新一次
+        """
+        if self.df_shipment_batch is None or self.table_model.df is not self.df_shipment_batch:
+            return
 
-        for row in range(len(df.index)):
-            for col in range(len(df.columns)):
-                item = QTableWidgetItem(str(df.iat[row, col]))
-                self.main_table.setItem(row, col, item)
-        
-        self.main_table.resizeColumnsToContents()
+        for column, values in cells.items():
+            indexes = [index for index in values if index in self.df_shipment_batch.index]
+            if column not in self.df_shipment_batch.columns:
+                self.df_shipment_batch[column] = None
+            self.df_shipment_batch.loc[indexes, column] = [values[index] for index in indexes]
+
+        self.table_model.update_dataframe(self.df_shipment_batch)
     
     def request_test_commission_form_data(self):
         """
         读取 检测委托单 数据
         """
-        try:
-            model_code_list = self.df_shipment_batch['型号'].tolist()
-            ageing_furnace_code_list = self.df_shipment_batch['时效批号'].tolist()
-            smelt_furnace_code_list = self.df_shipment_batch['炉号'].tolist()
+        self.run_in_background(
+            "读取检测委托单",
+            lambda task: {'df_test_commission_form': self.fetch_test_commission_form_data(task, self.df_shipment_batch)},
+            self.update_data
+        )
 
-            response_data = self.data_requester.request_test_commission_form(
-                model_code_list=model_code_list,
-                ageing_furnace_code_list=ageing_furnace_code_list
-            )
-            df_test_commission_form_ageing = self.data_extractor.extract_test_commission_form_data(response_data)
+    def fetch_test_commission_form_data(self, task: BackgroundTask, df_shipment_batch: pd.DataFrame) -> pd.DataFrame:
+        """
+        读取 检测委托单 数据（后台线程）
+        """
+        model_code_list = df_shipment_batch['型号'].tolist()
+        ageing_furnace_code_list = df_shipment_batch['时效批号'].tolist()
+        smelt_furnace_code_list = df_shipment_batch['炉号'].tolist()
+
+        task.check_cancelled()
+        task.progress("读取检测委托单（时效）", 0, 2)
+        response_data = self.data_requester.request_test_commission_form(
+            model_code_list=model_code_list,
+            ageing_furnace_code_list=ageing_furnace_code_list
+        )
+        df_test_commission_form_ageing = self.data_extractor.extract_test_commission_form_data(response_data)
 
-            response_data = self.data_requester.request_test_commission_form(
-                model_code_list=model_code_list,
-                billet_furnace_code_list=smelt_furnace_code_list
-            )
-            df_test_commission_form_smelting = self.data_extractor.extract_test_commission_form_data(response_data)
+        task.check_cancelled()
+        task.progress("读取检测委托单（熔铸）", 1, 2)
+        response_data = self.data_requester.request_test_commission_form(
+            model_code_list=model_code_list,
+            billet_furnace_code_list=smelt_furnace_code_list
+        )
+        df_test_commission_form_smelting = self.data_extractor.extract_test_commission_form_data(response_data)
+        task.progress("读取检测委托单（熔铸）", 2, 2)
 
-            self.df_test_commission_form = pd.concat([df_test_commission_form_ageing, df_test_commission_form_smelting])
-            
-        except Exception as e:
-            msg = f"读取检测委托单数据出错: {str(e)}"
-            print(msg)
-            show_error(msg)
+        return pd.concat([df_test_commission_form_ageing, df_test_commission_form_smelting])
 
     def request_mechanical_properties_data(self):
         """
         读取 机械性能 数据
         """
-        try:
-            model_code_list = self.df_shipment_batch['型号'].tolist()
-            ageing_furnace_code_list = self.df_shipment_batch['时效批号'].tolist()
-            smelting_furnace_code_list = self.df_shipment_batch['炉号'].tolist()
+        self.run_in_background(
+            "读取性能数据",
+            lambda task: self.fetch_mechanical_properties_data(task, self.df_shipment_batch),
+            self.update_data
+        )
 
-            response_data = self.data_requester.request_mechanical_properties(
-                model_code_list=model_code_list, 
-                ageing_furnace_code_list=ageing_furnace_code_list
-            )
-            df_mechanical_properties_ageing = self.data_extractor.extract_mechanical_properties_data(response_data)
+    def fetch_mechanical_properties_data(self, task: BackgroundTask, df_shipment_batch: pd.DataFrame) -> dict:
+        """
+        读取 机械性能 数据（后台线程）
+        """
+        model_code_list = df_shipment_batch['型号'].tolist()
+        ageing_furnace_code_list = df_shipment_batch['时效批号'].tolist()
+        smelting_furnace_code_list = df_shipment_batch['炉号'].tolist()
+
+        task.check_cancelled()
+        task.progress("读取性能数据（时效）", 0, 2)
+        response_data = self.data_requester.request_mechanical_properties(
+            model_code_list=model_code_list, 
+            ageing_furnace_code_list=ageing_furnace_code_list
+        )
+        df_mechanical_properties_ageing = self.data_extractor.extract_mechanical_properties_data(response_data)
 
-            response_data = self.data_requester.request_mechanical_properties(
-                model_code_list=model_code_list, 
-                smelting_furnace_code_list=smelting_furnace_code_list
-            )
-            df_mechanical_properties_smelting = self.data_extractor.extract_mechanical_properties_data(response_data)
+        task.check_cancelled()
+        task.progress("读取性能数据（熔铸）", 1, 2)
+        response_data = self.data_requester.request_mechanical_properties(
+            model_code_list=model_code_list, 
+            smelting_furnace_code_list=smelting_furnace_code_list
+        )
+        df_mechanical_properties_smelting = self.data_extractor.extract_mechanical_properties_data(response_data)
+        task.progress("读取性能数据（熔铸）", 2, 2)
+
+        df_mechanical_properties = pd.concat([df_mechanical_properties_ageing, df_mechanical_properties_smelting])
+        return {
+            'df_mechanical_properties': df_mechanical_properties,
+            # 建一次索引，每份报告填性能时直接查
+            'functional_index': FunctionalPropertiesIndex(df_mechanical_properties),
+        }
+    
+    def generate_report_at_row(self, row: int):
+        # 操作列只在显示发货批次表时有，小计行没有按钮
+        position = self.table_model.source_row(row)
+        if position is not None:
+            self.safe_generate_report(self.table_model.df.index[position])
+
+    def show_table_context_menu(self, pos):
+        if self.df_shipment_batch is None or self.table_model.df is not self.df_shipment_batch:
+            return
 
-            self.df_mechanical_properties = pd.concat([df_mechanical_properties_ageing, df_mechanical_properties_smelting])
+        # 筛选、分组后表格上的行号和发货批次表的不一样，换成发货批次表的位置（不算小计行）
+        rows = self.table_model.source_rows(self.main_table.selected_rows())
+        if not rows:
+            return
 
-        except Exception as e:
-            msg = f"读取性能数据出错: {str(e)}"
-            print(msg)
-            show_error(msg)
-    
-    def display_report_generation_buttons(self):
-        num_table_cols = self.main_table.columnCount()
-        self.main_table.insertColumn(num_table_cols)
-        # Set the column header
-        self.main_table.setHorizontalHeaderItem(num_table_cols, QTableWidgetItem("操作"))
-        
-        for index, row in self.df_shipment_batch.iterrows():
-            # Create a button for the third column
-            button = QPushButton('生成报告')
-            button.clicked.connect(lambda _, i=index, r=row: self.safe_generate_report(i, r))
-            self.main_table.setCellWidget(index, num_table_cols, button)
+        menu = QMenu(self.main_table)
+        action = menu.addAction(f"生成选中的 {len(rows)} 行的报告")
+        action.setEnabled(self.current_task is None)
+        action.triggered.connect(lambda: self.generate_reports(self.df_shipment_batch.index[rows]))
+        menu.exec(self.main_table.viewport().mapToGlobal(pos))
     
     def generate_all_reports(self):
-        try:
-            if self.df_test_commission_form is None:
-                self.request_test_commission_form_data()
+        self.generate_reports()
+
+    def generate_reports(self, row_indexes=None):
+        """
+        生成全部报告；给了 row_indexes 时只生成这些发货批次行所在的报告
+        """
+        def generate(task: BackgroundTask):
+            data = {}
+            df_test_commission_form = self.df_test_commission_form
+            if df_test_commission_form is None:
+                df_test_commission_form = data['df_test_commission_form'] = self.fetch_test_commission_form_data(task, self.df_shipment_batch)
+
+            # 生成前 CPK、性能 都按最新的数据再查一遍（输入没变的行沿用上次的结果）
+            task.check_cancelled()
+            input_fingerprints = self.working_fingerprints(data)
+            df_shipment_batch, _ = self.data_checker.check_cpk_path_incremental(
+                self.df_shipment_batch.copy(),
+                self.rules.version,
+                lambda done, total: task.progress("检查CPK", done, total),
+                task.cancel_token,
+                lambda index, status: task.report_cells('CPK', {index: status}),
+                input_fingerprints
+            )
+
+            task.check_cancelled()
+            task.progress("检查性能", 0, 0)
+            df_shipment_batch, _ = self.data_checker.check_functional_conformance_incremental(
+                df_shipment_batch,
+                df_test_commission_form,
+                self.df_mechanical_properties,
+                self.rules,
+                input_fingerprints
+            )
             
-            for index, row in self.df_shipment_batch.iterrows():
-                sb = ShipmentBatch(row)
-
-                self.df_shipment_batch.at[index, '性能'] = self.data_checker.check_functional_conformance(sb, self.df_test_commission_form)
-
-                sb.generate_report(
-                    self.df_shipment_batch,
-                    self.df_chemical_composition, 
-                    self.df_chemical_composition_limits,
-                    self.df_mechanical_properties,
-                    self.mid_plate_report_functional_requirements,
-                    self.u_part_report_functional_requirements
+            # 先预检，只生成数据齐全的报告，多个进程并行生成
+            task.check_cancelled()
+            task.progress("预检报告", 0, 0)
+            df_plan = self.report_planner.plan(
+                df_shipment_batch,
+                self.df_mechanical_properties,
+                self.df_chemical_composition,
+                self.furnace_totals
+            )
+            if row_indexes is not None:
+                selected = set(row_indexes)
+                df_plan = df_plan[df_plan['发货行'].apply(lambda rows: not selected.isdisjoint(rows))]
+            row_fingerprints = {
+                index: input_fingerprints.row_fingerprint(index)
+                for index in df_plan.loc[df_plan['就绪'], '代表行']
+            }
+            # 每完成一份报告，这份报告的发货批次行马上显示结果
+            df_result = self.report_generator.generate(
+                df_shipment_batch,
+                df_plan,
+                self.furnace_totals,
+                self.df_chemical_composition,
+                self.functional_index,
+                self.rules,
+                row_fingerprints,
+                lambda done, total: task.progress("生成报告", done, total),
+                task.cancel_token,
+                lambda plan_index, outcome, detail: task.report_cells(
+                    '报告', dict.fromkeys(df_plan.at[plan_index, '发货行'], outcome.value)
                 )
+            )
 
-            # show_info("Report generated at :")
-            self.display_dataframe(self.df_shipment_batch)
-            show_info("生成完毕")
-        # except NonConformantError as e:
-        #     self.df_shipment_batch.at[index, '性能'] = e.message
-        #     print(e)
-        except Exception as e:
-            msg = f"生成全部报告出错: {str(e)}"
-            print(msg)
-            show_error(msg)
-        
-    def safe_generate_report(self, index, row):
-        sb = ShipmentBatch(row)
-        output_report_path = None
-
-        try:
-            if self.df_test_commission_form is None:
-                self.request_test_commission_form_data()
+            # 每份报告的结果写回同一份报告的全部发货批次行
+            row_outcomes = df_result[['发货行', '报告']].explode('发货行').set_index('发货行')['报告']
+            if row_indexes is None:
+                df_shipment_batch['报告'] = row_outcomes
+            else:
+                df_shipment_batch.loc[row_outcomes.index, '报告'] = row_outcomes
+            data['df_shipment_batch'] = df_shipment_batch
+
+            return data, df_result
+
+        def on_finished(result):
+            data, df_result = result
+            self.update_data(data)
+            self.mark_publish_failures(df_result)
+
+            self.refresh_shipment_batch()
+            if self.report_generator.pipeline is not None:
+                self.statusBar().showMessage(self.report_generator.pipeline.summarize_stats())
+            self.notify_report_problems(df_result)
+            self.notification_panel.add(
+                NotificationLevel.INFO, "生成报告",
+                f"生成完毕：{self.report_generator.summarize(df_result)}，{self.report_publisher.num_pending()} 份正在后台发布（点击 预检报告 查看原因）"
+            )
 
-            conformance_result = self.data_checker.check_functional_conformance(sb, self.df_test_commission_form)
-            self.df_shipment_batch.at[index, '性能'] = conformance_result
-            
-            self.display_dataframe(self.df_shipment_batch)
-            self.display_report_generation_buttons()
+        self.run_in_background("生成全部报告" if row_indexes is None else "生成选中的报告", generate, on_finished)
+        
+    # 生成报告的结果记到通知栏的级别；已生成、已存在、已取消不记（已取消在小结里）
+    REPORT_OUTCOME_LEVELS = {
+        ReportOutcome.NG.value: NotificationLevel.ERROR,
+        ReportOutcome.ERROR.value: NotificationLevel.ERROR,
+        ReportOutcome.NO_CPK.value: NotificationLevel.WARNING,
+        ReportOutcome.NO_COMPOSITION.value: NotificationLevel.WARNING,
+        ReportOutcome.NOT_READY.value: NotificationLevel.WARNING,
+        ReportOutcome.BUSY.value: NotificationLevel.WARNING,
+    }
+
+    def mark_publish_failures(self, df_result: pd.DataFrame):
+        """
+        已经发布失败的报告（复制到报告文件夹重试了几次都不行）改成 出错，发货批次表上这份报告的行也改
+        """
+        for output_file, error in list(self.report_publisher.failed.items()):
+            failed = df_result['说明'] == output_file
+            if not failed.any():
+                continue
+            df_result.loc[failed, '报告'] = ReportOutcome.ERROR.value
+            df_result.loc[failed, '说明'] = f"发布报告失败 {output_file}: {error}"
+            rows = [index for indexes in df_result.loc[failed, '发货行'] for index in indexes]
+            self.df_shipment_batch.loc[rows, '报告'] = ReportOutcome.ERROR.value
+
+    def notify_report_problems(self, df_result: pd.DataFrame):
+        """
+        没生成出来的报告记到通知栏，按结果和型号分组
+        """
+        df_problems = df_result[df_result['报告'].isin(self.REPORT_OUTCOME_LEVELS)]
+        for _, row in df_problems.iterrows():
+            self.notification_panel.add(
+                self.REPORT_OUTCOME_LEVELS[row['报告']],
+                row['报告'].split(' ', 1)[-1], # 去掉颜色，级别已经有了
+                f"{row['地区']} {row['客户']} {row['炉号']}：{row['说明']}",
+                str(row['型号'])
+            )
 
-            output_report_path = sb.generate_report(
+    def plan_reports(self):
+        """
+        预检报告：不打开任何 Excel，显示每份报告缺什么数据、能不能生成
+        """
+        def plan(task: BackgroundTask) -> pd.DataFrame:
+            task.progress("预检报告", 0, 0)
+            return self.report_planner.plan(
                 self.df_shipment_batch,
+                self.df_mechanical_properties,
                 self.df_chemical_composition,
-                self.df_chemical_composition_limits,
+                self.furnace_totals
+            )
+
+        def on_finished(df_plan: pd.DataFrame):
+            self.display_dataframe(df_plan)
+            self.statusBar().showMessage(f"预检报告：{df_plan['就绪'].sum()} / {len(df_plan)} 份可以生成")
+
+        self.run_in_background("预检报告", plan, on_finished)
+
+    def rebuild_report_manifest(self):
+        self.run_in_background(
+            "重建报告清单",
+            lambda task: self.report_manifest.rebuild(),
+            lambda num_reports: self.statusBar().showMessage(f"重建报告清单：找到 {num_reports} 份报告")
+        )
+
+    def safe_generate_report(self, index):
+        """
+        生成这一行所在的那份报告（地区+客户+型号+炉号），同一份报告的其他行点了也只生成一次
+        """
+        def generate(task: BackgroundTask):
+            data = {}
+            df_test_commission_form = self.df_test_commission_form
+            if df_test_commission_form is None:
+                df_test_commission_form = data['df_test_commission_form'] = self.fetch_test_commission_form_data(task, self.df_shipment_batch)
+
+            df_shipment_batch = self.df_shipment_batch.copy()
+            sb = ShipmentBatch(df_shipment_batch.loc[index])
+            df_shipment_batch.at[index, '性能'] = self.data_checker.check_functional_conformance(sb, df_test_commission_form)
+            data['df_shipment_batch'] = df_shipment_batch
+
+            # 和生成全部报告一样，先按最新的 CPK 文件再查一遍这份报告的行（文件没变的行沿用上次的结果）
+            task.check_cancelled()
+            input_fingerprints = self.working_fingerprints(data)
+            df_unit, _ = self.data_checker.check_cpk_path_incremental(
+                self.report_planner.unit_rows(df_shipment_batch, index).copy(),
+                self.rules.version,
+                lambda done, total: task.progress("检查CPK", done, total),
+                task.cancel_token,
+                lambda row_index, status: task.report_cells('CPK', {row_index: status}),
+                input_fingerprints
+            )
+            df_shipment_batch.loc[df_unit.index, 'CPK'] = df_unit['CPK']
+
+            # 只预检这份报告的行，没就绪时直接给出原因，不渲染；就绪时和生成全部报告走同一条流水线（同样加报告文件锁，用代表行出报告）
+            task.check_cancelled()
+            task.progress("预检报告", 0, 0)
+            df_plan = self.report_planner.plan(
+                df_unit,
                 self.df_mechanical_properties,
-                self.mid_plate_report_functional_requirements,
-                self.u_part_report_functional_requirements
+                self.df_chemical_composition,
+                self.furnace_totals
+            )
+            row_fingerprints = {
+                representative_index: input_fingerprints.row_fingerprint(representative_index)
+                for representative_index in df_plan['代表行']
+            }
+            df_result = self.report_generator.generate(
+                df_shipment_batch,
+                df_plan,
+                self.furnace_totals,
+                self.df_chemical_composition,
+                self.functional_index,
+                self.rules,
+                row_fingerprints,
+                lambda done, total: task.progress("生成报告", done, total),
+                task.cancel_token
             )
-        except NonConformantError as e:
-            msg = f"""{sb.model_code} {sb.casting_furnace_code} {sb.ageing_furnace_code} 有以下不合格数据：
-            {e.message}
-            """
-            print(msg)
-            show_error(msg)
-        except Exception as e:
-            msg = f"生成报告出错: {str(e)}"
-            print(msg)
-            show_error(msg)
-        finally:
-            if output_report_path is not None:
-                show_info(f"报告成功生成：{output_report_path}")
-    
-    def load_report_functional_requirements(self):
-        try:
-            self.mid_plate_report_functional_requirements = pd.read_csv('./data/点位/202507_中板.csv')
-            self.u_part_report_functional_requirements = pd.read_csv('./data/点位/202507_U件.csv')
-        except Exception as e:
-            show_error(f"读取性能要求与点位数据出错: {str(e)}")
 
-    def request_chemical_composition_data(self):
+            row_outcomes = df_result[['发货行', '报告']].explode('发货行').set_index('发货行')['报告']
+            df_shipment_batch.loc[row_outcomes.index, '报告'] = row_outcomes
+
+            return data, df_result
+
+        def on_finished(result):
+            # 不管报告有没有生成，性能的检查结果都更新到表上
+            data, df_result = result
+            self.update_data(data)
+            self.mark_publish_failures(df_result)
+            self.refresh_shipment_batch()
+
+            row = df_result.iloc[0]
+            if row['报告'] == ReportOutcome.GENERATED.value:
+                self.notification_panel.add(NotificationLevel.INFO, "生成报告", f"报告成功生成，正在后台发布到：{row['说明']}")
+            elif row['报告'] in self.REPORT_OUTCOME_LEVELS:
+                self.notify_report_problems(df_result)
+            else:
+                self.notification_panel.add(NotificationLevel.INFO, "生成报告", f"{row['报告']}：{row['说明']}", str(row['型号']))
+
+        self.run_in_background("生成报告", generate, on_finished)
+    
+    def load_report_manifest(self) -> ReportManifest:
         """
-        读取 化学成分 数据
+        读取 报告清单；清单坏了（比如写到一半断电）就按报告文件夹重建，重建不了先用空清单
         """
         try:
-            compositions = self.df_chemical_composition_limits['成分'].tolist()
-            smelt_lot_list = self.df_shipment_batch['炉号'].tolist()
-            response_data = self.data_requester.request_chemical_composition(smelt_lot_list)
-            self.df_chemical_composition = self.data_extractor.extract_chemical_composition_data(response_data, compositions)
-
-            self.display_dataframe(self.df_chemical_composition)
+            return ReportManifest()
         except Exception as e:
-            msg = f"读取化学数据出错: {str(e)}"
+            report_manifest = ReportManifest(load=False)
+            msg = f"读取报告清单出错，已按报告文件夹重建: {str(e)}"
+            try:
+                report_manifest.rebuild()
+            except Exception as rebuild_error:
+                msg = f"读取报告清单出错: {str(e)}\n重建也失败了，先当作没有已生成的报告，可以稍后点 重建报告清单: {str(rebuild_error)}"
             print(msg)
             show_error(msg)
-    
-    def setDesiredElements(self):
+            return report_manifest
+
+    def load_conformance_rules(self):
+        """
+        读取 判定规则（成分元素条件、性能点位、点位替代）
+        """
         try:
-            self.df_chemical_composition_limits = pd.read_csv("./data/成分_元素条件.csv")
-            self.df_chemical_composition_limits = self.df_chemical_composition_limits.astype({ 
-                '上限': float, 
-                '下限': float 
-            })
+            self.rules = ConformanceRules.load()
         except Exception as e:
-            msg = f"读取成分元素条件数据出错: {str(e)}"
+            msg = f"读取判定规则数据出错: {str(e)}"
             print(msg)
             show_error(msg)
 
+    def request_chemical_composition_data(self):
+        """
+        读取 化学成分 数据
+        """
+        def on_finished(data: dict):
+            self.update_data(data)
+            self.display_dataframe(self.df_chemical_composition)
+
+        self.run_in_background(
+            "读取化学成分",
+            lambda task: {'df_chemical_composition': self.fetch_chemical_composition_data(task, self.df_shipment_batch)},
+            on_finished
+        )
+
+    def fetch_chemical_composition_data(self, task: BackgroundTask, df_shipment_batch: pd.DataFrame) -> pd.DataFrame:
+        """
+        读取 化学成分 数据（后台线程）
+        """
+        task.check_cancelled()
+        task.progress("读取化学成分", 0, 1)
+        smelt_lot_list = df_shipment_batch['炉号'].tolist()
+        response_data = self.data_requester.request_chemical_composition(smelt_lot_list)
+        df_chemical_composition = self.data_extractor.extract_chemical_composition_data(response_data, self.rules)
+        task.progress("读取化学成分", 1, 1)
+
+        return df_chemical_composition
+    
     def check_cpk_path(self):
-        self.df_shipment_batch = self.data_checker.check_cpk_path(self.df_shipment_batch)
+        def check(task: BackgroundTask):
+            data = {}
+            data['df_shipment_batch'], num_rechecked = self.data_checker.check_cpk_path_incremental(
+                self.df_shipment_batch.copy(),
+                self.rules.version,
+                lambda done, total: task.progress("检查CPK", done, total),
+                task.cancel_token,
+                lambda index, status: task.report_cells('CPK', {index: status}),
+                self.working_fingerprints(data)
+            )
+            return data, num_rechecked
 
-        self.display_dataframe(self.df_shipment_batch)
-        self.display_report_generation_buttons()
+        self.run_in_background("检查CPK", check, lambda result: self.show_check_result("CPK", *result))
     
+    def toggle_cpk_watcher(self, checked: bool):
+        """
+        开关 CPK 文件夹监控，有新的/修改过的 CPK 文件时只重新检查受影响的行
+        """
+        if not checked:
+            if self.cpk_watcher is not None:
+                self.cpk_watcher.stop()
+            return
+
+        paths = {
+            model_code: mapping['cpk']['path']
+            for model_code, mapping in MODEL_CODE_MAPPINGS.items()
+            if mapping['cpk']['path'] and os.path.isdir(mapping['cpk']['path'])
+        }
+        if not paths:
+            show_error("找不到任何型号的CPK路径，无法监控")
+            self.watch_cpk_button.setChecked(False)
+            return
+
+        # 线程里只发信号，检查和更新表格都在主线程做
+        self.cpk_watcher = CPKWatcher(paths, on_change=self.cpk_files_changed.emit)
+        self.cpk_watcher.start()
+
+    def update_changed_cpk_status(self, changes: dict):
+        """
+        CPK 文件有变化：找出受影响的发货批次，在后台只重新检查这些行并原地更新 CPK 单元格（读共享盘不卡界面）
+        """
+        if self.df_shipment_batch is None:
+            return
+        if self.current_task is not None:
+            # 后台操作可能正在改发货批次表，等它完成后再检查
+            for model_code, filenames in changes.items():
+                self.pending_cpk_changes.setdefault(model_code, set()).update(filenames)
+            return
+
+        model_codes = self.df_shipment_batch['型号'].astype(str)
+        extrusion_batches = self.df_shipment_batch['挤压批号'].astype(str).str.strip()
+
+        affected = pd.Series(False, index=self.df_shipment_batch.index)
+        for model_code, filenames in changes.items():
+            is_model = model_codes == model_code
+            affected |= is_model & extrusion_batches.apply(lambda code: any(code in f for f in filenames))
+
+        indexes = self.df_shipment_batch.index[affected]
+        if len(indexes) == 0:
+            return
+
+        def check(task: BackgroundTask):
+            data = {}
+            df_shipment_batch = self.df_shipment_batch.copy()
+            df_changed, num_rechecked = self.data_checker.check_cpk_path_incremental(
+                df_shipment_batch.loc[indexes].copy(),
+                self.rules.version,
+                lambda done, total: task.progress("检查CPK", done, total),
+                task.cancel_token,
+                lambda index, status: task.report_cells('CPK', {index: status}),
+                self.working_fingerprints(data)
+            )
+            df_shipment_batch.loc[indexes, 'CPK'] = df_changed['CPK']
+            data['df_shipment_batch'] = df_shipment_batch
+            return data, num_rechecked
+
+        def on_finished(result):
+            data, num_rechecked = result
+            # 表格正在显示发货批次表时，只刷新变了的 CPK 格子；在看别的表时不切换
+            shown = self.table_model.df is self.df_shipment_batch
+            self.update_data(data)
+            if shown:
+                self.table_model.update_dataframe(self.df_shipment_batch)
+                self.table_filter_bar.apply()
+            self.show_recheck_count("CPK", num_rechecked)
+
+        self.run_in_background("CPK文件有变化", check, on_finished)
+
+    def closeEvent(self, event):
+        if self.cpk_watcher is not None:
+            self.cpk_watcher.stop()
+        # 取消正在运行的后台操作，等它在检查点停下来
+        if self.current_task is not None:
+            self.current_task.cancel_token.cancel()
+        QThreadPool.globalInstance().waitForDone()
+        self.report_publisher.shutdown()
+        super().closeEvent(event)
+
     def check_chemical_composition_conformance(self):
         """
         检查 化学成分
         """
-        if self.df_shipment_batch is None:
-            self.display_shipment_batch_data_full()
-        if self.df_chemical_composition is None:
-            self.request_chemical_composition_data()
-        
-        self.df_shipment_batch = self.data_checker.check_chemical_composition_conformance(
-            self.df_shipment_batch,
-            self.df_chemical_composition,
-            self.df_chemical_composition_limits
-        )
-        
-        self.display_dataframe(self.df_shipment_batch)
-        self.display_report_generation_buttons()
+        def check(task: BackgroundTask):
+            data = {}
+            if self.df_shipment_batch is None:
+                data.update(self.fetch_shipment_batch_data(task))
+            df_shipment_batch = data.get('df_shipment_batch', self.df_shipment_batch)
+            if self.df_chemical_composition is None:
+                data['df_chemical_composition'] = self.fetch_chemical_composition_data(task, df_shipment_batch)
+            df_chemical_composition = data.get('df_chemical_composition', self.df_chemical_composition)
+
+            task.check_cancelled()
+            task.progress("检查化学成分", 0, 0)
+            data['df_shipment_batch'], num_rechecked = self.data_checker.check_chemical_composition_conformance_incremental(
+                df_shipment_batch.copy(),
+                df_chemical_composition,
+                self.rules,
+                self.working_fingerprints(data)
+            )
+            return data, num_rechecked
+
+        self.run_in_background("检查化学成分", check, lambda result: self.show_check_result("成分", *result))
+
+    def check_functional_conformance(self):
+        """
+        检查 性能（只刷新状态，不生成报告）
+        """
+        def check(task: BackgroundTask):
+            data = {}
+            if self.df_shipment_batch is None:
+                data.update(self.fetch_shipment_batch_data(task))
+            df_shipment_batch = data.get('df_shipment_batch', self.df_shipment_batch)
+            if self.df_test_commission_form is None:
+                data['df_test_commission_form'] = self.fetch_test_commission_form_data(task, df_shipment_batch)
+            df_test_commission_form = data.get('df_test_commission_form', self.df_test_commission_form)
+
+            task.check_cancelled()
+            task.progress("检查性能", 0, 0)
+            data['df_shipment_batch'], num_rechecked = self.data_checker.check_functional_conformance_incremental(
+                df_shipment_batch.copy(),
+                df_test_commission_form,
+                self.df_mechanical_properties,
+                self.rules,
+                self.working_fingerprints(data)
+            )
+            return data, num_rechecked
+
+        self.run_in_background("检查性能", check, lambda result: self.show_check_result("性能", *result))
+
+    def show_check_result(self, check_name: str, data: dict, num_rechecked: int):
+        self.update_data(data)
+        self.show_recheck_count(check_name, num_rechecked)
+        self.refresh_shipment_batch()
+
+    def show_recheck_count(self, check_name: str, num_rechecked: int):
+        """
+        状态栏显示这次检查实际重新计算了多少行（输入没变的行直接沿用上次的结果）
+        """
+        self.statusBar().showMessage(f"检查{check_name}：重新检查 {num_rechecked} / {len(self.df_shipment_batch)} 行")
 
     def check_batch_quantity(self):
         """
-        报选定文件夹各个型号的发货数量
+        对数量：选定的报告文件夹里每份报告的数量，和发货批次表的总发货数逐份比对
+        列出数量不符、重复、缺少、多出和文件名认不出的报告
         """
         folder = QFileDialog.getExistingDirectory(
             self,
@@ -383,27 +948,20 @@ class KamKiu254(QMainWindow):
         if not folder:
             return
 
-        # List files (non-recursive)
-        files = [
-            fname for fname in os.listdir(folder)
-            if os.path.isfile(os.path.join(folder, fname)) and 'MANCHESTER' in fname
-        ]
+        recursive = self.check_batch_quantity_recursive_checkbox.isChecked()
+        furnace_totals = self.furnace_totals
 
-        batch_quantities = {}
-        for s in files:
-            _, model_code, _, quantity, _, _, _ = s.split()
-            if model_code not in batch_quantities:
-                batch_quantities[model_code] = int(quantity)
-            else:
-                batch_quantities[model_code] += int(quantity)
+        def reconcile(task: BackgroundTask) -> pd.DataFrame:
+            task.progress("扫描报告文件夹", 0, 0)
+            df_reports, unparsed = self.report_reconciler.scan(folder, recursive)
+            task.check_cancelled()
+            return self.report_reconciler.reconcile(df_reports, unparsed, furnace_totals)
 
-        message = f"""
-            {folder}
-            {'\n'.join(f"{k}: {v}" for k, v in batch_quantities.items())}
-        """
-        
-        show_info(message)
+        def on_finished(df_result: pd.DataFrame):
+            self.display_dataframe(df_result)
+            self.statusBar().showMessage(f"对数量 {folder}：{self.report_reconciler.summarize(df_result)}")
 
+        self.run_in_background("对数量", reconcile, on_finished)
 
     def generate_customer_shipment_details(self):
         try:
@@ -413,6 +971,7 @@ class KamKiu254(QMainWindow):
             print(e)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # 打包成 exe 后并行生成报告需要
     app = QApplication(sys.argv)
     window = KamKiu254()
     window.showMaximized()
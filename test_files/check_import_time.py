@@ -0,0 +1,63 @@
+"""
+检查启动时的导入用时和导入的库（在项目根目录运行）：
+    python test_files/check_import_time.py
+
+- 命令行运行（cli）不能导入 Qt；cli 和界面（main）启动时都不导入 openpyxl、requests（用到时才导入）
+- 导入用时超过预算就报错，预算按这台电脑调整
+每个检查都开一个新的 Python 进程，量到的是冷启动的导入用时
+"""
+import subprocess
+import sys
+
+# {模块: (导入用时预算（秒）, 启动时不应该导入的库)}
+IMPORT_BUDGETS = {
+    'cli': (0.8, ['PyQt6', 'openpyxl', 'requests']),
+    'main': (1.0, ['openpyxl', 'requests']),
+}
+
+# 取最快的一次，少受电脑忙不忙的影响
+NUM_RUNS = 3
+
+def measure(module: str) -> tuple[float, set[str]]:
+    """
+    返回 (导入用时（秒）, 导入了的顶层库)
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+
+    seconds = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue # 表头
+        imported.add(name.strip().split('.')[0])
+        if name.strip() == module:
+            seconds = int(cumulative) / 1_000_000
+
+    return seconds, imported
+
+def main() -> int:
+    failed = False
+    for module, (budget, forbidden) in IMPORT_BUDGETS.items():
+        runs = [measure(module) for _ in range(NUM_RUNS)]
+        seconds = min(s for s, _ in runs)
+        imported = runs[0][1]
+
+        print(f"{module}: {seconds:.3f} 秒（预算 {budget} 秒）")
+        if seconds > budget:
+            print("  超出预算")
+            failed = True
+        for name in forbidden:
+            if name in imported:
+                print(f"  启动时导入了 {name}")
+                failed = True
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,9 @@
 import os
+import re
+import numpy as np
 import pandas as pd
 
-from PyQt6.QtWidgets import (
-    QMessageBox, QFileDialog
-)
+from constants import REPORT_FILENAME_PATTERNS, REPORT_FILENAME_TOLERANT_PATTERNS
 
 def load_cpk_tolerance_map():
     df_cpk_7457 = pd.read_csv('./data/尺寸公差/尺寸公差_7457.csv')
@@ -30,40 +30,54 @@ def find_files_with_substrings(directory: str, substrings: list[str]) -> list[st
 
     return matches
 
-def condense_row(row):
-    values = [v for v in row if not pd.isna(v)]
-    return values + [None] * (len(row) - len(values))
-
-def get_mechanical_electrical_df_mask(df):
-    # Create new DataFrame with False values
-    df_mask = df.copy().astype(bool)
-    df_mask.loc[:, :] = False
-    df_mask.iloc[:, :2] = True  # Columns 0 and 1 (A and B)
-    df_mask.iloc[-4, :] = True  # Entire row
-
-    return df_mask
-
-def get_metallographic_df_mask(df):
-    df_mask = df.copy().astype(bool)
-    df_mask.loc[:, :] = False
-    df_mask.iloc[:, :2] = True  # Columns 0 and 1 (A and B)
-
-    return df_mask
-
-def show_error(msg: str):
-    # Create and show a warning message box
-    msg_box = QMessageBox()
-    msg_box.setIcon(QMessageBox.Icon.Warning)
-    msg_box.setText(msg)
-    msg_box.setWindowTitle("注意")
-    msg_box.setStandardButtons(QMessageBox.StandardButton.Ok)
-    msg_box.exec()
-
-def show_info(msg: str):
-    # Create and show a informative message box
-    msg_box = QMessageBox()
-    msg_box.setIcon(QMessageBox.Icon.Information)
-    msg_box.setText(msg)
-    msg_box.setWindowTitle("信息")
-    msg_box.setStandardButtons(QMessageBox.StandardButton.Ok)
-    msg_box.exec()
+REPORT_FILENAME_REGEXES = {
+    version: re.compile(pattern)
+    for version, pattern in REPORT_FILENAME_PATTERNS.items()
+}
+REPORT_FILENAME_TOLERANT_REGEXES = {
+    version: re.compile(pattern, re.IGNORECASE)
+    for version, pattern in REPORT_FILENAME_TOLERANT_PATTERNS.items()
+}
+
+def parse_report_filename(filename: str, tolerant: bool = False) -> dict | None:
+    """
+    Return customer, model code, customer part code, quantity, location, furnace code and extrusion batch code
+    from a report filename, plus the version of the filename pattern that matched, or None if it isn't a report filename
+    With tolerant=True also accept hand-edited names (extra spaces, any case, Windows copy suffixes)
+    """
+    regexes = REPORT_FILENAME_TOLERANT_REGEXES if tolerant else REPORT_FILENAME_REGEXES
+    for version, regex in regexes.items():
+        match = regex.match(filename)
+        if match is None:
+            continue
+
+        fields = match.groupdict()
+        fields['quantity'] = int(fields['quantity'])
+        fields['version'] = version
+        return fields
+
+    return None
+
+def condense_rows(values: np.ndarray) -> np.ndarray:
+    """
+    Shift non-empty values of every row to the left, keeping their order; empty cells become NaN
+    """
+    is_empty = pd.isna(values)
+    order = np.argsort(is_empty, axis=1, kind='stable')
+    condensed = np.take_along_axis(values, order, axis=1)
+    condensed[np.take_along_axis(is_empty, order, axis=1)] = np.nan
+
+    return condensed
+
+def get_mechanical_electrical_mask(values: np.ndarray) -> np.ndarray:
+    mask = np.zeros(values.shape, dtype=bool)
+    mask[:, :2] = True  # Columns 0 and 1 (A and B)
+    mask[-4, :] = True  # Entire row
+
+    return mask
+
+def get_metallographic_mask(values: np.ndarray) -> np.ndarray:
+    mask = np.zeros(values.shape, dtype=bool)
+    mask[:, :2] = True  # Columns 0 and 1 (A and B)
+
+    return mask